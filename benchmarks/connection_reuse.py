@@ -0,0 +1,141 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the per-part latency saved by reusing pooled connections.
+
+By default, parts are PUT to a local server, which shows the cost of setting
+up a new session and connection for each part. Pass ``--tls`` to serve over
+HTTPS with a self-signed certificate generated with the ``openssl`` command,
+including the cost of TLS handshakes. Pass ``--url`` with a presigned object
+store URL to include real network latency, e.g.::
+
+    python benchmarks/connection_reuse.py --url "$(presigned-part-url)"
+"""
+
+
+import os
+import ssl
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import time
+import functools
+
+import requests
+import urllib3
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from faculty.datasets.connection import http_session
+from faculty.datasets.transfer import KILOBYTE
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("ETag", '"etag"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_local_server(tls):
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    if tls:
+        _wrap_with_self_signed_certificate(server)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    scheme = "https" if tls else "http"
+    return "{}://127.0.0.1:{}/part".format(scheme, server.server_port)
+
+
+def _wrap_with_self_signed_certificate(server):
+    directory = tempfile.mkdtemp()
+    try:
+        key = os.path.join(directory, "key.pem")
+        cert = os.path.join(directory, "cert.pem")
+        subprocess.check_call(
+            [
+                "openssl",
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-subj",
+                "/CN=127.0.0.1",
+                "-keyout",
+                key,
+                "-out",
+                cert,
+            ],
+            stderr=subprocess.DEVNULL,
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+    finally:
+        shutil.rmtree(directory)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+
+
+def _mean_latency(put, url, data, num_parts):
+    # Warm up, so that the pooled session has an open connection
+    put(url, data=data).raise_for_status()
+    start = time.time()
+    for _ in range(num_parts):
+        put(url, data=data).raise_for_status()
+    return (time.time() - start) / num_parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url")
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--parts", type=int, default=200)
+    parser.add_argument("--part-size", type=int, default=64, help="KB")
+    args = parser.parse_args()
+
+    url = args.url or _start_local_server(args.tls)
+    data = b"x" * (args.part_size * KILOBYTE)
+
+    # The local server's certificate is self-signed
+    verify = args.url is not None or not args.tls
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    unpooled_put = functools.partial(requests.put, verify=verify)
+    pooled_put = functools.partial(http_session().put, verify=verify)
+
+    unpooled = _mean_latency(unpooled_put, url, data, args.parts)
+    pooled = _mean_latency(pooled_put, url, data, args.parts)
+
+    print("{} parts of {} KB".format(args.parts, args.part_size))
+    print("{:>24}{:>10.2f} ms".format("new session per part", unpooled * 1e3))
+    print("{:>24}{:>10.2f} ms".format("pooled connections", pooled * 1e3))
+    print(
+        "{:>24}{:>10.2f} ms".format(
+            "saved per part", (unpooled - pooled) * 1e3
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the throughput of rechunking implementations used for uploads.
+
+With the package installed, run with::
+
+    python benchmarks/rechunk.py [--total-size MB] [--chunk-size MB]
+"""
+
+
+import argparse
+import timeit
+
+from faculty.datasets.transfer import MEGABYTE, KILOBYTE, _rechunk_data
+
+
+def _rechunk_data_bytes_concatenation(content, chunk_size):
+    """The previous implementation, which concatenates bytes objects."""
+    chunk = b""
+    has_yielded = False
+    for original_chunk in content:
+
+        while len(original_chunk) > 0:
+            remaining = chunk_size - len(chunk)
+            chunk += original_chunk[:remaining]
+            original_chunk = original_chunk[remaining:]
+            if len(chunk) >= chunk_size:
+                has_yielded = True
+                yield chunk
+                chunk = b""
+
+    if not has_yielded or len(chunk) > 0:
+        yield chunk
+
+
+IMPLEMENTATIONS = [
+    ("concatenation", _rechunk_data_bytes_concatenation),
+    ("memoryview", _rechunk_data),
+]
+
+INPUT_CHUNK_SIZES = [
+    4 * KILOBYTE,
+    64 * KILOBYTE,
+    1 * MEGABYTE,
+    5 * MEGABYTE,
+    16 * MEGABYTE,
+]
+
+
+def _time(function, content, chunk_size, repeat):
+    def run():
+        for _ in function(content, chunk_size):
+            pass
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--total-size", type=int, default=64)
+    parser.add_argument("--chunk-size", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    total_size = args.total_size * MEGABYTE
+    chunk_size = args.chunk_size * MEGABYTE
+    data = b"x" * total_size
+
+    print(
+        "Rechunking {} MB into {} MB chunks (best of {})".format(
+            args.total_size, args.chunk_size, args.repeat
+        )
+    )
+    header = "{:>12}".format("input chunk")
+    for name, _ in IMPLEMENTATIONS:
+        header += "{:>22}".format(name + " MB/s")
+    print(header)
+
+    for input_chunk_size in INPUT_CHUNK_SIZES:
+        content = [
+            data[i : i + input_chunk_size]
+            for i in range(0, total_size, input_chunk_size)
+        ]
+        row = "{:>9} KB".format(input_chunk_size // KILOBYTE)
+        for _, function in IMPLEMENTATIONS:
+            seconds = _time(function, content, chunk_size, args.repeat)
+            row += "{:>22.0f}".format(args.total_size / seconds)
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
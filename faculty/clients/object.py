@@ -17,7 +17,8 @@ Interact with Faculty datasets.
 """
 
 
-from collections import namedtuple
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from six.moves import urllib
 
@@ -29,6 +30,7 @@ from faculty.clients.base import (
     BaseSchema,
     BaseClient,
     Conflict,
+    MethodNotAllowed,
     NotFound,
 )
 
@@ -67,6 +69,12 @@ class PathAlreadyExists(Exception):
         super(PathAlreadyExists, self).__init__(message)
 
 
+class MoveNotSupported(Exception):
+    def __init__(self):
+        message = "The object store does not support moving objects"
+        super(MoveNotSupported, self).__init__(message)
+
+
 class CloudStorageProvider(Enum):
     S3 = "S3"
     GCS = "GCS"
@@ -82,6 +90,15 @@ PresignUploadResponse = namedtuple(
 CompletedUploadPart = namedtuple(
     "CompletedUploadPart", ["part_number", "etag"]
 )
+DeleteOutcome = namedtuple("DeleteOutcome", ["path", "error"])
+
+
+DEFAULT_DELETE_WORKERS = 8
+
+# Optional endpoints found to be missing from a server, as pairs of the
+# service URL and the endpoint's name. These are shared by all clients in the
+# process, since a new client is often made for each operation.
+_UNSUPPORTED_ENDPOINTS = set()
 
 
 class ObjectClient(BaseClient):
@@ -239,6 +256,62 @@ class ObjectClient(BaseClient):
             else:
                 raise
 
+    def move(self, project_id, source, destination, recursive=False):
+        """Move objects in the store without copying their content.
+
+        Unlike a :meth:`copy` followed by a :meth:`delete`, the objects are
+        renamed by the server in a single request.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+            The project to move objects in.
+        source : str
+            Move object(s) from this source path.
+        destination : str
+            Move to this destination path.
+        recursive : bool, optional
+            If present allows to move whole paths with all its content. By
+            default the action is not recursive.
+
+        Raises
+        ------
+        PathNotFound
+            When the source path does not exist or is not found.
+        SourceIsADirectory
+            When the source path to move is a directory but recursive is
+            ``False``.
+        MoveNotSupported
+            When the server does not support moving objects. Use
+            :meth:`copy` and :meth:`delete` instead.
+        """
+        if not self._supports("move"):
+            raise MoveNotSupported()
+
+        url_encoded_destination = urllib.parse.quote(destination.lstrip("/"))
+
+        endpoint = "/project/{}/move/{}".format(
+            project_id, url_encoded_destination
+        )
+        params = {"sourcePath": source, "recursive": 1 if recursive else 0}
+        try:
+            self._post_raw(endpoint, params=params)
+        except NotFound as err:
+            if err.error_code == "source_path_not_found":
+                raise PathNotFound(source)
+            # Any other 404 means the endpoint does not exist, whether or not
+            # the server gives an error code for unknown routes
+            self._mark_unsupported("move")
+            raise MoveNotSupported()
+        except MethodNotAllowed:
+            self._mark_unsupported("move")
+            raise MoveNotSupported()
+        except BadRequest as err:
+            if err.error_code == "source_is_a_directory":
+                raise SourceIsADirectory(source)
+            else:
+                raise
+
     def delete(self, project_id, path, recursive=False):
         """Delete objects in the store.
 
@@ -281,6 +354,59 @@ class ObjectClient(BaseClient):
             else:
                 raise
 
+    def delete_many(
+        self,
+        project_id,
+        paths,
+        recursive=False,
+        max_workers=DEFAULT_DELETE_WORKERS,
+    ):
+        """Delete many objects in the store.
+
+        The object API deletes one path per request, so requests are made
+        concurrently. Paths are drawn from ``paths`` only as workers become
+        free, so it may be a generator over very many paths. A failure to
+        delete one path does not stop the others.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+            The project to delete objects from.
+        paths : Iterable[str]
+            The paths to delete.
+        recursive : bool, optional
+            If True, allows deleting directories with all their content.
+        max_workers : int, optional
+            The number of delete requests to make concurrently.
+
+        Returns
+        -------
+        List[DeleteOutcome]
+            The outcome for each path, in the same order as ``paths``. The
+            ``error`` of each outcome is the exception raised when deleting
+            the path, such as :class:`PathNotFound`, or None if it was
+            deleted.
+        """
+
+        def delete(path):
+            try:
+                self.delete(project_id, path, recursive=recursive)
+            except Exception as err:
+                return DeleteOutcome(path, err)
+            return DeleteOutcome(path, None)
+
+        max_workers = max(1, max_workers)
+        outcomes = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for path in paths:
+                pending.append(executor.submit(delete, path))
+                if len(pending) >= max_workers:
+                    outcomes.append(pending.popleft().result())
+            while pending:
+                outcomes.append(pending.popleft().result())
+        return outcomes
+
     def presign_download(
         self, project_id, path, response_content_disposition=None
     ):
@@ -340,7 +466,8 @@ class ObjectClient(BaseClient):
         uploaded by:
 
         1. Assign each chunk a part number, starting from 1
-        2. Presign the chunk for upload with :meth:`presign_upload_part`
+        2. Presign the chunk for upload with :meth:`presign_upload_part`, or
+           presign several chunks at once with :meth:`presign_upload_parts`
         3. Upload the chunk by PUTting to the returned URL
         4. Get the 'ETag' header from the response
 
@@ -392,6 +519,56 @@ class ObjectClient(BaseClient):
         )
         return response.url
 
+    def presign_upload_parts(self, project_id, path, upload_id, part_numbers):
+        """Generate presigned URLs for several parts of an S3 multipart upload.
+
+        The URLs are generated in a single request. If the server does not
+        support this, URLs are generated for each part in turn with
+        :meth:`presign_upload_part`.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+            The project being uploaded to.
+        path : str
+            The path being uploaded to.
+        upload_id : str
+            The S3 upload ID returned by :meth:`presign_upload`.
+        part_numbers : Iterable[int]
+            The numbers of the parts to presign. Part numbers start from 1.
+
+        Returns
+        -------
+        List[str]
+            The presigned URLs, in the same order as ``part_numbers``.
+        """
+        part_numbers = list(part_numbers)
+
+        if self._supports("presign_upload_parts"):
+            endpoint = "/project/{}/presign/upload/parts".format(project_id)
+            body = {
+                "path": path,
+                "uploadId": upload_id,
+                "partNumbers": part_numbers,
+            }
+            try:
+                response = self._put(
+                    endpoint, _BatchPresignResponseSchema(), json=body
+                )
+            except (NotFound, MethodNotAllowed) as err:
+                # A 404 with an error code comes from the endpoint itself,
+                # rather than indicating that it does not exist
+                if isinstance(err, NotFound) and err.error_code is not None:
+                    raise
+                self._mark_unsupported("presign_upload_parts")
+            else:
+                return response.urls
+
+        return [
+            self.presign_upload_part(project_id, path, upload_id, part_number)
+            for part_number in part_numbers
+        ]
+
     def complete_multipart_upload(
         self, project_id, path, upload_id, completed_parts
     ):
@@ -418,8 +595,17 @@ class ObjectClient(BaseClient):
         )
         self._put_raw(endpoint, json=body)
 
+    def _supports(self, endpoint_name):
+        key = (self.session.service_url(self._SERVICE_NAME), endpoint_name)
+        return key not in _UNSUPPORTED_ENDPOINTS
+
+    def _mark_unsupported(self, endpoint_name):
+        key = (self.session.service_url(self._SERVICE_NAME), endpoint_name)
+        _UNSUPPORTED_ENDPOINTS.add(key)
+
 
 _SimplePresignResponse = namedtuple("_SimplePresignResponse", ["url"])
+_BatchPresignResponse = namedtuple("_BatchPresignResponse", ["urls"])
 
 
 class _ObjectSchema(BaseSchema):
@@ -452,6 +638,14 @@ class _SimplePresignResponseSchema(BaseSchema):
         return _SimplePresignResponse(**data)
 
 
+class _BatchPresignResponseSchema(BaseSchema):
+    urls = fields.List(fields.String(), required=True)
+
+    @post_load
+    def make_batch_presign_response(self, data, **kwargs):
+        return _BatchPresignResponse(**data)
+
+
 class _PresignUploadResponseSchema(BaseSchema):
     provider = EnumField(CloudStorageProvider, by_value=True, required=True)
     upload_id = fields.String(data_key="uploadId", missing=None)
@@ -17,6 +17,7 @@
 
 import fnmatch
 import os
+import re
 import posixpath
 import contextlib
 import tempfile
@@ -24,9 +25,13 @@ import io
 
 from faculty.session import get_session
 from faculty.context import get_context
-from faculty.clients.object import ObjectClient
-from faculty.datasets import transfer
-from faculty.datasets.util import DatasetsError
+from faculty.clients.object import (
+    DEFAULT_DELETE_WORKERS,
+    MoveNotSupported,
+    ObjectClient,
+)
+from faculty.datasets import bulk, listing, remote, transfer
+from faculty.datasets.util import BulkTransferError, DatasetsError  # noqa
 
 
 # For backwards compatibility
@@ -60,31 +65,75 @@ def ls(prefix="/", project_id=None, show_hidden=False, object_client=None):
     project_id = project_id or get_context().project_id
     object_client = object_client or ObjectClient(get_session())
 
-    list_response = object_client.list(project_id, prefix)
-    paths = [obj.path for obj in list_response.objects]
-
-    while list_response.next_page_token is not None:
-        list_response = object_client.list(
-            project_id, prefix, list_response.next_page_token
-        )
-        paths += [obj.path for obj in list_response.objects]
+    paths = [
+        obj.path
+        for obj in listing.list_objects(object_client, project_id, prefix)
+    ]
 
     if show_hidden:
         return paths
     else:
-        non_hidden_paths = [
-            path
-            for path in paths
-            if not any(element.startswith(".") for element in path.split("/"))
-        ]
+        non_hidden_paths = [path for path in paths if not _is_hidden(path)]
         return non_hidden_paths
 
 
+def iter_ls(
+    prefix="/", project_id=None, show_hidden=False, object_client=None
+):
+    """Iterate over the contents of project datasets as they are listed.
+
+    Unlike :func:`ls`, objects are yielded as each page of the listing
+    arrives, with the next page requested in the background, rather than
+    once the whole listing has been collected. This is useful for prefixes
+    containing very many objects.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        List only files in the datasets matching this prefix. Default behaviour
+        is to list all files.
+    project_id : str, optional
+        The project to list files from. You need to have access to this project
+        for it to work. Defaults to the project set by FACULTY_PROJECT_ID in
+        your environment.
+    show_hidden : bool, optional
+        Include hidden files in the output. Defaults to False.
+    object_client : faculty.clients.object.ObjectClient, optional
+        Advanced - can be used to benefit from caching in chain interactions
+        with datasets.
+
+    Returns
+    -------
+    Iterator[faculty.clients.object.Object]
+        The objects in the project datasets, with their path, size, ETag and
+        last modification time.
+    """
+
+    project_id = project_id or get_context().project_id
+    object_client = object_client or ObjectClient(get_session())
+
+    for obj in listing.iter_objects(object_client, project_id, prefix):
+        if show_hidden or not _is_hidden(obj.path):
+            yield obj
+
+
+def _is_hidden(path):
+    return any(element.startswith(".") for element in path.split("/"))
+
+
 def glob(
-    pattern, prefix="/", project_id=None, show_hidden=False, object_client=None
+    pattern,
+    prefix="/",
+    project_id=None,
+    show_hidden=False,
+    object_client=None,
+    recursive=False,
 ):
     """List contents of project datasets that match a glob pattern.
 
+    Only the longest part of the pattern without wildcards, or ``prefix`` if
+    that is longer, is listed, and the listing is filtered as it streams.
+
     Parameters
     ----------
     pattern : str
@@ -101,19 +150,96 @@ def glob(
     object_client : faculty.clients.object.ObjectClient, optional
         Advanced - can be used to benefit from caching in chain interactions
         with datasets.
+    recursive : bool, optional
+        If True, match the pattern like :func:`glob.glob` with
+        ``recursive=True``: ``*`` and ``?`` do not match '/', and ``**``
+        matches any number of directories. By default, the pattern is matched
+        with :func:`fnmatch.fnmatch`, where ``*`` also matches '/'.
 
     Returns
     -------
     list
         The list of files from the project that match the glob pattern.
     """
-    contents = ls(
-        prefix=prefix,
+    list_prefix = _glob_list_prefix(pattern, prefix)
+    if list_prefix is None:
+        # The pattern cannot match anything under the prefix
+        return []
+
+    matcher = _compile_glob(pattern, recursive)
+    objects = iter_ls(
+        prefix=list_prefix,
         project_id=project_id,
         show_hidden=show_hidden,
         object_client=object_client,
     )
-    return fnmatch.filter(contents, pattern)
+    return [obj.path for obj in objects if matcher.match(obj.path)]
+
+
+_GLOB_SPECIAL_CHARACTERS = re.compile(r"[*?[]")
+
+
+def _glob_list_prefix(pattern, prefix):
+    """Find the prefix to list to find all paths matching a pattern.
+
+    Returns None if no path under ``prefix`` can match the pattern.
+    """
+    literal = _GLOB_SPECIAL_CHARACTERS.split(pattern, 1)[0]
+    if not literal.startswith("/"):
+        # Only absolute patterns can narrow the listing
+        return prefix
+    normalised_prefix = "/" + prefix.lstrip("/")
+    if literal.startswith(normalised_prefix):
+        return literal
+    elif normalised_prefix.startswith(literal):
+        return prefix
+    else:
+        return None
+
+
+def _compile_glob(pattern, recursive):
+    if not recursive:
+        return re.compile(fnmatch.translate(pattern))
+
+    parts = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+        elif pattern[index] == "*":
+            parts.append("[^/]*")
+            index += 1
+        elif pattern[index] == "?":
+            parts.append("[^/]")
+            index += 1
+        elif pattern[index] == "[" and _class_end(pattern, index) > 0:
+            end = _class_end(pattern, index)
+            members = pattern[index + 1 : end].replace("\\", "\\\\")
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            elif members.startswith("^"):
+                members = "\\" + members
+            parts.append("[{}]".format(members))
+            index = end + 1
+        else:
+            parts.append(re.escape(pattern[index]))
+            index += 1
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def _class_end(pattern, start):
+    """Find the end of a character class in a glob pattern, or -1."""
+    index = start + 1
+    if pattern[index : index + 1] == "!":
+        index += 1
+    # A ']' straight after the opening '[' or '[!' is part of the class
+    if pattern[index : index + 1] == "]":
+        index += 1
+    return pattern.find("]", index)
 
 
 def _isdir(project_path, project_id=None, object_client=None):
@@ -166,14 +292,16 @@ def _isfile(project_path, project_id=None, object_client=None):
     -------
     bool
     """
-    if _isdir(project_path, project_id):
-        return False
+    # List the path before checking if it is a directory, so that the check
+    # can be answered from the cached listing
     matches = ls(
         project_path,
         project_id=project_id,
         show_hidden=True,
         object_client=object_client,
     )
+    if _isdir(project_path, project_id, object_client):
+        return False
     rationalised_path = _rationalise_path(project_path)
     return any(match == rationalised_path for match in matches)
 
@@ -208,7 +336,14 @@ def _put_recursive(local_path, project_path, project_id, object_client):
         _put_file(local_path, project_path, project_id, object_client)
 
 
-def put(local_path, project_path, project_id=None, object_client=None):
+def put(
+    local_path,
+    project_path,
+    project_id=None,
+    object_client=None,
+    max_workers=1,
+    progress=None,
+):
     """Copy from the local filesystem to a project's datasets.
 
     Parameters
@@ -224,6 +359,14 @@ def put(local_path, project_path, project_id=None, object_client=None):
     object_client : faculty.clients.object.ObjectClient, optional
         Advanced - can be used to benefit from caching in chain interactions
         with datasets.
+    max_workers : int, optional
+        The number of files to upload concurrently when copying a directory.
+        When greater than 1, or when ``progress`` is given, the directory is
+        copied with :func:`faculty.datasets.bulk.put_tree`, which continues
+        past files that fail to upload and raises a
+        :class:`faculty.datasets.util.BulkTransferError` at the end.
+    progress : Callable[[faculty.datasets.bulk.TransferProgress], None]
+        Called after each file of a directory has been copied.
     """
 
     project_id = project_id or get_context().project_id
@@ -232,11 +375,24 @@ def put(local_path, project_path, project_id=None, object_client=None):
     if hasattr(os, "fspath"):
         local_path = os.fspath(local_path)
 
-    _create_parent_directories(project_path, project_id, object_client)
-    _put_recursive(local_path, project_path, project_id, object_client)
+    with listing.invalidating(object_client, project_id, project_path):
+        _create_parent_directories(project_path, project_id, object_client)
+        if (max_workers > 1 or progress is not None) and os.path.isdir(
+            local_path
+        ):
+            bulk.put_tree(
+                object_client,
+                project_id,
+                local_path,
+                project_path,
+                max_workers=max_workers,
+                progress=progress,
+            )
+        else:
+            _put_recursive(local_path, project_path, project_id, object_client)
 
 
-def _get_file(project_path, local_path, project_id, object_client):
+def _get_file(project_path, local_path, project_id, object_client, cache=None):
 
     if local_path.endswith("/"):
         msg = (
@@ -246,18 +402,22 @@ def _get_file(project_path, local_path, project_id, object_client):
         ).format(repr(project_path), repr(local_path))
         raise DatasetsError(msg)
 
-    transfer.download_file(object_client, project_id, project_path, local_path)
+    if cache is None:
+        transfer.download_file(
+            object_client, project_id, project_path, local_path
+        )
+    else:
+        cache.download_file(
+            object_client, project_id, project_path, local_path
+        )
 
 
-def _get_directory(project_path, local_path, project_id, object_client):
+def _get_directory(
+    project_path, local_path, project_id, object_client, cache=None
+):
 
     # Firstly, make sure that the location to write to locally exists
-    containing_dir = os.path.dirname(local_path)
-    if not containing_dir:
-        containing_dir = "."
-    if not os.path.isdir(containing_dir):
-        msg = "No such directory: {}".format(repr(containing_dir))
-        raise IOError(msg)
+    _check_containing_directory(local_path)
 
     paths_to_get = ls(
         project_path,
@@ -280,10 +440,29 @@ def _get_directory(project_path, local_path, project_id, object_client):
             dirname = os.path.dirname(local_dest)
             if not os.path.exists(dirname):
                 os.makedirs(dirname)
-            _get_file(object_path, local_dest, project_id, object_client)
+            _get_file(
+                object_path, local_dest, project_id, object_client, cache
+            )
 
 
-def get(project_path, local_path, project_id=None, object_client=None):
+def _check_containing_directory(local_path):
+    containing_dir = os.path.dirname(local_path)
+    if not containing_dir:
+        containing_dir = "."
+    if not os.path.isdir(containing_dir):
+        msg = "No such directory: {}".format(repr(containing_dir))
+        raise IOError(msg)
+
+
+def get(
+    project_path,
+    local_path,
+    project_id=None,
+    object_client=None,
+    max_workers=1,
+    progress=None,
+    cache=None,
+):
     """Copy from a project's datasets to the local filesystem.
 
     Parameters
@@ -299,6 +478,18 @@ def get(project_path, local_path, project_id=None, object_client=None):
     object_client : faculty.clients.object.ObjectClient, optional
         Advanced - can be used to benefit from caching in chain interactions
         with datasets.
+    max_workers : int, optional
+        The number of files to download concurrently when copying a
+        directory. When greater than 1, or when ``progress`` is given, the
+        directory is copied with :func:`faculty.datasets.bulk.get_tree`, which
+        continues past files that fail to download and raises a
+        :class:`faculty.datasets.util.BulkTransferError` at the end.
+    progress : Callable[[faculty.datasets.bulk.TransferProgress], None]
+        Called after each file of a directory has been copied.
+    cache : faculty.datasets.cache.DownloadCache, optional
+        If given, files are copied from this cache when their ETags are
+        unchanged since they were cached, and are otherwise downloaded into
+        it.
     """
 
     project_id = project_id or get_context().project_id
@@ -307,15 +498,176 @@ def get(project_path, local_path, project_id=None, object_client=None):
     if hasattr(os, "fspath"):
         local_path = os.fspath(local_path)
 
-    if _isdir(project_path, project_id, object_client):
-        _get_directory(project_path, local_path, project_id, object_client)
+    if not _isdir(project_path, project_id, object_client):
+        _get_file(project_path, local_path, project_id, object_client, cache)
+    elif max_workers > 1 or progress is not None:
+        _check_containing_directory(local_path)
+        bulk.get_tree(
+            object_client,
+            project_id,
+            project_path,
+            local_path,
+            max_workers=max_workers,
+            progress=progress,
+            cache=cache,
+        )
     else:
-        _get_file(project_path, local_path, project_id, object_client)
+        _get_directory(
+            project_path, local_path, project_id, object_client, cache
+        )
+
+
+def download_many(
+    project_paths,
+    project_id=None,
+    object_client=None,
+    max_workers=transfer.DEFAULT_DOWNLOAD_MANY_WORKERS,
+):
+    """Download the contents of many files concurrently.
+
+    >>> contents = dict(datasets.download_many(["/a.json", "/b.json"]))
 
+    Parameters
+    ----------
+    project_paths : Iterable[str]
+        The paths in the project datasets of the files to download.
+    project_id : str, optional
+        The project to get files from. You need to have access to this project
+        for it to work. Defaults to the project set by FACULTY_PROJECT_ID in
+        your environment.
+    object_client : faculty.clients.object.ObjectClient, optional
+        Advanced - can be used to benefit from caching in chain interactions
+        with datasets.
+    max_workers : int, optional
+        The number of files to download concurrently.
 
-def mv(source_path, destination_path, project_id=None, object_client=None):
+    Returns
+    -------
+    Iterator[Tuple[str, bytearray]]
+        The path and content of each file, as each download completes. See
+        :func:`faculty.datasets.transfer.download_many`.
+    """
+
+    project_id = project_id or get_context().project_id
+    object_client = object_client or ObjectClient(get_session())
+
+    return transfer.download_many(
+        object_client, project_id, project_paths, max_workers=max_workers
+    )
+
+
+def sync(
+    source_path,
+    destination_path,
+    direction="put",
+    project_id=None,
+    object_client=None,
+    delete=False,
+    max_workers=bulk.DEFAULT_MAX_WORKERS,
+    progress=None,
+    checksum=False,
+):
+    """Copy only new and changed files between local and datasets directories.
+
+    Files are compared using their size and modification time locally and
+    their size, ETag and last modification time in datasets, with the help of
+    a manifest of files found to be in sync last time, stored in the user's
+    cache directory. See :func:`faculty.datasets.bulk.sync_tree` for details.
+
+    Parameters
+    ----------
+    source_path : str or os.PathLike
+        The directory to copy from: a local path when ``direction`` is
+        ``"put"``, or a path in the project datasets when it is ``"get"``.
+    destination_path : str or os.PathLike
+        The directory to copy to: a path in the project datasets when
+        ``direction`` is ``"put"``, or a local path when it is ``"get"``.
+    direction : str, optional
+        ``"put"`` to copy from the local filesystem to datasets, like
+        :func:`put`, or ``"get"`` to copy from datasets, like :func:`get`.
+    project_id : str, optional
+        The project to sync with. You need to have access to this project
+        for it to work. Defaults to the project set by FACULTY_PROJECT_ID in
+        your environment.
+    object_client : faculty.clients.object.ObjectClient, optional
+        Advanced - can be used to benefit from caching in chain interactions
+        with datasets.
+    delete : bool, optional
+        If True, delete files in the destination that are not in the source.
+    max_workers : int, optional
+        The number of files to copy concurrently.
+    progress : Callable[[faculty.datasets.bulk.TransferProgress], None]
+        Called after each file has been copied.
+    checksum : bool, optional
+        If True, compare local files with the checksums of files in datasets
+        where their sizes match, so that files with the same content are not
+        copied even when their modification times differ.
+
+    Returns
+    -------
+    faculty.datasets.bulk.SyncResult
+        The files copied, deleted and left unchanged.
+    """
+
+    project_id = project_id or get_context().project_id
+    object_client = object_client or ObjectClient(get_session())
+
+    if direction == "put":
+        local_path, project_path = source_path, destination_path
+    elif direction == "get":
+        project_path, local_path = source_path, destination_path
+    else:
+        raise ValueError(
+            "direction must be 'put' or 'get', not {!r}".format(direction)
+        )
+
+    if hasattr(os, "fspath"):
+        local_path = os.fspath(local_path)
+
+    if direction == "get":
+        _check_containing_directory(local_path)
+        return bulk.sync_tree(
+            object_client,
+            project_id,
+            local_path,
+            project_path,
+            direction=direction,
+            delete=delete,
+            max_workers=max_workers,
+            progress=progress,
+            checksum=checksum,
+        )
+
+    with listing.invalidating(object_client, project_id, project_path):
+        _create_parent_directories(project_path, project_id, object_client)
+        return bulk.sync_tree(
+            object_client,
+            project_id,
+            local_path,
+            project_path,
+            direction=direction,
+            delete=delete,
+            max_workers=max_workers,
+            progress=progress,
+            checksum=checksum,
+        )
+
+
+def mv(
+    source_path,
+    destination_path,
+    project_id=None,
+    object_client=None,
+    max_workers=bulk.DEFAULT_MAX_WORKERS,
+    progress=None,
+):
     """Move a file or directory within a project's datasets.
 
+    Where the object store supports it, objects are moved by the server in a
+    single request. Otherwise, the files are moved with
+    :func:`faculty.datasets.bulk.move_tree`, which copies and deletes each
+    file in turn on a pool of workers.
+
     Parameters
     ----------
     source_path : str
@@ -329,6 +681,12 @@ def mv(source_path, destination_path, project_id=None, object_client=None):
     object_client : faculty.clients.object.ObjectClient, optional
         Advanced - can be used to benefit from caching in chain interactions
         with datasets.
+    max_workers : int, optional
+        The number of files to move concurrently, when they cannot be moved
+        by the server.
+    progress : Callable[[faculty.datasets.bulk.TransferProgress], None]
+        Called after each file has been moved, when they cannot be moved by
+        the server.
     """
 
     project_id = project_id or get_context().project_id
@@ -337,19 +695,24 @@ def mv(source_path, destination_path, project_id=None, object_client=None):
     if source_path == destination_path:
         return
 
-    cp(
-        source_path,
-        destination_path,
-        project_id=project_id,
-        recursive=True,
-        object_client=object_client,
-    )
-    rm(
-        source_path,
-        project_id=project_id,
-        recursive=True,
-        object_client=object_client,
-    )
+    with listing.invalidating(object_client, project_id, source_path):
+        with listing.invalidating(object_client, project_id, destination_path):
+            _create_parent_directories(
+                destination_path, project_id, object_client
+            )
+            try:
+                object_client.move(
+                    project_id, source_path, destination_path, recursive=True
+                )
+            except MoveNotSupported:
+                bulk.move_tree(
+                    object_client,
+                    project_id,
+                    source_path,
+                    destination_path,
+                    max_workers=max_workers,
+                    progress=progress,
+                )
 
 
 def cp(
@@ -383,10 +746,11 @@ def cp(
     project_id = project_id or get_context().project_id
     object_client = object_client or ObjectClient(get_session())
 
-    _create_parent_directories(destination_path, project_id, object_client)
-    object_client.copy(
-        project_id, source_path, destination_path, recursive=recursive
-    )
+    with listing.invalidating(object_client, project_id, destination_path):
+        _create_parent_directories(destination_path, project_id, object_client)
+        object_client.copy(
+            project_id, source_path, destination_path, recursive=recursive
+        )
 
 
 def rm(project_path, project_id=None, recursive=False, object_client=None):
@@ -412,7 +776,60 @@ def rm(project_path, project_id=None, recursive=False, object_client=None):
     project_id = project_id or get_context().project_id
     object_client = object_client or ObjectClient(get_session())
 
-    object_client.delete(project_id, project_path, recursive=recursive)
+    with listing.invalidating(object_client, project_id, project_path):
+        object_client.delete(project_id, project_path, recursive=recursive)
+
+
+def rm_many(
+    project_paths,
+    project_id=None,
+    recursive=False,
+    object_client=None,
+    max_workers=DEFAULT_DELETE_WORKERS,
+):
+    """Remove many files or directories from the project datasets.
+
+    Unlike :func:`rm`, a path that cannot be removed does not stop the others
+    from being removed. Check the returned outcomes for failures.
+
+    Parameters
+    ----------
+    project_paths : Iterable[str]
+        The paths in the project datasets to remove.
+    project_id : str, optional
+        The project to get files from. You need to have access to this project
+        for it to work. Defaults to the project set by FACULTY_PROJECT_ID in
+        your environment.
+    recursive : bool, optional
+        If True, allows deleting directories
+        like a recursive delete in a filesystem. By default the action
+        is not recursive.
+    object_client : faculty.clients.object.ObjectClient, optional
+        Advanced - can be used to benefit from caching in chain interactions
+        with datasets.
+    max_workers : int, optional
+        The number of paths to remove concurrently.
+
+    Returns
+    -------
+    List[faculty.clients.object.DeleteOutcome]
+        The outcome for each path, in the order given. The ``error`` of each
+        outcome is the exception raised when removing the path, such as
+        :class:`faculty.clients.object.PathNotFound`, or None if it was
+        removed.
+    """
+
+    project_id = project_id or get_context().project_id
+    object_client = object_client or ObjectClient(get_session())
+
+    # Forget all listings of the project at once, rather than per path
+    with listing.invalidating(object_client, project_id, None):
+        return object_client.delete_many(
+            project_id,
+            project_paths,
+            recursive=recursive,
+            max_workers=max_workers,
+        )
 
 
 def rmdir(project_path, project_id=None, object_client=None):
@@ -488,19 +905,36 @@ def etag(project_path, project_id=None, object_client=None):
 
 
 @contextlib.contextmanager
-def open(project_path, mode="r", temp_dir=None, project_id=None, **kwargs):
-    """Open a file from a project's datasets for reading.
+def open(
+    project_path,
+    mode="r",
+    temp_dir=None,
+    project_id=None,
+    lazy=False,
+    object_client=None,
+    cache=None,
+    **kwargs
+):
+    """Open a file from a project's datasets.
+
+    When reading, this downloads the file into a temporary directory before
+    opening it by default, so if your files are very large, this function can
+    take a long time. Pass ``lazy=True`` to instead read the file directly
+    from the object store, fetching only the parts of it that are read.
 
-    This downloads the file into a temporary directory before opening it, so if
-    your files are very large, this function can take a long time.
+    When writing, data is uploaded in the background as it is written, and
+    the file appears in the datasets when it is closed at the end of the
+    ``with`` block. If the block raises an exception, the upload is abandoned
+    and the file is not created or replaced.
 
     Parameters
     ----------
     project_path : str
         The path of the file in the project's datasets to open.
     mode : str
-        The opening mode, either 'r' or 'rb'. This is passed down to the
-        standard python open function. Writing is currently not supported.
+        The opening mode: 'r', 'rb', 'w', 'wb', 'x' or 'xb'. In read modes,
+        this is passed down to the standard python open function. Appending
+        and updating are not supported.
     temp_dir : str
         A directory on the local filesystem where you would like the file to be
         saved into temporarily. Note that on Faculty servers, the default
@@ -510,19 +944,68 @@ def open(project_path, mode="r", temp_dir=None, project_id=None, **kwargs):
         The project to get files from. You need to have access to this project
         for it to work. Defaults to the project set by FACULTY_PROJECT_ID in
         your environment.
+    lazy : bool, optional
+        If True, do not download the file, but return a seekable file object
+        that reads it with HTTP range requests, through a cache of recently
+        read blocks. Options ``buffering``, ``encoding``, ``errors`` and
+        ``newline`` are supported as for the standard python open function.
+        See :class:`faculty.datasets.remote.RemoteFileReader`.
+    object_client : faculty.clients.object.ObjectClient, optional
+        Advanced - can be used to benefit from caching in chain interactions
+        with datasets.
+    cache : faculty.datasets.cache.DownloadCache, optional
+        If given when reading, the file is opened directly from this cache
+        when its ETag is unchanged since it was cached, and is otherwise
+        downloaded into it, in place of ``temp_dir``. Cannot be combined with
+        ``lazy``.
     """
 
-    if _isdir(project_path, project_id=project_id):
+    if _isdir(
+        project_path, project_id=project_id, object_client=object_client
+    ):
         raise DatasetsError("Can't open directories.")
 
-    if any(char in mode for char in ("w", "a", "x")):
-        raise NotImplementedError("Currently, only reading is implemented.")
+    if any(char in mode for char in ("a", "+")):
+        raise NotImplementedError(
+            "Appending to and updating files is not supported."
+        )
+
+    if any(char in mode for char in ("w", "x")):
+        with _open_for_writing(
+            project_path, mode, project_id, object_client, **kwargs
+        ) as file_object:
+            yield file_object
+        return
+
+    if cache is not None:
+        if lazy:
+            raise ValueError("lazy and cache cannot be used together")
+        project_id = project_id or get_context().project_id
+        object_client = object_client or ObjectClient(get_session())
+        with cache.open(
+            object_client, project_id, project_path, mode, **kwargs
+        ) as file_object:
+            yield file_object
+        return
+
+    if lazy:
+        project_id = project_id or get_context().project_id
+        object_client = object_client or ObjectClient(get_session())
+        raw = remote.RemoteFileReader(object_client, project_id, project_path)
+        with remote.wrap_file(raw, mode, **kwargs) as file_object:
+            yield file_object
+        return
 
     tmpdir = tempfile.mkdtemp(prefix=".", dir=temp_dir)
     local_path = os.path.join(tmpdir, os.path.basename(project_path))
 
     try:
-        get(project_path, local_path, project_id=project_id)
+        get(
+            project_path,
+            local_path,
+            project_id=project_id,
+            object_client=object_client,
+        )
         with io.open(local_path, mode, **kwargs) as file_object:
             yield file_object
     finally:
@@ -532,6 +1015,38 @@ def open(project_path, mode="r", temp_dir=None, project_id=None, **kwargs):
             os.rmdir(tmpdir)
 
 
+@contextlib.contextmanager
+def _open_for_writing(project_path, mode, project_id, object_client, **kwargs):
+
+    project_id = project_id or get_context().project_id
+    object_client = object_client or ObjectClient(get_session())
+
+    if "x" in mode and _isfile(
+        project_path, project_id=project_id, object_client=object_client
+    ):
+        raise DatasetsError("'{}' File exists".format(project_path))
+
+    with listing.invalidating(object_client, project_id, project_path):
+        _create_parent_directories(project_path, project_id, object_client)
+        raw = remote.RemoteFileWriter(object_client, project_id, project_path)
+        try:
+            file_object = remote.wrap_file(raw, mode, **kwargs)
+        except Exception:
+            raw.abort()
+            raise
+
+        try:
+            yield file_object
+        except BaseException:
+            # Closing the file would complete the upload, so abort it
+            # instead. This also closes any buffering or text layers around
+            # it.
+            raw.abort()
+            raise
+        else:
+            file_object.close()
+
+
 def _rationalise_path(path):
 
     # All paths should be relative to root
@@ -0,0 +1,490 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transfer data to and from Faculty datasets with asyncio.
+
+This module mirrors :mod:`faculty.datasets.transfer`, but its functions are
+coroutines and its streams are asynchronous generators, so that many
+transfers can run concurrently on one event loop. Data is sent to and from the
+object store with `aiohttp <https://docs.aiohttp.org/>`_, which can be
+installed with the ``aio`` extra of this package, and requires Python 3.6 or
+later.
+
+Each function accepts an optional ``aiohttp.ClientSession``. Passing the same
+session to many transfers lets them share its connection pool; otherwise, a
+session is opened for the duration of each call. Requests to the Faculty
+object API to presign URLs are short, and are made from the event loop's
+default executor.
+"""
+
+
+import asyncio
+import functools
+import math
+import os
+
+import aiohttp
+
+from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
+from faculty.datasets import listing
+from faculty.datasets.transfer import (
+    DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    DEFAULT_MAX_WORKERS,
+    FILE_CHUNK_SIZE,
+    PRESIGN_BATCH_SIZE,
+    upload_chunk_size,
+)
+from faculty.datasets.util import DatasetsError, Rechunker
+
+
+async def download(object_client, project_id, datasets_path, session=None):
+    """Download the contents of file from the object store.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to download to in the object store
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+
+    Returns
+    -------
+    bytes
+        The content of the file
+    """
+    chunks = []
+    async for chunk in download_stream(
+        object_client, project_id, datasets_path, session=session
+    ):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def download_stream(
+    object_client,
+    project_id,
+    datasets_path,
+    chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    session=None,
+):
+    """Stream the contents of file from the object store.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to download to in the object store
+    chunk_size : int, optional
+        The maximum size of each chunk read from the response
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+
+    Returns
+    -------
+    AsyncIterator[bytes]
+        The content of the file, chunked
+    """
+    url = await _run_blocking(
+        object_client.presign_download, project_id, datasets_path
+    )
+
+    async with _SessionScope(session) as session:
+        async with session.get(url) as response:
+            _check_download_status(response, project_id, datasets_path)
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+
+async def download_file(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    session=None,
+):
+    """Download a file from the object store.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to download to in the object store
+    local_path : str
+        The local path of the object to download
+    chunk_size : int, optional
+        The maximum size of each chunk read from the response
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+    """
+    stream = download_stream(
+        object_client, project_id, datasets_path, chunk_size, session
+    )
+    # Start the download to allow any failures to happen before opening the
+    # file
+    first_chunk = await _anext(stream, b"")
+
+    fp = await _run_blocking(open, str(local_path), "wb")
+    try:
+        await _run_blocking(fp.write, first_chunk)
+        async for chunk in stream:
+            await _run_blocking(fp.write, chunk)
+    finally:
+        await _run_blocking(fp.close)
+
+
+async def upload(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    max_workers=DEFAULT_MAX_WORKERS,
+    session=None,
+):
+    """Upload data to the object store.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to upload to in the object store
+    content : bytes
+        The data to upload
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+    """
+    await _upload_stream(
+        object_client,
+        project_id,
+        datasets_path,
+        [content],
+        known_file_size=len(content),
+        max_workers=max_workers,
+        session=session,
+    )
+
+
+async def upload_stream(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    max_workers=DEFAULT_MAX_WORKERS,
+    session=None,
+):
+    """Upload data to the object store from an iterable.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to upload to in the object store
+    content : AsyncIterable[bytes] or Iterable[bytes]
+        The data to upload, chunked
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+    """
+    await _upload_stream(
+        object_client,
+        project_id,
+        datasets_path,
+        content,
+        max_workers=max_workers,
+        session=session,
+    )
+
+
+async def upload_file(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    session=None,
+):
+    """Upload a file to the object store.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The target path to upload to in the object store
+    local_path : str
+        The local path of the object to upload
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    session : aiohttp.ClientSession, optional
+        The session to make object store requests with
+    """
+    local_path = str(local_path)
+    await _upload_stream(
+        object_client,
+        project_id,
+        datasets_path,
+        _file_chunk_iterator(local_path),
+        known_file_size=await _run_blocking(os.path.getsize, local_path),
+        max_workers=max_workers,
+        session=session,
+    )
+
+
+async def _upload_stream(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    known_file_size=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    session=None,
+):
+    with listing.invalidating(object_client, project_id, datasets_path):
+        presign_response = await _run_blocking(
+            object_client.presign_upload, project_id, datasets_path
+        )
+        chunk_size = upload_chunk_size(
+            presign_response.provider, known_file_size
+        )
+        chunks = _rechunk_data(content, chunk_size)
+
+        async with _SessionScope(session) as session:
+            if presign_response.provider == CloudStorageProvider.S3:
+                if known_file_size is None:
+                    num_parts = None
+                else:
+                    num_parts = max(
+                        1, int(math.ceil(known_file_size / float(chunk_size)))
+                    )
+                await _s3_upload(
+                    session,
+                    object_client,
+                    project_id,
+                    datasets_path,
+                    chunks,
+                    presign_response.upload_id,
+                    max_workers,
+                    num_parts,
+                )
+            elif presign_response.provider == CloudStorageProvider.GCS:
+                await _gcs_upload(session, presign_response.url, chunks)
+            else:
+                raise ValueError(
+                    "Unsupported cloud storage provider: {}".format(
+                        presign_response.provider
+                    )
+                )
+
+
+async def _s3_upload(
+    session,
+    object_client,
+    project_id,
+    datasets_path,
+    chunks,
+    upload_id,
+    max_workers,
+    num_parts,
+):
+    urls = _presign_parts_in_batches(
+        object_client, project_id, datasets_path, upload_id, num_parts
+    )
+
+    completed_parts = []
+    pending = set()
+    try:
+        part_number = 0
+        async for chunk in chunks:
+            part_number += 1
+            url = await urls.__anext__()
+            if len(pending) >= max(1, max_workers):
+                # Wait for a part to finish before reading any more content,
+                # so that at most max_workers parts are held in memory
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                completed_parts.extend(task.result() for task in done)
+            pending.add(
+                asyncio.ensure_future(
+                    _s3_upload_part(session, url, part_number, chunk)
+                )
+            )
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            completed_parts.extend(task.result() for task in done)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    await _run_blocking(
+        object_client.complete_multipart_upload,
+        project_id,
+        datasets_path,
+        upload_id,
+        sorted(completed_parts),
+    )
+
+
+async def _presign_parts_in_batches(
+    object_client, project_id, datasets_path, upload_id, num_parts
+):
+    # Batches of unknown length grow from a single part, as in the
+    # synchronous upload
+    first = 1
+    batch_size = 1
+    while True:
+        if num_parts is not None:
+            batch_size = max(1, min(PRESIGN_BATCH_SIZE, num_parts - first + 1))
+        batch = list(range(first, first + batch_size))
+        urls = await _run_blocking(
+            object_client.presign_upload_parts,
+            project_id,
+            datasets_path,
+            upload_id,
+            batch,
+        )
+        for url in urls:
+            yield url
+        first += batch_size
+        batch_size = min(2 * batch_size, PRESIGN_BATCH_SIZE)
+
+
+async def _s3_upload_part(session, url, part_number, chunk):
+    async with session.put(url, data=chunk) as response:
+        response.raise_for_status()
+        return CompletedUploadPart(
+            part_number=part_number, etag=response.headers["ETag"]
+        )
+
+
+async def _gcs_upload(session, upload_url, chunks):
+    start_index = 0
+    async for chunk, is_last in _label_last(chunks):
+        if is_last:
+            total_file_size = start_index + len(chunk)
+        else:
+            total_file_size = "*"
+        await _gcs_upload_chunk(
+            session, upload_url, chunk, start_index, total_file_size
+        )
+        start_index += len(chunk)
+
+
+async def _gcs_upload_chunk(
+    session, upload_url, content, start_index, total_file_size
+):
+    headers = {"Content-Length": "{0}".format(len(content))}
+    # Only add a byte range to Content-Range if not empty, otherwise this
+    # will result in a bad request
+    if content:
+        end_index = start_index + len(content) - 1
+        headers["Content-Range"] = "bytes {0}-{1}/{2}".format(
+            start_index, end_index, total_file_size
+        )
+    async with session.put(
+        upload_url, data=content, headers=headers
+    ) as response:
+        response.raise_for_status()
+
+
+def _check_download_status(response, project_id, datasets_path):
+    if response.status == 404:
+        raise DatasetsError(
+            "No such object {} in project {}".format(datasets_path, project_id)
+        )
+    response.raise_for_status()
+
+
+async def _file_chunk_iterator(local_path):
+    fp = await _run_blocking(open, local_path, "rb")
+    try:
+        chunk = await _run_blocking(fp.read, FILE_CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = await _run_blocking(fp.read, FILE_CHUNK_SIZE)
+    finally:
+        await _run_blocking(fp.close)
+
+
+async def _rechunk_data(content, chunk_size):
+    """Regroup a sync or async iterable of bytes into chunks of a fixed size.
+
+    At least one chunk is produced, which is empty if there is no content.
+    Chunks may be held while later ones are read, so mutable input buffers
+    are copied in case the caller reuses them.
+    """
+    rechunker = Rechunker(chunk_size, copy_mutable=True)
+    async for original_chunk in _as_async_iterable(content):
+        for chunk in rechunker.feed(original_chunk):
+            yield chunk
+    for chunk in rechunker.finish():
+        yield chunk
+
+
+async def _label_last(chunks):
+    current_chunk = await _anext(chunks, b"")
+    async for next_chunk in chunks:
+        yield current_chunk, False
+        current_chunk = next_chunk
+    yield current_chunk, True
+
+
+async def _as_async_iterable(content):
+    if hasattr(content, "__aiter__"):
+        async for chunk in content:
+            yield chunk
+    else:
+        for chunk in content:
+            yield chunk
+
+
+async def _anext(iterator, default):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return default
+
+
+async def _run_blocking(function, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args))
+
+
+class _SessionScope(object):
+    """Use a given session, or one that is closed on exit if there is none."""
+
+    def __init__(self, session):
+        self._session = session
+        self._owned = session is None
+
+    async def __aenter__(self):
+        if self._owned:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._owned:
+            await self._session.close()
@@ -0,0 +1,870 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transfer many files between the local filesystem and datasets at once."""
+
+
+import os
+import shutil
+import calendar
+import posixpath
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from faculty.clients.object import CloudStorageProvider
+from faculty.datasets import listing, transfer
+from faculty.datasets.checksum import file_matches_etag
+from faculty.datasets.transfer import MEGABYTE
+from faculty.datasets.manifest import ManifestEntry, SyncManifest
+from faculty.datasets.util import BulkTransferError, DatasetsError, makedirs
+
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_LARGE_FILE_WORKERS = 2
+DEFAULT_PART_WORKERS = 4
+DEFAULT_LARGE_FILE_SIZE = 64 * MEGABYTE
+
+
+TransferProgress = namedtuple(
+    "TransferProgress",
+    [
+        "path",
+        "size",
+        "error",
+        "files_done",
+        "files_total",
+        "bytes_done",
+        "bytes_total",
+    ],
+)
+TransferProgress.__doc__ = """Progress of a bulk transfer.
+
+Reported after each file has been transferred, or has failed.
+
+Parameters
+----------
+path : str
+    The path of the file, relative to the root of the transfer.
+size : int
+    The size of the file.
+error : Exception or None
+    The error that caused the file to fail, if any.
+files_done, files_total : int
+    The number of files processed so far, and in total.
+bytes_done, bytes_total : int
+    The size of the files processed so far, and in total.
+"""
+
+
+SyncResult = namedtuple("SyncResult", ["transferred", "deleted", "unchanged"])
+SyncResult.__doc__ = """The outcome of syncing two directories.
+
+Parameters
+----------
+transferred : List[str]
+    The files transferred, relative to the root of the sync.
+deleted : List[str]
+    The files and directories deleted from the destination. Directories end
+    with a '/'.
+unchanged : List[str]
+    The files skipped as already in sync.
+"""
+
+
+_File = namedtuple("_File", ["relative_path", "size", "etag"])
+_Lane = namedtuple("_Lane", ["tasks", "max_workers"])
+
+
+def put_tree(
+    object_client,
+    project_id,
+    local_path,
+    project_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    large_file_workers=DEFAULT_LARGE_FILE_WORKERS,
+    part_workers=DEFAULT_PART_WORKERS,
+    large_file_size=DEFAULT_LARGE_FILE_SIZE,
+    progress=None,
+):
+    """Upload a local directory tree to a project's datasets concurrently.
+
+    The tree is scanned once, then the destination directory is created,
+    followed by its subdirectories, using a single request for each chain of
+    nested directories. Files are uploaded in two lanes, each with its own
+    pool of workers: one for small files, and one for files of at least
+    ``large_file_size`` bytes, whose parts are themselves uploaded
+    concurrently. This stops a few large uploads from holding up many small
+    ones.
+
+    A failure to upload one file does not stop the others. Once all files
+    have been attempted, a :class:`faculty.datasets.util.BulkTransferError`
+    is raised if any failed.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    local_path : str
+        The local directory to upload
+    project_path : str
+        The destination directory in the project's datasets
+    max_workers : int, optional
+        The number of small files to upload concurrently
+    large_file_workers : int, optional
+        The number of large files to upload concurrently
+    part_workers : int, optional
+        The number of parts of each large file to upload concurrently
+    large_file_size : int, optional
+        The size from which files are uploaded in the large file lane
+    progress : Callable[[TransferProgress], None], optional
+        Called in the calling thread after each file is processed
+
+    Raises
+    ------
+    faculty.clients.object.PathAlreadyExists
+        If the destination directory already exists.
+    """
+    directories, files = _scan_tree(local_path)
+
+    # As in a sequential put, the destination must not already exist, so
+    # that a tree is never merged into an existing directory
+    object_client.create_directory(project_id, project_path)
+
+    # Creating a directory creates its parents, so only the deepest of each
+    # chain of subdirectories needs creating
+    leaves = [path for path in _leaf_directories(directories) if path]
+
+    _create_directories(
+        object_client, project_id, project_path, leaves, max_workers
+    )
+
+    upload = _uploader(
+        object_client,
+        project_id,
+        local_path,
+        project_path,
+        part_workers,
+        large_file_size,
+    )
+    lanes = _size_lanes(
+        files, large_file_size, large_file_workers, max_workers
+    )
+    _report(_run_lanes(upload, lanes), files, progress, "upload")
+
+
+def get_tree(
+    object_client,
+    project_id,
+    project_path,
+    local_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    large_file_workers=DEFAULT_LARGE_FILE_WORKERS,
+    range_workers=DEFAULT_PART_WORKERS,
+    large_file_size=DEFAULT_LARGE_FILE_SIZE,
+    progress=None,
+    cache=None,
+):
+    """Download a directory from a project's datasets concurrently.
+
+    The directory is listed once, and all local directories are created
+    before any files are downloaded. Files are then downloaded in two lanes,
+    each with its own pool of workers: one for small files, which are each
+    fetched with a single request, and one for files of at least
+    ``large_file_size`` bytes, which are fetched in byte ranges
+    concurrently. The object API presigns downloads one at a time, so running
+    many small downloads at once keeps those round trips from adding up.
+
+    A failure to download one file does not stop the others. Once all files
+    have been attempted, a :class:`faculty.datasets.util.BulkTransferError`
+    is raised if any failed.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    project_path : str
+        The directory in the project's datasets to download
+    local_path : str
+        The local directory to download to
+    max_workers : int, optional
+        The number of small files to download concurrently
+    large_file_workers : int, optional
+        The number of large files to download concurrently
+    range_workers : int, optional
+        The number of byte ranges of each large file to download concurrently
+    large_file_size : int, optional
+        The size from which files are downloaded in the large file lane
+    progress : Callable[[TransferProgress], None], optional
+        Called in the calling thread after each file is processed
+    cache : faculty.datasets.cache.DownloadCache, optional
+        If given, files are downloaded through this cache, whatever their
+        size
+    """
+    prefix = _directory_prefix(project_path)
+    directories, remote_files = _list_tree(object_client, project_id, prefix)
+
+    for directory in sorted(directories | {""}):
+        makedirs(_join_local_path(local_path, directory))
+
+    files = [
+        _File(relative_path, obj.size, obj.etag)
+        for relative_path, obj in sorted(remote_files.items())
+    ]
+    download = _downloader(
+        object_client,
+        project_id,
+        prefix,
+        local_path,
+        range_workers,
+        large_file_size,
+        cache,
+    )
+    lanes = _size_lanes(
+        files, large_file_size, large_file_workers, max_workers
+    )
+    _report(_run_lanes(download, lanes), files, progress, "download")
+
+
+def sync_tree(
+    object_client,
+    project_id,
+    local_path,
+    project_path,
+    direction="put",
+    delete=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    large_file_workers=DEFAULT_LARGE_FILE_WORKERS,
+    part_workers=DEFAULT_PART_WORKERS,
+    large_file_size=DEFAULT_LARGE_FILE_SIZE,
+    progress=None,
+    manifest_directory=None,
+    checksum=False,
+):
+    """Transfer only new and changed files between two directories.
+
+    The datasets directory is listed once and the local directory scanned
+    once. A file is considered unchanged if both its local size and
+    modification time and its ETag in datasets match those recorded in a
+    :class:`faculty.datasets.manifest.SyncManifest` at the end of the last
+    sync of the same directories. Files not in the manifest are transferred
+    if their sizes differ, or if the source is newer than the destination.
+    With ``checksum``, files of the same size are instead compared by their
+    MD5 checksums where possible; see :mod:`faculty.datasets.checksum`.
+    Transfers run concurrently as in :func:`put_tree` and :func:`get_tree`.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    local_path : str
+        The local directory
+    project_path : str
+        The directory in the project's datasets
+    direction : str, optional
+        ``"put"`` to update the datasets directory from the local one, or
+        ``"get"`` to update the local directory from datasets. The source
+        directory must exist.
+    delete : bool, optional
+        If True, delete files and directories in the destination that are
+        not in the source. Nothing is deleted if any transfer fails.
+    max_workers : int, optional
+        The number of small files to transfer concurrently
+    large_file_workers : int, optional
+        The number of large files to transfer concurrently
+    part_workers : int, optional
+        The number of parts or byte ranges of each large file to transfer
+        concurrently
+    large_file_size : int, optional
+        The size from which files are transferred in the large file lane
+    progress : Callable[[TransferProgress], None], optional
+        Called in the calling thread after each file is transferred
+    manifest_directory : str, optional
+        The directory to store sync manifests in
+    checksum : bool, optional
+        If True, compare the checksum of each local file not known to be in
+        sync with the ETag of the object in datasets. This reads local files
+        but avoids transferring files whose content is already the same.
+
+    Returns
+    -------
+    SyncResult
+    """
+    if direction not in ("put", "get"):
+        raise ValueError(
+            "direction must be 'put' or 'get', not {!r}".format(direction)
+        )
+
+    prefix = _directory_prefix(project_path)
+    manifest = SyncManifest.for_directories(
+        project_id, prefix, local_path, manifest_directory
+    )
+    manifest.load()
+
+    # Decisions about what to transfer need the current state of datasets
+    listing.listing_cache(object_client).invalidate(project_id, prefix)
+    remote_directories, remote_files = _list_tree(
+        object_client, project_id, prefix
+    )
+    if direction == "get":
+        if not remote_directories:
+            # Anything under the prefix would have listed its root, so there
+            # is no such directory, and deleting would empty the destination
+            raise DatasetsError(
+                "No such directory {} in project {}".format(
+                    project_path, project_id
+                )
+            )
+        makedirs(local_path)
+    local_directories, local_files = _scan_tree(local_path)
+    local_stats = {
+        f.relative_path: os.stat(_join_local_path(local_path, f.relative_path))
+        for f in local_files
+    }
+
+    if direction == "put":
+        source_paths = set(local_stats)
+        destination_paths = set(remote_files)
+    else:
+        source_paths = set(remote_files)
+        destination_paths = set(local_stats)
+
+    unchanged = []
+    to_transfer = []
+    for relative_path in sorted(source_paths):
+        if relative_path in destination_paths and _in_sync(
+            local_stats[relative_path],
+            remote_files[relative_path],
+            manifest.entries.get(relative_path),
+            direction,
+            _join_local_path(local_path, relative_path) if checksum else None,
+        ):
+            unchanged.append(relative_path)
+        elif direction == "put":
+            to_transfer.append(
+                _File(relative_path, local_stats[relative_path].st_size, None)
+            )
+        else:
+            remote_object = remote_files[relative_path]
+            to_transfer.append(
+                _File(relative_path, remote_object.size, remote_object.etag)
+            )
+
+    if direction == "put":
+        missing_directories = [
+            directory
+            for directory in _leaf_directories(local_directories)
+            if directory not in remote_directories
+        ]
+        _create_directories(
+            object_client,
+            project_id,
+            project_path,
+            missing_directories,
+            max_workers,
+        )
+        transfer_file = _uploader(
+            object_client,
+            project_id,
+            local_path,
+            prefix,
+            part_workers,
+            large_file_size,
+        )
+    else:
+        for directory in sorted(remote_directories):
+            makedirs(_join_local_path(local_path, directory))
+        transfer_file = _downloader(
+            object_client,
+            project_id,
+            prefix,
+            local_path,
+            part_workers,
+            large_file_size,
+        )
+
+    transferred = []
+
+    def record_successes(results):
+        for transferred_file, error in results:
+            if error is None:
+                transferred.append(transferred_file.relative_path)
+            yield transferred_file, error
+
+    lanes = _size_lanes(
+        to_transfer, large_file_size, large_file_workers, max_workers
+    )
+    try:
+        _report(
+            record_successes(_run_lanes(transfer_file, lanes)),
+            to_transfer,
+            progress,
+            "transfer",
+        )
+    finally:
+        if direction == "put" and transferred:
+            # The ETags of the new objects are only known once uploaded
+            listing.listing_cache(object_client).invalidate(project_id, prefix)
+            _, remote_files = _list_tree(object_client, project_id, prefix)
+        manifest.entries = {}
+        for relative_path in unchanged + transferred:
+            local_stat = os.stat(_join_local_path(local_path, relative_path))
+            remote_object = remote_files.get(relative_path)
+            if remote_object is not None:
+                manifest.entries[relative_path] = ManifestEntry(
+                    local_stat.st_size,
+                    local_stat.st_mtime,
+                    remote_object.etag,
+                )
+        manifest.save()
+
+    deleted = []
+    if delete:
+        if direction == "put":
+            extraneous_directories = set(remote_directories) - set(
+                local_directories + [""]
+            )
+        else:
+            extraneous_directories = set(local_directories) - set(
+                remote_directories
+            )
+        extraneous_files = destination_paths - source_paths
+        deleted = _top_level(extraneous_directories, extraneous_files)
+        if direction == "put":
+            try:
+                _delete_remote(object_client, project_id, prefix, deleted)
+            finally:
+                listing.listing_cache(object_client).invalidate(
+                    project_id, prefix
+                )
+        else:
+            _delete_local(local_path, deleted)
+
+    return SyncResult(
+        transferred=sorted(transferred),
+        deleted=deleted,
+        unchanged=unchanged,
+    )
+
+
+def move_tree(
+    object_client,
+    project_id,
+    source_path,
+    destination_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    progress=None,
+):
+    """Move a file or directory within datasets by copying and deleting.
+
+    This is for object stores that cannot move objects themselves. The
+    source directory is listed once and the destination directories created.
+    Then each worker copies a file and immediately deletes the original, so
+    that copies and deletes overlap rather than running as two passes over
+    the whole tree.
+
+    A failure to move one file does not stop the others. Once all files have
+    been attempted, a :class:`faculty.datasets.util.BulkTransferError` is
+    raised if any failed, and the source directory is left in place with the
+    files that were not moved.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    source_path : str
+        The file or directory in the project's datasets to move
+    destination_path : str
+        The path to move it to
+    max_workers : int, optional
+        The number of files to move concurrently
+    progress : Callable[[TransferProgress], None], optional
+        Called in the calling thread after each file is processed
+    """
+    prefix = _directory_prefix(source_path)
+    directories, remote_files = _list_tree(object_client, project_id, prefix)
+
+    if not directories:
+        # Not a directory, so move a single file
+        object_client.copy(project_id, source_path, destination_path)
+        object_client.delete(project_id, source_path)
+        return
+
+    destination_prefix = _directory_prefix(destination_path)
+    leaves = _leaf_directories(sorted(directories - {""}))
+    _create_directories(
+        object_client, project_id, destination_prefix, leaves, max_workers
+    )
+
+    def move(remote_file):
+        object_client.copy(
+            project_id,
+            prefix + remote_file.relative_path,
+            destination_prefix + remote_file.relative_path,
+        )
+        object_client.delete(project_id, prefix + remote_file.relative_path)
+
+    files = [
+        _File(relative_path, obj.size, obj.etag)
+        for relative_path, obj in sorted(remote_files.items())
+    ]
+    _report(
+        _run_lanes(move, [_Lane(files, max_workers)]), files, progress, "move"
+    )
+
+    # Remove the markers of the source directories
+    object_client.delete(project_id, prefix, recursive=True)
+
+
+def _uploader(
+    object_client,
+    project_id,
+    local_path,
+    project_path,
+    part_workers,
+    large_file_size,
+):
+    def upload(local_file):
+        is_large = local_file.size >= large_file_size
+        transfer.upload_file(
+            object_client,
+            project_id,
+            _join_project_path(project_path, local_file.relative_path),
+            _join_local_path(local_path, local_file.relative_path),
+            max_workers=part_workers if is_large else 1,
+        )
+
+    return upload
+
+
+def _downloader(
+    object_client,
+    project_id,
+    prefix,
+    local_path,
+    range_workers,
+    large_file_size,
+    cache=None,
+):
+    def download(remote_file):
+        datasets_path = prefix + remote_file.relative_path
+        destination = _join_local_path(local_path, remote_file.relative_path)
+        if cache is not None:
+            cache.download_file(
+                object_client, project_id, datasets_path, destination
+            )
+        elif remote_file.size >= large_file_size:
+            # The size is already known from the listing, so go straight to
+            # a ranged download rather than looking the object up again
+            transfer.download_file_ranged(
+                object_client,
+                project_id,
+                datasets_path,
+                destination,
+                remote_file.size,
+                range_workers,
+                transfer.DEFAULT_DOWNLOAD_CHUNK_SIZE,
+                etag=remote_file.etag,
+            )
+        else:
+            transfer.download_file(
+                object_client, project_id, datasets_path, destination
+            )
+
+    return download
+
+
+def _size_lanes(files, large_file_size, large_file_workers, max_workers):
+    """Split files into a lane of large files and a lane of small ones."""
+    small_files = [f for f in files if f.size < large_file_size]
+    large_files = [f for f in files if f.size >= large_file_size]
+    return [
+        _Lane(large_files, large_file_workers),
+        _Lane(small_files, max_workers),
+    ]
+
+
+def _create_directories(
+    object_client, project_id, project_path, directories, max_workers
+):
+    def create_directory(relative_path):
+        object_client.create_directory(
+            project_id,
+            _join_project_path(project_path, relative_path),
+            parents=True,
+        )
+
+    lanes = [_Lane(directories, max_workers)]
+    for _, error in _run_lanes(create_directory, lanes):
+        if error is not None:
+            raise error
+
+
+def _in_sync(
+    local_stat, remote_object, manifest_entry, direction, checksum_path=None
+):
+    """Decide whether a file is the same locally and in datasets.
+
+    If ``checksum_path`` is given, the content of the local file at that path
+    is compared with the object's ETag when this can tell.
+    """
+    if manifest_entry is not None and manifest_entry == ManifestEntry(
+        local_stat.st_size, local_stat.st_mtime, remote_object.etag
+    ):
+        return True
+    if local_stat.st_size != remote_object.size:
+        return False
+    if checksum_path is not None:
+        # Objects uploaded in parts by this library have parts of this size
+        part_size = transfer.upload_chunk_size(
+            CloudStorageProvider.S3, local_stat.st_size
+        )
+        matches = file_matches_etag(
+            checksum_path, remote_object.etag, part_size
+        )
+        if matches is not None:
+            return matches
+    if manifest_entry is not None:
+        return False
+    remote_mtime = _timestamp(remote_object.last_modified_at)
+    if direction == "put":
+        return local_stat.st_mtime <= remote_mtime
+    else:
+        return remote_mtime <= local_stat.st_mtime
+
+
+def _timestamp(value):
+    """Convert a datetime, assumed UTC if naive, to a POSIX timestamp."""
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _top_level(directories, files):
+    """Find the paths not inside any of the given directories.
+
+    Directories are returned with a trailing '/'.
+    """
+
+    def inside_directories(path):
+        parent = posixpath.dirname(path)
+        while parent:
+            if parent in directories:
+                return True
+            parent = posixpath.dirname(parent)
+        return False
+
+    paths = [d + "/" for d in directories if not inside_directories(d)]
+    paths += [f for f in files if not inside_directories(f)]
+    return sorted(paths)
+
+
+def _delete_remote(object_client, project_id, prefix, relative_paths):
+    def delete(relative_path):
+        object_client.delete(
+            project_id,
+            prefix + relative_path,
+            recursive=relative_path.endswith("/"),
+        )
+
+    _raise_failures(
+        _run_lanes(delete, [_Lane(relative_paths, DEFAULT_MAX_WORKERS)]),
+        "delete",
+    )
+
+
+def _delete_local(local_path, relative_paths):
+    def delete(relative_path):
+        path = _join_local_path(local_path, relative_path.rstrip("/"))
+        if relative_path.endswith("/"):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    _raise_failures(_run_lanes(delete, [_Lane(relative_paths, 1)]), "delete")
+
+
+def _raise_failures(results, action):
+    failures = {}
+    total = 0
+    for path, error in results:
+        total += 1
+        if error is not None:
+            failures[path] = error
+    if failures:
+        raise BulkTransferError(
+            "Failed to {} {} of {} paths".format(action, len(failures), total),
+            failures,
+        )
+
+
+def _report(results, files, progress, action):
+    """Collect the results of transferring files, reporting progress."""
+    files_total = len(files)
+    bytes_total = sum(f.size for f in files)
+    files_done = 0
+    bytes_done = 0
+    failures = {}
+
+    for transferred, error in results:
+        files_done += 1
+        bytes_done += transferred.size
+        if error is not None:
+            failures[transferred.relative_path] = error
+        if progress is not None:
+            progress(
+                TransferProgress(
+                    path=transferred.relative_path,
+                    size=transferred.size,
+                    error=error,
+                    files_done=files_done,
+                    files_total=files_total,
+                    bytes_done=bytes_done,
+                    bytes_total=bytes_total,
+                )
+            )
+
+    if failures:
+        raise BulkTransferError(
+            "Failed to {} {} of {} files".format(
+                action, len(failures), files_total
+            ),
+            failures,
+        )
+
+
+def _run_lanes(function, lanes):
+    """Apply a function to tasks in several lanes, each with its own workers.
+
+    Tasks are drawn from each lane only as its workers become free, and
+    ``(task, error)`` is yielded in the calling thread as each completes,
+    where error is the exception raised, if any.
+    """
+    limits = [max(1, lane.max_workers) for lane in lanes]
+    executors = [ThreadPoolExecutor(max_workers=limit) for limit in limits]
+    iterators = [iter(lane.tasks) for lane in lanes]
+    in_progress = [0] * len(lanes)
+    pending = {}
+
+    def fill(index):
+        while (
+            iterators[index] is not None and in_progress[index] < limits[index]
+        ):
+            try:
+                task = next(iterators[index])
+            except StopIteration:
+                iterators[index] = None
+                return
+            future = executors[index].submit(function, task)
+            pending[future] = (index, task)
+            in_progress[index] += 1
+
+    try:
+        while True:
+            for index in range(len(lanes)):
+                fill(index)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, task = pending.pop(future)
+                in_progress[index] -= 1
+                yield task, future.exception()
+    finally:
+        for future in pending:
+            future.cancel()
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+
+def _scan_tree(local_path):
+    """List the directories and files under a local directory.
+
+    Paths are relative to the directory and use '/' as a separator. Symbolic
+    links are followed.
+    """
+    directories = []
+    files = []
+    stack = [""]
+    while stack:
+        relative_directory = stack.pop()
+        directory = _join_local_path(local_path, relative_directory)
+        for name, is_directory, size in _list_directory(directory):
+            relative_path = posixpath.join(relative_directory, name)
+            if is_directory:
+                directories.append(relative_path)
+                stack.append(relative_path)
+            else:
+                files.append(_File(relative_path, size, None))
+    return sorted(directories), sorted(files)
+
+
+def _list_directory(directory):
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(directory):
+            if entry.is_dir():
+                yield entry.name, True, None
+            else:
+                yield entry.name, False, entry.stat().st_size
+    else:
+        # Python < 3.5
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                yield name, True, None
+            else:
+                yield name, False, os.path.getsize(path)
+
+
+def _leaf_directories(directories):
+    """Find the directories, including the root, with no subdirectories."""
+    parents = set(posixpath.dirname(path) for path in directories)
+    return [path for path in [""] + directories if path not in parents]
+
+
+def _join_project_path(project_path, relative_path):
+    if not relative_path:
+        return project_path
+    return posixpath.join(project_path, relative_path)
+
+
+def _join_local_path(local_path, relative_path):
+    return os.path.join(local_path, *relative_path.split("/"))
+
+
+def _directory_prefix(project_path):
+    prefix = posixpath.normpath(posixpath.join("/", project_path))
+    return prefix.rstrip("/") + "/"
+
+
+def _list_tree(object_client, project_id, prefix):
+    """List the directories and files under a prefix in datasets.
+
+    Paths are relative to the prefix. Directories include the parents of all
+    files, and the root, as an empty string, if anything was listed.
+    """
+    directories = set()
+    files = {}
+    for obj in listing.list_objects(object_client, project_id, prefix):
+        relative_path = obj.path[len(prefix) :]
+        if obj.path.endswith("/"):
+            directory = relative_path.rstrip("/")
+        else:
+            files[relative_path] = obj
+            directory = posixpath.dirname(relative_path)
+        while directory not in directories:
+            directories.add(directory)
+            if not directory:
+                break
+            directory = posixpath.dirname(directory)
+    return directories, files
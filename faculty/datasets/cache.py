@@ -0,0 +1,324 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep local copies of downloaded files to avoid downloading them again.
+
+Files are stored under a key derived from their project, path and ETag, so a
+file is only served from the cache while its ETag in datasets is unchanged.
+Checking the ETag costs a single metadata request, in place of the download.
+Downloads are conditional on the ETag, so that a file replaced after it was
+checked is not stored under the key of its previous version.
+
+Several processes on the same host can share a cache directory. Files are
+downloaded to a temporary file and moved into place once complete, so that a
+partially downloaded file is never read from the cache.
+"""
+
+
+import io
+import os
+import json
+import time
+import errno
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+
+from faculty.datasets import transfer
+from faculty.datasets.transfer import GIGABYTE
+from faculty.datasets.util import (
+    DatasetsError,
+    cache_directory,
+    makedirs,
+    replace,
+)
+
+
+DEFAULT_MAX_SIZE = 10 * GIGABYTE
+
+# Temporary files older than this are assumed to have been left behind by a
+# process that stopped while downloading
+STALE_TEMPORARY_FILE_SECONDS = 24 * 60 * 60
+
+_TEMPORARY_PREFIX = ".tmp-"
+
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions"])
+CacheStats.__doc__ = """Counts of cache operations made by a DownloadCache.
+
+Parameters
+----------
+hits : int
+    The number of files served from the cache.
+misses : int
+    The number of files downloaded into the cache.
+evictions : int
+    The number of files removed to keep the cache within its size limit.
+"""
+
+
+class DownloadCache(object):
+    """An on-disk cache of files downloaded from datasets.
+
+    When the cache grows beyond ``max_size``, the least recently used files
+    are removed.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The directory to store cached files in. Defaults to a ``faculty``
+        directory in the user's cache directory.
+    max_size : int, optional
+        The total size of files to keep in the cache, in bytes. A file larger
+        than this is still downloaded through the cache, but is evicted once
+        another file is cached.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = default_cache_directory()
+        self.directory = str(directory)
+        self.max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """The operations made through this instance of the cache.
+
+        Returns
+        -------
+        CacheStats
+        """
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions)
+
+    def path(self, object_client, project_id, datasets_path):
+        """Get the path of an up-to-date cached copy of a file.
+
+        The file is downloaded into the cache if needed. The returned file
+        must not be modified, and may be evicted by another process at any
+        time.
+
+        Parameters
+        ----------
+        object_client : faculty.clients.object.ObjectClient
+        project_id : uuid.UUID
+        datasets_path : str
+            The path of the file in the project's datasets
+
+        Returns
+        -------
+        str
+        """
+        obj = transfer.get_object(object_client, project_id, datasets_path)
+        cached_path = self._cached_path(project_id, obj.path, obj.etag)
+
+        if _touch(cached_path):
+            self._count(hits=1)
+            return cached_path
+
+        self._populate(
+            object_client, project_id, datasets_path, obj, cached_path
+        )
+        self._count(misses=1)
+        self._evict(keep=cached_path)
+        return cached_path
+
+    def download(self, object_client, project_id, datasets_path):
+        """Get the contents of a file through the cache.
+
+        Parameters
+        ----------
+        object_client : faculty.clients.object.ObjectClient
+        project_id : uuid.UUID
+        datasets_path : str
+            The path of the file in the project's datasets
+
+        Returns
+        -------
+        bytes
+        """
+        with self.open(object_client, project_id, datasets_path) as fp:
+            return fp.read()
+
+    def download_file(
+        self, object_client, project_id, datasets_path, local_path
+    ):
+        """Copy a file to the local filesystem through the cache.
+
+        Parameters
+        ----------
+        object_client : faculty.clients.object.ObjectClient
+        project_id : uuid.UUID
+        datasets_path : str
+            The path of the file in the project's datasets
+        local_path : str
+            The local path to copy the file to
+        """
+        with self.open(object_client, project_id, datasets_path) as source:
+            with io.open(str(local_path), "wb") as destination:
+                shutil.copyfileobj(source, destination)
+
+    def open(
+        self, object_client, project_id, datasets_path, mode="rb", **kwargs
+    ):
+        """Open the cached copy of a file for reading.
+
+        Parameters
+        ----------
+        object_client : faculty.clients.object.ObjectClient
+        project_id : uuid.UUID
+        datasets_path : str
+            The path of the file in the project's datasets
+        mode : str, optional
+            'r' or 'rb'. Other arguments are passed to :func:`io.open`.
+
+        Returns
+        -------
+        file object
+        """
+        if any(char in mode for char in "wxa+"):
+            raise ValueError("Cached files can only be opened for reading")
+        try:
+            return io.open(
+                self.path(object_client, project_id, datasets_path),
+                mode,
+                **kwargs
+            )
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        # Another process evicted the file between it being cached and
+        # opened, so cache it again
+        return io.open(
+            self.path(object_client, project_id, datasets_path), mode, **kwargs
+        )
+
+    def clear(self):
+        """Remove all files from the cache."""
+        for path, _, _ in self._cached_files():
+            _remove(path)
+
+    def _cached_path(self, project_id, datasets_path, etag):
+        key = json.dumps([str(project_id), datasets_path, etag])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _populate(
+        self, object_client, project_id, datasets_path, obj, cached_path
+    ):
+        directory = os.path.dirname(cached_path)
+        makedirs(directory, 0o700)
+        fd, temporary_path = tempfile.mkstemp(
+            prefix=_TEMPORARY_PREFIX, dir=directory
+        )
+        os.close(fd)
+        try:
+            # Only the version with the ETag in the key may be stored under it
+            transfer.download_file_from_offset(
+                object_client,
+                project_id,
+                datasets_path,
+                temporary_path,
+                0,
+                transfer.DEFAULT_DOWNLOAD_CHUNK_SIZE,
+                obj,
+            )
+            if os.path.getsize(temporary_path) != obj.size:
+                raise DatasetsError(
+                    "{} changed while being downloaded".format(datasets_path)
+                )
+            replace(temporary_path, cached_path)
+        except BaseException:
+            _remove(temporary_path)
+            raise
+
+    def _evict(self, keep):
+        now = time.time()
+        files = []
+        for path, size, mtime in self._cached_files():
+            if os.path.basename(path).startswith(_TEMPORARY_PREFIX):
+                if now - mtime > STALE_TEMPORARY_FILE_SECONDS:
+                    _remove(path)
+            else:
+                files.append((mtime, path, size))
+
+        total_size = sum(size for _, _, size in files)
+        for _, path, size in sorted(files):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            if _remove(path):
+                self._count(evictions=1)
+            total_size -= size
+
+    def _cached_files(self):
+        try:
+            subdirectories = os.listdir(self.directory)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        for subdirectory in subdirectories:
+            subdirectory = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(subdirectory):
+                continue
+            for name in os.listdir(subdirectory):
+                path = os.path.join(subdirectory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    # Removed by another process
+                    if e.errno == errno.ENOENT:
+                        continue
+                    raise
+                yield path, stat.st_size, stat.st_mtime
+
+    def _count(self, hits=0, misses=0, evictions=0):
+        with self._lock:
+            self._hits += hits
+            self._misses += misses
+            self._evictions += evictions
+
+
+def default_cache_directory():
+    """Get the default directory to cache downloaded files in."""
+    return cache_directory("downloads")
+
+
+def _touch(path):
+    """Mark a file as recently used, returning False if it does not exist."""
+    try:
+        os.utime(path, None)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+    return True
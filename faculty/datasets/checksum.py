@@ -0,0 +1,159 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Check data against the MD5 checksums kept by the object store.
+
+S3 gives each part of a multipart upload an ETag which is the MD5 of the
+part, and the whole object an ETag which is the MD5 of the concatenated
+digests of its parts, followed by the number of parts. Objects uploaded in a
+single request, including to GCS, have the MD5 of their content as ETag, and
+GCS also reports it in the ``x-goog-hash`` header. Checksums are computed as
+data passes through a transfer, so that files are not read a second time.
+
+Objects encrypted with keys managed by AWS KMS do not have MD5 ETags, so
+verification must be left off for them.
+"""
+
+
+import io
+import base64
+import hashlib
+
+
+_READ_SIZE = 1024 * 1024
+
+
+class MultipartChecksum(object):
+    """The MD5 of a stream of data, and of each of its parts.
+
+    Parameters
+    ----------
+    part_size : int, optional
+        The size of the parts the data was uploaded in. If not given, only
+        the MD5 of the whole stream is computed.
+    """
+
+    def __init__(self, part_size=None):
+        self.part_size = part_size
+        self._whole = hashlib.md5()
+        self._part = hashlib.md5()
+        self._part_remaining = part_size
+        self._part_digests = []
+
+    def update(self, data):
+        """Add data from the stream."""
+        self._whole.update(data)
+        if self.part_size is None:
+            return
+        start = 0
+        while start < len(data):
+            end = start + min(self._part_remaining, len(data) - start)
+            self._part.update(data[start:end])
+            self._part_remaining -= end - start
+            start = end
+            if self._part_remaining == 0:
+                self._part_digests.append(self._part.digest())
+                self._part = hashlib.md5()
+                self._part_remaining = self.part_size
+
+    def hexdigest(self):
+        """The MD5 of the whole stream, as a hexadecimal string."""
+        return self._whole.hexdigest()
+
+    def multipart_etag(self):
+        """The ETag S3 gives the stream when uploaded in parts."""
+        digests = list(self._part_digests)
+        if self._part_remaining != self.part_size or not digests:
+            digests.append(self._part.digest())
+        return "{}-{}".format(
+            hashlib.md5(b"".join(digests)).hexdigest(), len(digests)
+        )
+
+
+def normalise_etag(etag):
+    """Remove the quotes HTTP puts around ETags."""
+    return etag.strip('"')
+
+
+def etag_matches(etag, checksum):
+    """Check a checksum against an ETag.
+
+    Parameters
+    ----------
+    etag : str
+    checksum : MultipartChecksum
+
+    Returns
+    -------
+    Optional[bool]
+        Whether the checksum matches, or None if the ETag is of a multipart
+        upload made with parts of another size than the checksum's, so that
+        they cannot be compared.
+    """
+    etag = normalise_etag(etag)
+    if "-" not in etag:
+        return etag == checksum.hexdigest()
+    if checksum.part_size is None:
+        return None
+    expected = checksum.multipart_etag()
+    if etag.rsplit("-", 1)[1] != expected.rsplit("-", 1)[1]:
+        return None
+    return etag == expected
+
+
+def file_matches_etag(local_path, etag, part_size):
+    """Check whether a local file has the content of an object.
+
+    Parameters
+    ----------
+    local_path : str
+    etag : str
+        The ETag of the object.
+    part_size : int
+        The size of the parts the object would have been uploaded in, if it
+        was uploaded in parts.
+
+    Returns
+    -------
+    Optional[bool]
+        Whether the file matches, or None if this cannot be told.
+    """
+    checksum = MultipartChecksum(part_size)
+    with io.open(local_path, "rb") as fp:
+        for data in iter(lambda: fp.read(_READ_SIZE), b""):
+            checksum.update(data)
+    return etag_matches(etag, checksum)
+
+
+def response_md5(headers):
+    """Get the MD5 of an object from the headers of a response, if given.
+
+    Parameters
+    ----------
+    headers : Mapping[str, str]
+
+    Returns
+    -------
+    Optional[str]
+        The MD5 as a hexadecimal string.
+    """
+    for value in headers.get("x-goog-hash", "").split(","):
+        name, _, encoded = value.strip().partition("=")
+        if name == "md5":
+            digest = base64.b64decode(encoded)
+            return base64.b16encode(digest).decode("ascii").lower()
+    etag = normalise_etag(headers.get("ETag", ""))
+    if etag and "-" not in etag:
+        return etag
+    return None
@@ -0,0 +1,153 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Strategies for choosing the size of the parts of a transfer.
+
+A policy can be passed as the ``chunk_policy`` argument of the upload and
+download functions in :mod:`faculty.datasets.transfer`. For each part, the
+transfer asks the policy for a size within the limits imposed by the storage
+provider, and reports back how long the part took to transfer.
+"""
+
+
+import threading
+
+
+KILOBYTE = 1024
+MEGABYTE = 1024 * KILOBYTE
+GIGABYTE = 1024 * MEGABYTE
+
+
+class ChunkSizePolicy(object):
+    """Base class for strategies choosing the size of each part of a transfer.
+
+    A policy may be shared between concurrent transfers, and its methods
+    called from several threads, so implementations must be thread safe.
+    """
+
+    def chunk_size(self, minimum, maximum):
+        """Choose the size of the next part of a transfer.
+
+        Parameters
+        ----------
+        minimum : int
+            The smallest size allowed for this part.
+        maximum : int
+            The largest size allowed for this part.
+
+        Returns
+        -------
+        int
+        """
+        raise NotImplementedError
+
+    def record(self, num_bytes, seconds):
+        """Record the time taken to transfer a part.
+
+        Parameters
+        ----------
+        num_bytes : int
+            The size of the part.
+        seconds : float
+            The time taken to transfer the part, including request latency.
+        """
+        pass
+
+
+class FixedChunkSize(ChunkSizePolicy):
+    """Use parts of the same size, as far as provider limits allow.
+
+    Parameters
+    ----------
+    chunk_size : int
+        The size of each part.
+    """
+
+    def __init__(self, chunk_size):
+        self._chunk_size = chunk_size
+
+    def chunk_size(self, minimum, maximum):
+        return max(minimum, min(self._chunk_size, maximum))
+
+
+class AdaptiveChunkSize(ChunkSizePolicy):
+    """Size parts so that each takes roughly a target time to transfer.
+
+    Transfers start with parts of ``initial_chunk_size``. The throughput of
+    completed parts is tracked as an exponentially weighted moving average,
+    and later parts are sized so that they would take ``target_seconds`` at
+    that throughput. As the throughput measured for each part includes the
+    latency of its request, parts grow until that latency is small compared
+    to the time spent transferring data. The size changes by at most a
+    factor of ``max_growth`` from one part to the next.
+
+    Parameters
+    ----------
+    initial_chunk_size : int, optional
+        The size of parts before any have been measured.
+    max_chunk_size : int, optional
+        The largest part to use, unless provider limits require larger ones.
+        Uploads of streams hold each part in memory, so this bounds memory
+        usage per worker.
+    target_seconds : float, optional
+        The time each part should take to transfer.
+    max_growth : float, optional
+        The largest factor by which consecutive part sizes may differ.
+    smoothing : float, optional
+        The weight given to each new measurement in the moving average.
+    """
+
+    def __init__(
+        self,
+        initial_chunk_size=5 * MEGABYTE,
+        max_chunk_size=512 * MEGABYTE,
+        target_seconds=5.0,
+        max_growth=2.0,
+        smoothing=0.3,
+    ):
+        self.max_chunk_size = max_chunk_size
+        self.target_seconds = target_seconds
+        self.max_growth = max_growth
+        self.smoothing = smoothing
+        self._current_size = float(initial_chunk_size)
+        self._throughput = None
+        self._lock = threading.Lock()
+
+    @property
+    def throughput(self):
+        """The measured throughput in bytes per second, if known."""
+        return self._throughput
+
+    def record(self, num_bytes, seconds):
+        if seconds <= 0:
+            return
+        throughput = num_bytes / float(seconds)
+        with self._lock:
+            if self._throughput is None:
+                self._throughput = throughput
+            else:
+                self._throughput += self.smoothing * (
+                    throughput - self._throughput
+                )
+
+    def chunk_size(self, minimum, maximum):
+        with self._lock:
+            if self._throughput is not None:
+                target = self._throughput * self.target_seconds
+                self._current_size = min(
+                    max(target, self._current_size / self.max_growth),
+                    self._current_size * self.max_growth,
+                )
+            size = int(self._current_size)
+        return max(minimum, min(size, self.max_chunk_size, maximum))
@@ -0,0 +1,137 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Manage the HTTP connections used to transfer data with the object store.
+
+Requests made to presigned object store URLs by
+:mod:`faculty.datasets.transfer` share a single connection pool, so that
+consecutive parts of a transfer reuse open connections rather than paying for
+a new TCP and TLS handshake each time. This pool is separate from the
+authenticated sessions used by Faculty service clients, as presigned URLs
+must not be sent Faculty credentials.
+"""
+
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+RETRY_STATUS_CODES = frozenset([500, 502, 503, 504])
+RETRY_METHODS = frozenset(["GET", "PUT"])
+
+
+class _ConnectionSettings(object):
+    def __init__(self, pool_size, keep_alive, retries, backoff_factor):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+
+_settings = _ConnectionSettings(
+    DEFAULT_POOL_SIZE, True, DEFAULT_RETRIES, DEFAULT_BACKOFF_FACTOR
+)
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def configure(
+    pool_size=DEFAULT_POOL_SIZE,
+    keep_alive=True,
+    retries=DEFAULT_RETRIES,
+    backoff_factor=DEFAULT_BACKOFF_FACTOR,
+):
+    """Configure the connection pool used for object store requests.
+
+    The current pool is closed and replaced, so this should not be called
+    while transfers are in progress.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        The maximum number of connections to keep open to each host. This
+        should be at least the number of parts or ranges transferred
+        concurrently.
+    keep_alive : bool, optional
+        If False, connections are closed after each request.
+    retries : int, optional
+        The number of times to retry requests that fail to connect or that
+        receive a 5xx response.
+    backoff_factor : float, optional
+        Controls the delay between retries, which is ``backoff_factor * 2 **
+        (retry_number - 1)`` seconds.
+    """
+    global _settings, _session
+    with _lock:
+        _settings = _ConnectionSettings(
+            pool_size, keep_alive, retries, backoff_factor
+        )
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def http_session():
+    """Get the requests session used for object store requests.
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _session, _session_pid
+    with _lock:
+        # Connections must not be shared with a forked child process
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session(_settings)
+            _session_pid = os.getpid()
+        return _session
+
+
+def _build_session(settings):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.pool_size,
+        pool_maxsize=settings.pool_size,
+        max_retries=_retry(settings),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not settings.keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def _retry(settings):
+    kwargs = {
+        "total": settings.retries,
+        "backoff_factor": settings.backoff_factor,
+        "status_forcelist": RETRY_STATUS_CODES,
+        # Return the final response rather than raising, so that callers can
+        # handle errors as for any other response
+        "raise_on_status": False,
+    }
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **kwargs)
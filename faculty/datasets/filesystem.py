@@ -0,0 +1,492 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Access Faculty datasets through `fsspec <https://filesystem-spec.rtfd.io>`_.
+
+With the ``fsspec`` extra of this package installed, libraries built on
+fsspec, such as pandas, dask and pyarrow, can read and write paths of the
+form ``faculty://<project-id>/<path>``:
+
+>>> import pandas
+>>> pandas.read_parquet("faculty://{}/data/table.parquet".format(project_id))
+
+Files opened for reading fetch only the byte ranges that are read, so
+columnar readers download only the parts of a file they need.
+"""
+
+
+import io
+import os
+import posixpath
+import threading
+
+from fsspec.callbacks import DEFAULT_CALLBACK
+from fsspec.spec import AbstractFileSystem
+
+from faculty.clients.object import ObjectClient, PathAlreadyExists
+from faculty.datasets import bulk, listing, remote, transfer
+from faculty.datasets.util import bounded_map, makedirs
+from faculty.session import get_session
+
+
+class FacultyFileSystem(AbstractFileSystem):
+    """An fsspec filesystem for the datasets of Faculty projects.
+
+    Paths start with the ID of the project, as in
+    ``faculty://<project-id>/<path>`` or ``<project-id>/<path>``. Listings
+    are shared with :mod:`faculty.datasets` through the listing cache of the
+    object client.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient, optional
+        The client to access datasets with. Defaults to one using the default
+        session.
+    max_workers : int, optional
+        The number of files to transfer concurrently in :meth:`get` and
+        :meth:`put`.
+    """
+
+    protocol = "faculty"
+    root_marker = ""
+
+    def __init__(
+        self,
+        object_client=None,
+        max_workers=bulk.DEFAULT_MAX_WORKERS,
+        **storage_options
+    ):
+        super(FacultyFileSystem, self).__init__(**storage_options)
+        if object_client is None:
+            object_client = ObjectClient(get_session())
+        self.object_client = object_client
+        self.max_workers = max_workers
+        self._pending = threading.local()
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        if isinstance(path, list):
+            return [cls._strip_protocol(p) for p in path]
+        return super(FacultyFileSystem, cls)._strip_protocol(path).lstrip("/")
+
+    def ls(self, path, detail=True, **kwargs):
+        project_id, datasets_path = self._split(path)
+        prefix = datasets_path.rstrip("/") + "/"
+        objects = listing.list_objects(self.object_client, project_id, prefix)
+
+        entries = {}
+        for obj in objects:
+            relative_path = obj.path[len(prefix) :]
+            if not relative_path:
+                continue
+            name, separator, _ = relative_path.partition("/")
+            if separator:
+                entries[name] = _directory_info(project_id + prefix + name)
+            else:
+                entries[name] = _object_info(project_id, obj)
+
+        if not entries and datasets_path != "/":
+            # Listing a file gives the file itself
+            info = self.info(path)
+            if info["type"] == "file":
+                entries[info["name"]] = info
+
+        infos = [entries[name] for name in sorted(entries)]
+        if detail:
+            return infos
+        return [info["name"] for info in infos]
+
+    def info(self, path, **kwargs):
+        project_id, datasets_path = self._split(path)
+        if datasets_path == "/":
+            return _directory_info(project_id)
+
+        datasets_path = datasets_path.rstrip("/")
+        objects = listing.list_objects(
+            self.object_client, project_id, datasets_path
+        )
+        for obj in objects:
+            if obj.path == datasets_path:
+                return _object_info(project_id, obj)
+        for obj in objects:
+            if obj.path.startswith(datasets_path + "/"):
+                return _directory_info(project_id + datasets_path)
+        raise FileNotFoundError(path)
+
+    def find(self, path, maxdepth=None, withdirs=False, detail=False, **kw):
+        if maxdepth is not None:
+            return super(FacultyFileSystem, self).find(
+                path, maxdepth=maxdepth, withdirs=withdirs, detail=detail, **kw
+            )
+
+        # Everything under a prefix comes from a single listing
+        project_id, datasets_path = self._split(path)
+        prefix = datasets_path.rstrip("/") + "/"
+        objects = listing.list_objects(self.object_client, project_id, prefix)
+
+        infos = {}
+        for obj in objects:
+            if not obj.path.endswith("/"):
+                info = _object_info(project_id, obj)
+                infos[info["name"]] = info
+            if withdirs:
+                directory = posixpath.dirname(obj.path.rstrip("/"))
+                if obj.path.endswith("/"):
+                    directory = obj.path.rstrip("/")
+                while directory.startswith(prefix) and len(directory) > len(
+                    prefix
+                ):
+                    name = project_id + directory
+                    infos.setdefault(name, _directory_info(name))
+                    directory = posixpath.dirname(directory)
+
+        if not objects and datasets_path != "/":
+            try:
+                info = self.info(path)
+            except FileNotFoundError:
+                info = None
+            if info is not None and info["type"] == "file":
+                infos[info["name"]] = info
+
+        if withdirs and objects and datasets_path != "/":
+            name = project_id + datasets_path.rstrip("/")
+            infos.setdefault(name, _directory_info(name))
+
+        names = sorted(infos)
+        if detail:
+            return {name: infos[name] for name in names}
+        return names
+
+    def modified(self, path):
+        return self.info(path)["last_modified"]
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        project_id, datasets_path = self._split(path)
+        if start is None and end is None:
+            return transfer.download(
+                self.object_client, project_id, datasets_path
+            )
+
+        reader = remote.RemoteFileReader(
+            self.object_client, project_id, datasets_path
+        )
+        try:
+            size = reader.size
+            start = _resolve_offset(start, size, default=0)
+            end = _resolve_offset(end, size, default=size)
+            return reader.read_range(start, end)
+        finally:
+            reader.close()
+
+    def pipe_file(self, path, value, **kwargs):
+        project_id, datasets_path = self._split(path)
+        with self._invalidating(project_id, datasets_path):
+            self._create_parent_directories(project_id, datasets_path)
+            transfer.upload(
+                self.object_client, project_id, datasets_path, value
+            )
+
+    def _open(
+        self,
+        path,
+        mode="rb",
+        block_size=None,
+        autocommit=True,
+        cache_options=None,
+        **kwargs
+    ):
+        project_id, datasets_path = self._split(path)
+
+        if mode == "rb":
+            raw = remote.RemoteFileReader(
+                self.object_client,
+                project_id,
+                datasets_path,
+                block_size=block_size or remote.DEFAULT_BLOCK_SIZE,
+            )
+            return remote.wrap_file(raw, mode)
+
+        if mode not in ("wb", "xb"):
+            raise NotImplementedError(
+                "Files can only be opened to read or write"
+            )
+        if not autocommit:
+            raise NotImplementedError("Deferred commits are not supported")
+        if mode == "xb" and self.exists(path):
+            raise FileExistsError(path)
+
+        self._create_parent_directories(project_id, datasets_path)
+        raw = remote.RemoteFileWriter(
+            self.object_client, project_id, datasets_path
+        )
+
+        def invalidate():
+            self.invalidate_cache(path)
+
+        return _InvalidatingWriter(raw, remote.DEFAULT_BUFFER_SIZE, invalidate)
+
+    def mkdir(self, path, create_parents=True, **kwargs):
+        project_id, datasets_path = self._split(path)
+        with self._invalidating(project_id, datasets_path):
+            self.object_client.create_directory(
+                project_id, datasets_path, parents=create_parents
+            )
+
+    def makedirs(self, path, exist_ok=False):
+        try:
+            self.mkdir(path, create_parents=True)
+        except PathAlreadyExists:
+            if not exist_ok:
+                raise FileExistsError(path)
+
+    def rmdir(self, path):
+        if self.ls(path, detail=False):
+            raise OSError("Directory not empty: {}".format(path))
+        project_id, datasets_path = self._split(path)
+        with self._invalidating(project_id, datasets_path):
+            self.object_client.delete(
+                project_id, datasets_path.rstrip("/") + "/", recursive=True
+            )
+
+    def rm_file(self, path):
+        if self.isdir(path):
+            self.rmdir(path)
+            return
+        project_id, datasets_path = self._split(path)
+        with self._invalidating(project_id, datasets_path):
+            self.object_client.delete(project_id, datasets_path)
+
+    def rm(self, path, recursive=False, maxdepth=None):
+        if (
+            isinstance(path, str)
+            and recursive
+            and maxdepth is None
+            and self.isdir(path)
+        ):
+            # Delete the whole directory with a single request
+            project_id, datasets_path = self._split(path)
+            with self._invalidating(project_id, datasets_path):
+                self.object_client.delete(
+                    project_id, datasets_path, recursive=True
+                )
+            return
+        super(FacultyFileSystem, self).rm(
+            path, recursive=recursive, maxdepth=maxdepth
+        )
+
+    def cp_file(self, path1, path2, **kwargs):
+        project_id, source = self._split(path1)
+        destination_project_id, destination = self._split(path2)
+        if destination_project_id != project_id:
+            raise ValueError("Cannot copy files between projects")
+        if self.isdir(path1):
+            self.makedirs(path2, exist_ok=True)
+            return
+        with self._invalidating(project_id, destination):
+            self._create_parent_directories(project_id, destination)
+            self.object_client.copy(project_id, source, destination)
+
+    def get_file(
+        self, rpath, lpath, callback=DEFAULT_CALLBACK, outfile=None, **kwargs
+    ):
+        pending = getattr(self._pending, "transfers", None)
+        if pending is not None and outfile is None:
+            # Called from get, which runs the transfers concurrently
+            pending.append((rpath, lpath))
+            return
+
+        if self.isdir(rpath):
+            if not os.path.isdir(lpath):
+                os.makedirs(lpath)
+            return
+        project_id, datasets_path = self._split(rpath)
+        if outfile is not None:
+            for chunk in transfer.download_stream(
+                self.object_client, project_id, datasets_path
+            ):
+                outfile.write(chunk)
+            return
+        directory = os.path.dirname(lpath)
+        if directory and not os.path.isdir(directory):
+            makedirs(directory)
+        transfer.download_file(
+            self.object_client, project_id, datasets_path, lpath
+        )
+
+    def put_file(self, lpath, rpath, callback=DEFAULT_CALLBACK, **kwargs):
+        pending = getattr(self._pending, "transfers", None)
+        if pending is not None:
+            # Called from put, which runs the transfers concurrently
+            pending.append((lpath, rpath))
+            return
+
+        if os.path.isdir(lpath):
+            self.makedirs(rpath, exist_ok=True)
+            return
+        project_id, datasets_path = self._split(rpath)
+        with self._invalidating(project_id, datasets_path):
+            self._create_parent_directories(project_id, datasets_path)
+            transfer.upload_file(
+                self.object_client, project_id, datasets_path, lpath
+            )
+
+    def get(
+        self,
+        rpath,
+        lpath,
+        recursive=False,
+        callback=DEFAULT_CALLBACK,
+        maxdepth=None,
+        **kwargs
+    ):
+        """Copy files to the local filesystem, several at a time.
+
+        Source and destination paths are resolved as for
+        :meth:`fsspec.spec.AbstractFileSystem.get`.
+        """
+        pairs = self._collect_transfers(
+            super(FacultyFileSystem, self).get,
+            rpath,
+            lpath,
+            recursive=recursive,
+            maxdepth=maxdepth,
+            **kwargs
+        )
+        directories = [pair for pair in pairs if self.isdir(pair[0])]
+        self._transfer_concurrently(
+            self.get_file, pairs, directories, callback, kwargs
+        )
+
+    def put(
+        self,
+        lpath,
+        rpath,
+        recursive=False,
+        callback=DEFAULT_CALLBACK,
+        maxdepth=None,
+        **kwargs
+    ):
+        """Copy files from the local filesystem, several at a time.
+
+        Source and destination paths are resolved as for
+        :meth:`fsspec.spec.AbstractFileSystem.put`.
+        """
+        pairs = self._collect_transfers(
+            super(FacultyFileSystem, self).put,
+            lpath,
+            rpath,
+            recursive=recursive,
+            maxdepth=maxdepth,
+            **kwargs
+        )
+        directories = [pair for pair in pairs if os.path.isdir(pair[0])]
+        self._transfer_concurrently(
+            self.put_file, pairs, directories, callback, kwargs
+        )
+
+    def invalidate_cache(self, path=None):
+        if path is None:
+            listing.listing_cache(self.object_client).clear()
+        else:
+            project_id, datasets_path = self._split(path)
+            listing.listing_cache(self.object_client).invalidate(
+                project_id, datasets_path
+            )
+        super(FacultyFileSystem, self).invalidate_cache(path)
+
+    def _split(self, path):
+        """Split a path into a project ID and an absolute datasets path."""
+        path = self._strip_protocol(path)
+        project_id, _, datasets_path = path.partition("/")
+        if not project_id:
+            raise ValueError(
+                "Paths must start with a project ID, as in "
+                "faculty://<project-id>/<path>"
+            )
+        return project_id, "/" + datasets_path
+
+    def _create_parent_directories(self, project_id, datasets_path):
+        self.object_client.create_directory(
+            project_id, posixpath.dirname(datasets_path), parents=True
+        )
+
+    def _invalidating(self, project_id, datasets_path):
+        return listing.invalidating(
+            self.object_client, project_id, datasets_path
+        )
+
+    def _collect_transfers(self, expand, source, destination, **kwargs):
+        """Resolve the pairs of paths a get or put would transfer."""
+        self._pending.transfers = []
+        try:
+            expand(source, destination, **kwargs)
+            return self._pending.transfers
+        finally:
+            self._pending.transfers = None
+
+    def _transfer_concurrently(
+        self, transfer_file, pairs, directories, callback, kwargs
+    ):
+        callback.set_size(len(pairs))
+
+        # Create directories first, in order, so that files can be
+        # transferred into them in any order
+        for source, destination in directories:
+            transfer_file(source, destination, **kwargs)
+            callback.relative_update(1)
+
+        def run(pair):
+            transfer_file(pair[0], pair[1], **kwargs)
+
+        files = [pair for pair in pairs if pair not in directories]
+        for _ in bounded_map(run, files, self.max_workers):
+            callback.relative_update(1)
+
+
+class _InvalidatingWriter(io.BufferedWriter):
+    """A buffered writer that calls a function once it has been closed."""
+
+    def __init__(self, raw, buffer_size, on_close):
+        super(_InvalidatingWriter, self).__init__(raw, buffer_size)
+        self._on_close = on_close
+
+    def close(self):
+        try:
+            super(_InvalidatingWriter, self).close()
+        finally:
+            self._on_close()
+
+
+def _object_info(project_id, obj):
+    if obj.path.endswith("/"):
+        return _directory_info(project_id + obj.path.rstrip("/"))
+    return {
+        "name": project_id + obj.path,
+        "size": obj.size,
+        "type": "file",
+        "etag": obj.etag,
+        "last_modified": obj.last_modified_at,
+    }
+
+
+def _directory_info(name):
+    return {"name": name, "size": 0, "type": "directory"}
+
+
+def _resolve_offset(offset, size, default):
+    if offset is None:
+        return default
+    if offset < 0:
+        return max(0, size + offset)
+    return offset
@@ -0,0 +1,319 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record the progress of transfers so that they can be resumed."""
+
+
+import os
+import json
+import errno
+import hashlib
+from collections import namedtuple
+
+from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
+from faculty.datasets.util import cache_directory, makedirs
+
+
+UploadState = namedtuple(
+    "UploadState",
+    [
+        "provider",
+        "upload_id",
+        "url",
+        "chunk_size",
+        "completed_parts",
+        "offset",
+    ],
+)
+
+
+DownloadState = namedtuple(
+    "DownloadState", ["etag", "size", "range_size", "completed_ranges"]
+)
+
+
+class _Journal(object):
+    """An append-only file of JSON records, the first being a header."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def remove(self):
+        """Remove the journal, for example once the transfer has completed."""
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _read_records(self):
+        try:
+            with open(self.path, "r") as fp:
+                lines = fp.read().splitlines()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A partially written final line from an interrupted process
+                break
+        return records
+
+    def _start(self, header):
+        makedirs(os.path.dirname(self.path), 0o700)
+        with open(self.path, "w") as fp:
+            fp.write(json.dumps(header) + "\n")
+
+    def _append(self, record):
+        with open(self.path, "a") as fp:
+            fp.write(json.dumps(record) + "\n")
+
+
+class UploadJournal(_Journal):
+    """An on-disk record of the progress of a file upload.
+
+    The journal is a small append-only file. Its first line identifies the
+    upload and the version of the local file being uploaded, and each
+    subsequent line records progress: a completed part for S3 multipart
+    uploads, or the number of bytes sent for GCS resumable uploads.
+
+    Parameters
+    ----------
+    path : str
+        The path of the journal file.
+    fingerprint : list
+        Identifies the version of the local file being uploaded. A journal
+        recorded for a different fingerprint is ignored.
+    """
+
+    def __init__(self, path, fingerprint):
+        super(UploadJournal, self).__init__(path)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def for_file(cls, project_id, datasets_path, local_path, directory=None):
+        """Get the journal for uploading a local file to a datasets path.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        datasets_path : str
+            The target path in the object store
+        local_path : str
+            The local path of the file being uploaded
+        directory : str, optional
+            The directory to store journals in. Defaults to a ``faculty``
+            directory in the user's cache directory.
+
+        Returns
+        -------
+        UploadJournal
+        """
+        local_path = os.path.abspath(str(local_path))
+        path = _journal_path(
+            "upload", project_id, datasets_path, local_path, directory
+        )
+        stat = os.stat(local_path)
+        return cls(path, [stat.st_size, stat.st_mtime])
+
+    def load(self):
+        """Read the state of a previous attempt at the upload.
+
+        Returns
+        -------
+        Optional[UploadState]
+            The recorded state, or None if there is no usable journal.
+        """
+        records = self._read_records()
+        if not records or records[0].get("fingerprint") != self.fingerprint:
+            return None
+
+        header = records[0]
+        completed_parts = []
+        offset = 0
+        for record in records[1:]:
+            if "part_number" in record:
+                completed_parts.append(
+                    CompletedUploadPart(record["part_number"], record["etag"])
+                )
+            elif "offset" in record:
+                offset = record["offset"]
+
+        return UploadState(
+            provider=CloudStorageProvider(header["provider"]),
+            upload_id=header["upload_id"],
+            url=header["url"],
+            chunk_size=header["chunk_size"],
+            completed_parts=completed_parts,
+            offset=offset,
+        )
+
+    def start(self, provider, upload_id, url, chunk_size):
+        """Start a new journal, replacing any existing one.
+
+        Parameters
+        ----------
+        provider : faculty.clients.object.CloudStorageProvider
+        upload_id : str or None
+            The S3 upload ID.
+        url : str or None
+            The GCS resumable upload session URL.
+        chunk_size : int
+            The size of each part of the upload.
+        """
+        self._start(
+            {
+                "fingerprint": self.fingerprint,
+                "provider": provider.value,
+                "upload_id": upload_id,
+                "url": url,
+                "chunk_size": chunk_size,
+            }
+        )
+
+    def record_part(self, completed_part):
+        """Record that a part of an S3 multipart upload has completed.
+
+        Parameters
+        ----------
+        completed_part : faculty.clients.object.CompletedUploadPart
+        """
+        self._append(
+            {
+                "part_number": completed_part.part_number,
+                "etag": completed_part.etag,
+            }
+        )
+
+    def record_offset(self, offset):
+        """Record the number of bytes sent in a GCS resumable upload.
+
+        Parameters
+        ----------
+        offset : int
+        """
+        self._append({"offset": offset})
+
+
+class DownloadJournal(_Journal):
+    """An on-disk record of the progress of a file download.
+
+    The first line of the journal identifies the version of the object being
+    downloaded. When the object is downloaded in byte ranges, each subsequent
+    line records a range that has been written to the local file. The
+    completed ranges are loaded as a mapping from the start of each range to
+    its end, where that was recorded.
+
+    Parameters
+    ----------
+    path : str
+        The path of the journal file.
+    """
+
+    @classmethod
+    def for_file(cls, project_id, datasets_path, local_path, directory=None):
+        """Get the journal for downloading a datasets path to a local file.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        datasets_path : str
+            The source path in the object store
+        local_path : str
+            The local path being downloaded to
+        directory : str, optional
+            The directory to store journals in. Defaults to a ``faculty``
+            directory in the user's cache directory.
+
+        Returns
+        -------
+        DownloadJournal
+        """
+        local_path = os.path.abspath(str(local_path))
+        return cls(
+            _journal_path(
+                "download", project_id, datasets_path, local_path, directory
+            )
+        )
+
+    def load(self):
+        """Read the state of a previous attempt at the download.
+
+        Returns
+        -------
+        Optional[DownloadState]
+            The recorded state, or None if there is no journal.
+        """
+        records = self._read_records()
+        if not records:
+            return None
+        header = records[0]
+        return DownloadState(
+            etag=header["etag"],
+            size=header["size"],
+            range_size=header["range_size"],
+            completed_ranges={
+                record["range_start"]: record.get("range_end")
+                for record in records[1:]
+            },
+        )
+
+    def start(self, etag, size, range_size):
+        """Start a new journal, replacing any existing one.
+
+        Parameters
+        ----------
+        etag : str
+            The ETag of the object being downloaded.
+        size : int
+            The size of the object being downloaded.
+        range_size : int or None
+            The size of the byte ranges the object is downloaded in, 0 if the
+            ranges vary in size, or None if it is downloaded in a single
+            stream.
+        """
+        self._start({"etag": etag, "size": size, "range_size": range_size})
+
+    def record_range(self, range_start, range_end=None):
+        """Record that a byte range has been written to the local file.
+
+        Parameters
+        ----------
+        range_start : int
+            The offset of the start of the range.
+        range_end : int, optional
+            The offset of the last byte of the range.
+        """
+        record = {"range_start": range_start}
+        if range_end is not None:
+            record["range_end"] = range_end
+        self._append(record)
+
+
+def default_journal_directory():
+    """Get the default directory to store transfer journals in."""
+    return cache_directory("transfers")
+
+
+def _journal_path(kind, project_id, datasets_path, local_path, directory):
+    if directory is None:
+        directory = default_journal_directory()
+    key = json.dumps([kind, str(project_id), datasets_path, local_path])
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(directory, digest + ".journal")
@@ -0,0 +1,282 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache listings of datasets to avoid listing the same prefix repeatedly.
+
+Functions in :mod:`faculty.datasets` often list the same prefix several times
+in one operation, for example to check whether a path is a directory or a
+file before transferring it. Listings are cached per object client, so all
+helpers called with the same ``object_client`` share them. A listing is also
+used to answer later lookups of any longer prefix, by filtering its objects.
+
+Cached listings expire after a short time, and are invalidated by writes made
+through :mod:`faculty.datasets`, including uploads with
+:mod:`faculty.datasets.transfer`. Changes made by other clients, or directly
+through the object client, may not be seen until a listing expires, which
+only matters when the same object client is reused across calls.
+"""
+
+
+import contextlib
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer
+
+
+DEFAULT_TTL = 5.0
+DEFAULT_MAX_ENTRIES = 128
+
+
+class ListingCache(object):
+    """Recent listings of prefixes in project datasets.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        The number of seconds for which a listing is used.
+    max_entries : int, optional
+        The number of listings to keep. The least recently used are
+        discarded first.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, project_id, prefix):
+        """Get the cached objects under a prefix, if known.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        prefix : str
+
+        Returns
+        -------
+        Optional[List[faculty.clients.object.Object]]
+            The objects under the prefix, or None if no listing of it, or of
+            any shorter prefix, is cached.
+        """
+        prefix = _normalise(prefix)
+        now = default_timer()
+        with self._lock:
+            for key, (listed_at, objects) in list(self._entries.items()):
+                if now - listed_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                cached_project_id, cached_prefix = key
+                if cached_project_id == project_id and prefix.startswith(
+                    cached_prefix
+                ):
+                    # Mark as most recently used
+                    self._entries[key] = self._entries.pop(key)
+                    if prefix == cached_prefix:
+                        return list(objects)
+                    return [
+                        obj for obj in objects if obj.path.startswith(prefix)
+                    ]
+        return None
+
+    def set(self, project_id, prefix, objects):
+        """Store the complete listing of a prefix.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        prefix : str
+        objects : List[faculty.clients.object.Object]
+        """
+        key = (project_id, _normalise(prefix))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (default_timer(), list(objects))
+            while len(self._entries) > max(0, self.max_entries):
+                self._entries.popitem(last=False)
+
+    def invalidate(self, project_id, path=None):
+        """Forget listings that may be affected by a change to a path.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        path : str, optional
+            The path written to. All listings that could include it, or
+            anything under it, are forgotten. If not given, all listings of
+            the project are forgotten.
+        """
+        if path is not None:
+            path = _normalise(path)
+        with self._lock:
+            for key in list(self._entries):
+                cached_project_id, cached_prefix = key
+                if cached_project_id != project_id:
+                    continue
+                if (
+                    path is None
+                    or path.startswith(cached_prefix)
+                    or cached_prefix.startswith(path)
+                ):
+                    del self._entries[key]
+
+    def clear(self):
+        """Forget all listings."""
+        with self._lock:
+            self._entries.clear()
+
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def listing_cache(object_client):
+    """Get the listing cache shared by users of an object client.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+
+    Returns
+    -------
+    ListingCache
+    """
+    with _caches_lock:
+        cache = _caches.get(object_client)
+        if cache is None:
+            cache = ListingCache()
+            _caches[object_client] = cache
+        return cache
+
+
+@contextlib.contextmanager
+def invalidating(object_client, project_id, path=None):
+    """Forget cached listings affected by writing to a path, once written.
+
+    Listings are also forgotten if the write fails, as it may have partially
+    succeeded.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    path : str, optional
+        The path written to. If not given, all listings of the project are
+        forgotten.
+    """
+    try:
+        yield
+    finally:
+        listing_cache(object_client).invalidate(project_id, path)
+
+
+def list_objects(object_client, project_id, prefix):
+    """List all objects under a prefix, using the cache where possible.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    prefix : str
+
+    Returns
+    -------
+    List[faculty.clients.object.Object]
+    """
+    cache = listing_cache(object_client)
+    objects = cache.get(project_id, prefix)
+    if objects is not None:
+        return objects
+
+    list_response = object_client.list(project_id, prefix)
+    objects = list(list_response.objects)
+    while list_response.next_page_token is not None:
+        list_response = object_client.list(
+            project_id, prefix, list_response.next_page_token
+        )
+        objects += list_response.objects
+
+    cache.set(project_id, prefix, objects)
+    return objects
+
+
+def iter_objects(object_client, project_id, prefix, prefetch=True):
+    """Iterate over the objects under a prefix, one page at a time.
+
+    Unlike :func:`list_objects`, pages are not collected into a list, so
+    that objects can be processed as soon as the first page arrives, and
+    listings of very many objects do not need to fit in memory. Listings
+    made this way are not cached, but a cached listing is used if there is
+    one.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    prefix : str
+    prefetch : bool, optional
+        If True, request the next page on a background thread while the
+        objects of the current page are being consumed.
+
+    Returns
+    -------
+    Iterator[faculty.clients.object.Object]
+    """
+    objects = listing_cache(object_client).get(project_id, prefix)
+    if objects is not None:
+        for obj in objects:
+            yield obj
+        return
+
+    if not prefetch:
+        list_response = object_client.list(project_id, prefix)
+        for obj in list_response.objects:
+            yield obj
+        while list_response.next_page_token is not None:
+            list_response = object_client.list(
+                project_id, prefix, list_response.next_page_token
+            )
+            for obj in list_response.objects:
+                yield obj
+        return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    next_page = None
+    try:
+        list_response = object_client.list(project_id, prefix)
+        while True:
+            if list_response.next_page_token is not None:
+                next_page = executor.submit(
+                    object_client.list,
+                    project_id,
+                    prefix,
+                    list_response.next_page_token,
+                )
+            for obj in list_response.objects:
+                yield obj
+            if next_page is None:
+                break
+            list_response = next_page.result()
+            next_page = None
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+        # Don't wait for a page that will never be consumed
+        executor.shutdown(wait=False)
+
+
+def _normalise(path):
+    return "/" + path.lstrip("/")
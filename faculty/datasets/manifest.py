@@ -0,0 +1,129 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Remember which files were in sync when a directory was last synced."""
+
+
+import os
+import json
+import errno
+import hashlib
+from collections import namedtuple
+
+from faculty.datasets.util import cache_directory, makedirs, replace
+
+
+ManifestEntry = namedtuple("ManifestEntry", ["size", "mtime", "etag"])
+ManifestEntry.__doc__ = """A file as it was when it was last synced.
+
+Parameters
+----------
+size : int
+    The size of the local file.
+mtime : float
+    The modification time of the local file.
+etag : str
+    The ETag of the object in datasets.
+"""
+
+
+class SyncManifest(object):
+    """An on-disk record of the files in sync between two directories.
+
+    After each sync, the size and modification time of each local file are
+    stored along with the ETag of the corresponding object in datasets. If
+    neither has changed by the next sync, the file can be skipped without
+    comparing timestamps; if either has, the file is transferred even when
+    timestamps alone would suggest otherwise.
+
+    Parameters
+    ----------
+    path : str
+        The path of the manifest file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+    @classmethod
+    def for_directories(
+        cls, project_id, project_path, local_path, directory=None
+    ):
+        """Get the manifest for syncing a local and a datasets directory.
+
+        The same manifest is used whichever direction the directories are
+        synced in.
+
+        Parameters
+        ----------
+        project_id : uuid.UUID
+        project_path : str
+            The directory in the project's datasets
+        local_path : str
+            The local directory
+        directory : str, optional
+            The directory to store manifests in. Defaults to a ``faculty``
+            directory in the user's cache directory.
+
+        Returns
+        -------
+        SyncManifest
+        """
+        if directory is None:
+            directory = default_manifest_directory()
+        key = json.dumps(
+            [str(project_id), project_path, os.path.abspath(str(local_path))]
+        )
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return cls(os.path.join(directory, digest + ".json"))
+
+    def load(self):
+        """Read the manifest from disk, if it exists."""
+        try:
+            with open(self.path, "r") as fp:
+                data = json.load(fp)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        except ValueError:
+            # A corrupt manifest only means that files are compared by
+            # timestamp instead
+            return
+        self.entries = {
+            relative_path: ManifestEntry(*entry)
+            for relative_path, entry in data.get("files", {}).items()
+        }
+
+    def save(self):
+        """Write the manifest to disk, replacing any previous version."""
+        makedirs(os.path.dirname(self.path), 0o700)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as fp:
+            json.dump(
+                {
+                    "files": {
+                        relative_path: list(entry)
+                        for relative_path, entry in self.entries.items()
+                    }
+                },
+                fp,
+            )
+        replace(temporary_path, self.path)
+
+
+def default_manifest_directory():
+    """Get the default directory to store sync manifests in."""
+    return cache_directory("sync")
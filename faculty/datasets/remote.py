@@ -0,0 +1,496 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""File objects that read and write datasets directly in the object store."""
+
+
+import io
+import collections
+import threading
+
+import six
+from six.moves import queue
+
+from faculty.datasets import throttle, transfer
+from faculty.datasets.chunking import FixedChunkSize
+from faculty.datasets.connection import http_session
+from faculty.datasets.transfer import (
+    KILOBYTE,
+    MEGABYTE,
+    check_version,
+    get_object,
+)
+from faculty.datasets.util import DatasetsError
+
+
+DEFAULT_BLOCK_SIZE = 1 * MEGABYTE
+DEFAULT_CACHE_BLOCKS = 32
+DEFAULT_MAX_READ_AHEAD = 16
+
+DEFAULT_BUFFER_SIZE = 64 * KILOBYTE
+
+DEFAULT_MAX_PENDING_PARTS = 2
+
+
+class RemoteFileReader(io.RawIOBase):
+    """A seekable, read-only file backed by HTTP range requests.
+
+    Reads fetch only the blocks of the object that they cover, and keep them
+    in a least-recently-used cache. While the file is read sequentially, each
+    request fetches a growing number of blocks ahead of the current position,
+    so that sequential reads need few requests, while random access does not
+    download more than it needs. Requests are conditional on the ETag of the
+    object when the file was opened, so reads raise an error rather than mix
+    in content from a newer version of the object.
+
+    This is a raw, unbuffered stream; wrap it in :class:`io.BufferedReader`
+    for efficient small reads, or :class:`io.TextIOWrapper` to read text.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The path of the object to read
+    block_size : int, optional
+        The size of the blocks the object is fetched and cached in
+    cache_blocks : int, optional
+        The maximum number of blocks to keep in memory
+    max_read_ahead : int, optional
+        The maximum number of blocks to fetch in a single request during
+        sequential reads
+    """
+
+    def __init__(
+        self,
+        object_client,
+        project_id,
+        datasets_path,
+        block_size=DEFAULT_BLOCK_SIZE,
+        cache_blocks=DEFAULT_CACHE_BLOCKS,
+        max_read_ahead=DEFAULT_MAX_READ_AHEAD,
+    ):
+        super(RemoteFileReader, self).__init__()
+        self.object_client = object_client
+        self.project_id = project_id
+        self.datasets_path = datasets_path
+        self.block_size = block_size
+        self.cache_blocks = max(1, cache_blocks)
+        self.max_read_ahead = max(1, max_read_ahead)
+
+        obj = get_object(object_client, project_id, datasets_path)
+        self.size = obj.size
+        self.etag = obj.etag
+        self._url = None
+        self._position = 0
+        self._blocks = collections.OrderedDict()
+        self._last_block = None
+        self._read_ahead = 1
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._check_not_closed()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._check_not_closed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        self._check_not_closed()
+        target = memoryview(buffer)
+        if six.PY3:
+            target = target.cast("B")
+        num_bytes = min(len(target), self.size - self._position)
+        if num_bytes <= 0:
+            return 0
+
+        first_block = self._position // self.block_size
+        last_block = (self._position + num_bytes - 1) // self.block_size
+        blocks = self._get_blocks(first_block, last_block)
+
+        written = 0
+        while written < num_bytes:
+            position = self._position + written
+            block = blocks[position // self.block_size]
+            start = position % self.block_size
+            piece = block[start : start + num_bytes - written]
+            target[written : written + len(piece)] = piece
+            written += len(piece)
+
+        self._position += num_bytes
+        return num_bytes
+
+    def readall(self):
+        # Read the rest of the object in one go rather than in small reads
+        return self.read(max(0, self.size - self._position))
+
+    def read_range(self, start, end):
+        """Read a range of the file with a single request.
+
+        The block cache and the position of the file are not used, so this
+        suits reading one known range, like the footer of a columnar file.
+
+        Parameters
+        ----------
+        start : int
+            The offset of the first byte to read
+        end : int
+            The offset after the last byte to read. Ranges past the end of the
+            file are truncated.
+
+        Returns
+        -------
+        bytes
+        """
+        self._check_not_closed()
+        end = min(end, self.size)
+        if start >= end:
+            return b""
+        return self._request_range(start, end - 1)
+
+    def close(self):
+        self._blocks.clear()
+        super(RemoteFileReader, self).close()
+
+    def _check_not_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _get_blocks(self, first_block, last_block):
+        """Get the content of a range of blocks, fetching any not cached."""
+        if self._last_block is not None and first_block in (
+            self._last_block,
+            self._last_block + 1,
+        ):
+            # Sequential access, so fetch further ahead each time
+            self._read_ahead = min(self._read_ahead * 2, self.max_read_ahead)
+        else:
+            self._read_ahead = 1
+        self._last_block = last_block
+
+        blocks = {}
+        missing = []
+        for index in range(first_block, last_block + 1):
+            if index in self._blocks:
+                self._blocks[index] = self._blocks.pop(index)
+                blocks[index] = self._blocks[index]
+            else:
+                missing.append(index)
+
+        if missing:
+            num_blocks = int(
+                (self.size + self.block_size - 1) // self.block_size
+            )
+            fetch_until = min(
+                max(missing[-1], first_block + self._read_ahead - 1),
+                num_blocks - 1,
+            )
+            for run_start, run_end in _missing_runs(
+                missing[0], fetch_until, self._blocks
+            ):
+                fetched = self._fetch(run_start, run_end)
+                blocks.update(fetched)
+                self._cache(fetched)
+
+        return blocks
+
+    def _cache(self, blocks):
+        for index in sorted(blocks):
+            self._blocks[index] = blocks[index]
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+
+    def _fetch(self, first_block, last_block):
+        start = first_block * self.block_size
+        end = min((last_block + 1) * self.block_size, self.size) - 1
+        content = self._request_range(start, end)
+        if len(content) != end + 1 - start:
+            raise DatasetsError(
+                "Incomplete read of {} in project {}".format(
+                    self.datasets_path, self.project_id
+                )
+            )
+        blocks = {}
+        for index in range(first_block, last_block + 1):
+            offset = (index - first_block) * self.block_size
+            blocks[index] = content[offset : offset + self.block_size]
+        return blocks
+
+    def _request_range(self, start, end, retry_expired=True):
+        if self._url is None:
+            self._url = self.object_client.presign_download(
+                self.project_id, self.datasets_path
+            )
+        # Blocks of another version of the object must not be mixed in
+        headers = {
+            "Range": "bytes={}-{}".format(start, end),
+            "If-Match": self.etag,
+        }
+        response = http_session().get(self._url, headers=headers)
+        if response.status_code == 403 and retry_expired:
+            # The presigned URL has expired, so get a new one
+            self._url = None
+            return self._request_range(start, end, retry_expired=False)
+        check_version(response, self.project_id, self.datasets_path, self.size)
+        if response.status_code != 206:
+            raise DatasetsError(
+                "Object store did not honour range request for {} in "
+                "project {}".format(self.datasets_path, self.project_id)
+            )
+        content = response.content
+        throttle.global_limiter().acquire(len(content))
+        return content
+
+
+class RemoteFileWriter(io.RawIOBase):
+    """A write-only file that streams its content to the object store.
+
+    Written data is collected into parts, which are passed to an upload
+    running in a background thread. The upload starts when the file is
+    created, and writes block while ``max_pending_parts`` parts are waiting
+    to be sent, so memory use is bounded however much is written. Closing the
+    file sends the remaining data and completes the upload, after which the
+    object appears in the datasets.
+
+    Call :meth:`abort` instead of closing the file to stop the upload without
+    creating the object. Parts of an aborted S3 multipart upload that were
+    already sent are not visible, and are cleaned up by the object store.
+
+    An error in the upload is raised by the next call to :meth:`write` or
+    :meth:`close`.
+
+    This is a raw, unbuffered stream; wrap it in :class:`io.BufferedWriter`
+    for efficient small writes, or :class:`io.TextIOWrapper` to write text.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The path of the object to write
+    part_size : int, optional
+        The amount of data to collect before passing it to the upload.
+        Defaults to ``faculty.datasets.transfer.DEFAULT_CHUNK_SIZE``.
+    max_pending_parts : int, optional
+        The maximum number of parts waiting to be uploaded
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of the parts sent to the object store. Parts grow as
+        needed to fit data of any size into the provider's part limit.
+    """
+
+    def __init__(
+        self,
+        object_client,
+        project_id,
+        datasets_path,
+        part_size=None,
+        max_pending_parts=DEFAULT_MAX_PENDING_PARTS,
+        max_workers=transfer.DEFAULT_MAX_WORKERS,
+        chunk_policy=None,
+    ):
+        super(RemoteFileWriter, self).__init__()
+        self.object_client = object_client
+        self.project_id = project_id
+        self.datasets_path = datasets_path
+        self.part_size = part_size or transfer.DEFAULT_CHUNK_SIZE
+        self.max_workers = max_workers
+        self.chunk_policy = chunk_policy or FixedChunkSize(
+            transfer.DEFAULT_CHUNK_SIZE
+        )
+
+        self._buffer = bytearray()
+        self._parts = queue.Queue(maxsize=max(1, max_pending_parts))
+        self._error = None
+        self._thread = threading.Thread(target=self._upload)
+        # Do not keep the interpreter alive if the file is never closed
+        self._thread.daemon = True
+        self._thread.start()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._check_not_closed()
+        self._check_upload()
+        data = memoryview(data)
+        if six.PY3:
+            data = data.cast("B")
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._send(part)
+        return len(data)
+
+    def close(self):
+        """Send any remaining data and complete the upload."""
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._send(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._send(_END_OF_FILE)
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+        finally:
+            super(RemoteFileWriter, self).close()
+
+    def abort(self):
+        """Stop the upload without creating the object, and close the file."""
+        if self.closed:
+            return
+        self._buffer = bytearray()
+        # Discard parts not yet sent, so that the upload sees the abort next
+        while True:
+            try:
+                self._parts.get_nowait()
+            except queue.Empty:
+                break
+        self._send(_ABORT)
+        self._thread.join()
+        super(RemoteFileWriter, self).close()
+
+    def _check_not_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _check_upload(self):
+        if self._error is not None:
+            raise self._error
+        if not self._thread.is_alive():
+            raise DatasetsError(
+                "Upload of {} in project {} has stopped".format(
+                    self.datasets_path, self.project_id
+                )
+            )
+
+    def _send(self, item):
+        while True:
+            try:
+                self._parts.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                # Avoid waiting forever for an upload that has failed
+                if not self._thread.is_alive():
+                    if item is _ABORT:
+                        return
+                    self._check_upload()
+
+    def _content(self):
+        while True:
+            item = self._parts.get()
+            if item is _END_OF_FILE:
+                return
+            elif item is _ABORT:
+                raise _UploadAborted()
+            yield item
+
+    def _upload(self):
+        try:
+            transfer.upload_stream(
+                self.object_client,
+                self.project_id,
+                self.datasets_path,
+                self._content(),
+                max_workers=self.max_workers,
+                chunk_policy=self.chunk_policy,
+            )
+        except _UploadAborted:
+            pass
+        except Exception as err:
+            self._error = err
+
+
+_END_OF_FILE = object()
+_ABORT = object()
+
+
+class _UploadAborted(Exception):
+    pass
+
+
+def wrap_file(
+    raw, mode, buffering=-1, encoding=None, errors=None, newline=None
+):
+    """Wrap a raw remote file in buffering and text layers like io.open.
+
+    Parameters
+    ----------
+    raw : io.RawIOBase
+        The raw file to wrap
+    mode : str
+        The mode the file was opened in. Unless it contains 'b', the file is
+        wrapped to read or write text.
+    buffering : int, optional
+        The size of the buffer. Pass 0 to get the raw file back, which is only
+        allowed in binary mode.
+    encoding, errors, newline : str, optional
+        As for :func:`io.open`, in text mode.
+
+    Returns
+    -------
+    io.IOBase
+    """
+    binary = "b" in mode
+    if buffering == 0:
+        if not binary:
+            raise ValueError("can't have unbuffered text I/O")
+        return raw
+    if buffering < 0 or buffering == 1:
+        buffering = DEFAULT_BUFFER_SIZE
+    if raw.readable():
+        buffered = io.BufferedReader(raw, buffering)
+    else:
+        buffered = io.BufferedWriter(raw, buffering)
+    if binary:
+        return buffered
+    return io.TextIOWrapper(
+        buffered, encoding=encoding, errors=errors, newline=newline
+    )
+
+
+def _missing_runs(first_block, last_block, cached):
+    """Group the blocks in a range that are not cached into contiguous runs."""
+    run_start = None
+    for index in range(first_block, last_block + 1):
+        if index in cached:
+            if run_start is not None:
+                yield run_start, index - 1
+                run_start = None
+        elif run_start is None:
+            run_start = index
+    if run_start is not None:
+        yield run_start, last_block
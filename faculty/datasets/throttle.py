@@ -0,0 +1,213 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Limit the bandwidth used by transfers with the object store.
+
+A :class:`RateLimiter` is a token bucket, refilled at a set number of bytes
+per second. Transfers take tokens for each piece of data before sending or
+after receiving it, and wait when the bucket is empty. Waiting transfers are
+served in turn, one piece at a time, so that concurrent transfers share the
+bandwidth fairly, and the bucket only holds a fraction of a second's worth of
+tokens, so that throughput stays close to the limit rather than bursting.
+
+Transfers in :mod:`faculty.datasets.transfer` share one limiter for the whole
+process, which does not limit bandwidth until a limit is set:
+
+>>> from faculty.datasets import throttle
+>>> throttle.set_bandwidth_limit(10 * 1024 * 1024)  # 10 MiB/s
+
+The limit can be changed or removed at any time. Transfers in progress
+follow the new limit from their next piece of data.
+"""
+
+
+import io
+import threading
+from collections import deque
+from timeit import default_timer
+
+
+# The tokens a bucket holds, in seconds of transfer at its rate
+DEFAULT_BURST_SECONDS = 0.1
+MIN_BURST = 64 * 1024
+
+# Transfers take their turn to wait for tokens for this much data at a time
+PIECE_SIZE = 64 * 1024
+
+
+class RateLimiter(object):
+    """A token bucket limiting the rate at which bytes are transferred.
+
+    Parameters
+    ----------
+    rate : float, optional
+        The number of bytes per second to allow. If not given, the rate is
+        not limited.
+    burst : int, optional
+        The number of bytes that can be transferred at once after a pause.
+        Defaults to a tenth of a second's worth.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._tokens = 0.0
+        self._updated_at = default_timer()
+        self._rate = None
+        self._burst = None
+        self.set_rate(rate, burst)
+
+    @property
+    def rate(self):
+        """The number of bytes per second allowed, or None if unlimited."""
+        return self._rate
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate, including while transfers are in progress.
+
+        Parameters
+        ----------
+        rate : float or None
+            The number of bytes per second to allow, or None to not limit
+            the rate.
+        burst : int, optional
+            The number of bytes that can be transferred at once after a
+            pause.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._condition:
+            self._refill()
+            self._rate = rate
+            if rate is None:
+                self._burst = None
+                self._tokens = 0.0
+            else:
+                if burst is None:
+                    burst = max(MIN_BURST, rate * DEFAULT_BURST_SECONDS)
+                self._burst = burst
+                self._tokens = min(self._tokens, burst)
+            self._condition.notify_all()
+
+    def acquire(self, num_bytes):
+        """Wait until a number of bytes may be transferred.
+
+        Parameters
+        ----------
+        num_bytes : int
+        """
+        while num_bytes > 0 and self._rate is not None:
+            piece = min(num_bytes, PIECE_SIZE)
+            self._acquire_piece(piece)
+            num_bytes -= piece
+
+    def _acquire_piece(self, num_bytes):
+        turn = object()
+        with self._condition:
+            self._waiting.append(turn)
+            try:
+                while self._rate is not None:
+                    timeout = None
+                    if self._waiting[0] is turn:
+                        self._refill()
+                        if self._tokens >= 0:
+                            # Let the bucket go into debt, so that a piece
+                            # larger than the burst can still be taken
+                            self._tokens -= num_bytes
+                            return
+                        timeout = -self._tokens / self._rate
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(turn)
+                self._condition.notify_all()
+
+    def _refill(self):
+        now = default_timer()
+        if self._rate is not None:
+            self._tokens = min(
+                self._burst,
+                self._tokens + (now - self._updated_at) * self._rate,
+            )
+        self._updated_at = now
+
+
+class ThrottledReader(object):
+    """A file-like view of bytes, read no faster than a limiter allows.
+
+    Passing this as the body of a request sends its content at the limited
+    rate. It can be rewound, so that the request can be retried.
+
+    Parameters
+    ----------
+    data : bytes-like
+    rate_limiter : RateLimiter
+    """
+
+    def __init__(self, data, rate_limiter):
+        self._data = memoryview(data)
+        self._position = 0
+        self.rate_limiter = rate_limiter
+
+    def __len__(self):
+        return len(self._data)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data) - self._position
+        piece = self._data[self._position : self._position + size]
+        self.rate_limiter.acquire(len(piece))
+        self._position += len(piece)
+        return piece.tobytes()
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._data) + offset
+        else:
+            raise ValueError("invalid whence ({})".format(whence))
+        self._position = max(0, min(position, len(self._data)))
+        return self._position
+
+
+_global_limiter = RateLimiter()
+
+
+def global_limiter():
+    """Get the rate limiter shared by all transfers in this process.
+
+    Returns
+    -------
+    RateLimiter
+    """
+    return _global_limiter
+
+
+def set_bandwidth_limit(rate, burst=None):
+    """Limit the bandwidth used by all transfers in this process.
+
+    Parameters
+    ----------
+    rate : float or None
+        The number of bytes per second to allow, shared between uploads and
+        downloads, or None to remove the limit.
+    burst : int, optional
+        The number of bytes that can be transferred at once after a pause.
+    """
+    _global_limiter.set_rate(rate, burst)
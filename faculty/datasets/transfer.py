@@ -17,11 +17,40 @@
 
 import os
 import math
+import uuid
+import errno
+import itertools
+import mmap
+import threading
+import contextlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from timeit import default_timer
 
 import requests
 
+from faculty.clients.base import NotFound
 from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
-from faculty.datasets.util import DatasetsError
+from faculty.datasets import listing, throttle
+from faculty.datasets.checksum import (
+    MultipartChecksum,
+    etag_matches,
+    normalise_etag,
+    response_md5,
+)
+from faculty.datasets.chunking import FixedChunkSize
+from faculty.datasets.connection import http_session
+from faculty.datasets.journal import (
+    DownloadJournal,
+    UploadJournal,
+    UploadState,
+)
+from faculty.datasets.util import (
+    ChecksumMismatch,
+    DatasetsError,
+    Rechunker,
+    bounded_map,
+    replace,
+)
 
 KILOBYTE = 1024
 MEGABYTE = 1024 * KILOBYTE
@@ -29,8 +58,21 @@ GIGABYTE = 1024 * MEGABYTE
 
 S3_MAX_CHUNKS = 10000
 DEFAULT_CHUNK_SIZE = 5 * MEGABYTE
+MAX_CHUNK_SIZE = 5 * GIGABYTE
+GCS_CHUNK_MULTIPLE = 256 * KILOBYTE
 
 FILE_CHUNK_SIZE = 5 * MEGABYTE
+# A multiple of the default part size, so that parts rarely span windows
+FILE_MAP_WINDOW_SIZE = 8 * DEFAULT_CHUNK_SIZE
+
+DEFAULT_MAX_WORKERS = 1
+
+PRESIGN_BATCH_SIZE = 100
+
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 256 * KILOBYTE
+DEFAULT_DOWNLOAD_MANY_WORKERS = 8
+DEFAULT_RANGE_SIZE = 8 * MEGABYTE
+MIN_RANGE_SIZE = 1 * MEGABYTE
 
 
 def download(object_client, project_id, datasets_path):
@@ -52,7 +94,13 @@ def download(object_client, project_id, datasets_path):
     return b"".join(chunk_generator)
 
 
-def download_stream(object_client, project_id, datasets_path):
+def download_stream(
+    object_client,
+    project_id,
+    datasets_path,
+    chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    rate_limiter=None,
+):
     """Stream the contents of file from the object store.
 
     Parameters
@@ -61,6 +109,11 @@ def download_stream(object_client, project_id, datasets_path):
     project_id : uuid.UUID
     datasets_path : str
         The target path to download to in the object store
+    chunk_size : int, optional
+        The maximum size of each chunk read from the response
+    rate_limiter : faculty.datasets.throttle.RateLimiter, optional
+        Limits the rate the file is downloaded at. Defaults to the limiter
+        shared by all transfers in this process.
 
     Returns
     -------
@@ -68,25 +121,123 @@ def download_stream(object_client, project_id, datasets_path):
         The content of the file, chunked
     """
 
+    rate_limiter = _rate_limiter(rate_limiter)
     url = object_client.presign_download(project_id, datasets_path)
 
-    with requests.get(url, stream=True) as response:
-
-        if response.status_code == 404:
-            raise DatasetsError(
-                "No such object {} in project {}".format(
-                    datasets_path, project_id
-                )
-            )
+    with http_session().get(url, stream=True) as response:
 
-        response.raise_for_status()
+        check_download_status(response, project_id, datasets_path)
 
-        for chunk in response.iter_content(chunk_size=KILOBYTE):
+        for chunk in response.iter_content(chunk_size=chunk_size):
             if chunk:  # Filter out keep-alive chunks
+                rate_limiter.acquire(len(chunk))
                 yield chunk
 
 
-def download_file(object_client, project_id, datasets_path, local_path):
+def download_many(
+    object_client,
+    project_id,
+    datasets_paths,
+    max_workers=DEFAULT_DOWNLOAD_MANY_WORKERS,
+):
+    """Download the contents of many files from the object store concurrently.
+
+    Each worker presigns and downloads one file at a time. Paths are drawn
+    from ``datasets_paths`` only as workers become free, so it may be a
+    generator over very many paths. When the object store gives the size of
+    a file, its content is read straight into a buffer of that size, rather
+    than collected in chunks and joined.
+
+    Iteration stops with the error of the first download to fail, such as a
+    :class:`faculty.datasets.util.DatasetsError` if a file does not exist.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_paths : Iterable[str]
+        The paths of the files to download
+    max_workers : int, optional
+        The number of files to download concurrently
+
+    Returns
+    -------
+    Iterator[Tuple[str, bytearray]]
+        The path and content of each file, in the order their downloads
+        complete
+    """
+
+    def download_content(datasets_path):
+        url = object_client.presign_download(project_id, datasets_path)
+        with http_session().get(url, stream=True) as response:
+            check_download_status(response, project_id, datasets_path)
+            content = _read_content(response, project_id, datasets_path)
+        return datasets_path, content
+
+    max_workers = max(1, max_workers)
+    datasets_paths = iter(datasets_paths)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        while True:
+            for datasets_path in itertools.islice(
+                datasets_paths, max_workers - len(pending)
+            ):
+                pending.add(executor.submit(download_content, datasets_path))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _read_content(response, project_id, datasets_path):
+    """Read the whole body of a streamed response."""
+    rate_limiter = throttle.global_limiter()
+    length = response.headers.get("Content-Length", "")
+    encoding = response.headers.get("Content-Encoding", "identity")
+    if not length.isdigit() or encoding != "identity":
+        # The size of the decoded content is not known in advance
+        content = bytearray()
+        for chunk in response.iter_content(DEFAULT_DOWNLOAD_CHUNK_SIZE):
+            rate_limiter.acquire(len(chunk))
+            content += chunk
+        return content
+
+    content = bytearray(int(length))
+    view = memoryview(content)
+    offset = 0
+    while offset < len(content):
+        # Read a chunk at a time, so that the rate limit is applied evenly
+        read = response.raw.readinto(
+            view[offset : offset + DEFAULT_DOWNLOAD_CHUNK_SIZE]
+        )
+        if not read:
+            raise DatasetsError(
+                "Download of {} in project {} ended early".format(
+                    datasets_path, project_id
+                )
+            )
+        rate_limiter.acquire(read)
+        offset += read
+    return content
+
+
+def download_file(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    resume=False,
+    chunk_policy=None,
+    verify=False,
+):
     """Download a file from the object store.
 
     Parameters
@@ -97,18 +248,587 @@ def download_file(object_client, project_id, datasets_path, local_path):
         The target path to download to in the object store
     local_path : str
         The local path of the object to download
+    max_workers : int, optional
+        The number of byte ranges of the object to download concurrently.
+        When greater than 1, the file is split into ranges of
+        ``DEFAULT_RANGE_SIZE`` bytes which are written directly into place in
+        the local file.
+    chunk_size : int, optional
+        The maximum size of each chunk read from a response
+    resume : bool, optional
+        If True, record the progress of the download in a journal on local
+        disk. If an earlier download of the same object to the same local
+        path was interrupted, it is continued from where it stopped, provided
+        the object's ETag has not changed since. Otherwise, the download
+        starts again from the beginning.
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of each byte range when the file is downloaded in
+        ranges, in place of ``DEFAULT_RANGE_SIZE``, and is told how long each
+        range took to download.
+    verify : bool, optional
+        If True, compute the MD5 of the file as it is downloaded, and raise
+        a :class:`faculty.datasets.util.ChecksumMismatch` if it does not
+        match the one reported by the object store. Only files downloaded in
+        a single request can be verified. Files uploaded to S3 in parts can
+        only be verified if the parts were of the size this library uses.
+        See :mod:`faculty.datasets.checksum`.
+
+    Raises
+    ------
+    ValueError
+        If ``verify`` is set for a download that is resumable or split into
+        ranges, which cannot be verified.
+    faculty.datasets.util.DatasetsError
+        If ``verify`` is set and the checksum of the object cannot be
+        compared with that of the file.
     """
 
-    # Initiate the download to allow any failures to happen before opening the
-    # file
-    stream = download_stream(object_client, project_id, datasets_path)
+    local_path = str(local_path)
 
-    with open(str(local_path), "wb") as fp:
-        for chunk in stream:
-            fp.write(chunk)
+    if resume and verify:
+        raise ValueError("Resumable downloads cannot be verified")
 
+    if resume:
+        _download_file_resumable(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+        )
+    elif max_workers > 1:
+        obj = get_object(object_client, project_id, datasets_path)
+        if obj.size <= DEFAULT_RANGE_SIZE:
+            # Not worth splitting into ranges
+            download_file(
+                object_client,
+                project_id,
+                datasets_path,
+                local_path,
+                chunk_size=chunk_size,
+                verify=verify,
+            )
+        elif verify:
+            raise ValueError(
+                "Downloads split into ranges cannot be verified; "
+                "use max_workers=1"
+            )
+        else:
+            download_file_ranged(
+                object_client,
+                project_id,
+                datasets_path,
+                local_path,
+                obj.size,
+                max_workers,
+                chunk_size,
+                chunk_policy,
+                etag=obj.etag,
+            )
+    elif verify:
+        _download_file_verified(
+            object_client, project_id, datasets_path, local_path, chunk_size
+        )
+    else:
+        # Initiate the download to allow any failures to happen before
+        # opening the file
+        stream = download_stream(
+            object_client, project_id, datasets_path, chunk_size
+        )
+
+        with open(local_path, "wb") as fp:
+            for chunk in stream:
+                fp.write(chunk)
+
+
+def _download_file_verified(
+    object_client, project_id, datasets_path, local_path, chunk_size
+):
+    url = object_client.presign_download(project_id, datasets_path)
+
+    with http_session().get(url, stream=True) as response:
+        check_download_status(response, project_id, datasets_path)
+        if "Content-Length" in response.headers:
+            size = int(response.headers["Content-Length"])
+        else:
+            size = get_object(object_client, project_id, datasets_path).size
+        # Objects uploaded in parts by this library have parts of this size
+        checksum = MultipartChecksum(
+            upload_chunk_size(CloudStorageProvider.S3, size)
+        )
+        rate_limiter = throttle.global_limiter()
+        with open(local_path, "wb") as fp:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                rate_limiter.acquire(len(chunk))
+                checksum.update(chunk)
+                fp.write(chunk)
+        expected = response_md5(response.headers)
+        if expected is not None:
+            matches = expected == checksum.hexdigest()
+        else:
+            matches = etag_matches(response.headers.get("ETag", ""), checksum)
+
+    if matches is None:
+        raise DatasetsError(
+            "{} in project {} was not uploaded in parts of a known size, so "
+            "it cannot be verified".format(datasets_path, project_id)
+        )
+    elif not matches:
+        raise ChecksumMismatch(
+            "Checksum of {} in project {} does not match its "
+            "content".format(datasets_path, project_id)
+        )
+
+
+def _download_file_resumable(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers,
+    chunk_size,
+    chunk_policy,
+):
+
+    journal = DownloadJournal.for_file(project_id, datasets_path, local_path)
+    try:
+        _continue_download(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+            journal,
+        )
+    except _ObjectChanged:
+        # The object was replaced since the download started, so what has
+        # been downloaded so far is of no use
+        _continue_download(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+            journal,
+            restart=True,
+        )
+    journal.remove()
+
+
+def _continue_download(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers,
+    chunk_size,
+    chunk_policy,
+    journal,
+    restart=False,
+):
 
-def upload(object_client, project_id, datasets_path, content):
+    obj = get_object(object_client, project_id, datasets_path)
+    ranged = max_workers > 1 and obj.size > DEFAULT_RANGE_SIZE
+    if not ranged:
+        range_size = None
+    elif chunk_policy is not None:
+        range_size = 0
+    else:
+        range_size = DEFAULT_RANGE_SIZE
+
+    state = None if restart else journal.load()
+    if (
+        state is None
+        or state.etag != obj.etag
+        or state.size != obj.size
+        or state.range_size != range_size
+        or not os.path.isfile(local_path)
+    ):
+        # Nothing usable has been downloaded yet, or the object has changed
+        # since, so start from scratch
+        journal.start(obj.etag, obj.size, range_size)
+        state = None
+
+    if ranged:
+        download_file_ranged(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            obj.size,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+            completed_ranges=state.completed_ranges if state else None,
+            journal=journal,
+            etag=obj.etag,
+        )
+    else:
+        offset = os.path.getsize(local_path) if state else 0
+        if offset > obj.size:
+            offset = 0
+        if offset < obj.size or obj.size == 0:
+            download_file_from_offset(
+                object_client,
+                project_id,
+                datasets_path,
+                local_path,
+                offset,
+                chunk_size,
+                obj,
+            )
+
+
+def download_file_from_offset(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    offset,
+    chunk_size,
+    obj,
+):
+    """Download a version of an object, appending to a partial local copy.
+
+    The request is conditional on the object's ETag, so that an error is
+    raised if the object has been replaced by another version.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The path of the object in the object store
+    local_path : str
+        The local path to download to
+    offset : int
+        The number of bytes of the object already downloaded to
+        ``local_path``. The rest of the object is appended to them. If this
+        is 0, or the object store does not honour the range requested, the
+        file is overwritten with the whole object.
+    chunk_size : int
+        The maximum size of each chunk read from the response
+    obj : faculty.clients.object.Object
+        The version of the object to download
+    """
+    url = object_client.presign_download(project_id, datasets_path)
+    headers = {"If-Match": obj.etag}
+    if offset:
+        headers["Range"] = "bytes={}-".format(offset)
+
+    with http_session().get(url, headers=headers, stream=True) as response:
+        check_version(response, project_id, datasets_path, obj.size)
+        # If the range was not honoured, the full object is returned
+        mode = "ab" if response.status_code == 206 else "wb"
+        rate_limiter = throttle.global_limiter()
+        with open(local_path, mode) as fp:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                rate_limiter.acquire(len(chunk))
+                fp.write(chunk)
+
+
+def download_file_ranged(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    size,
+    max_workers,
+    chunk_size,
+    chunk_policy=None,
+    completed_ranges=None,
+    journal=None,
+    etag=None,
+):
+    """Download a file of known size as concurrent byte ranges.
+
+    Each range is written directly into place in the local file.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+        The path of the file in the object store
+    local_path : str
+        The local path to download the file to
+    size : int
+        The size of the file in the object store
+    max_workers : int
+        The number of byte ranges to download concurrently
+    chunk_size : int
+        The maximum size of each chunk read from a response
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of each byte range, in place of
+        ``DEFAULT_RANGE_SIZE``.
+    completed_ranges : Dict[int, int], optional
+        The start and end offsets of ranges already in the local file, when
+        resuming a download.
+    journal : faculty.datasets.journal.DownloadJournal, optional
+        Records each range as it completes. Without a journal, the file is
+        downloaded to a temporary file alongside ``local_path``, and only
+        moved into place once every range has been downloaded.
+    etag : str, optional
+        The ETag of the object. If given, each range is only downloaded from
+        the same version of the object, and the download fails if it has
+        changed.
+    """
+
+    if journal is not None or completed_ranges:
+        _download_ranges(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            size,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+            completed_ranges,
+            journal,
+            etag,
+        )
+        return
+
+    # The file is preallocated to its full size, so if a range failed, a
+    # file left in place would look complete to anything comparing sizes
+    temporary_path = _temporary_path(local_path)
+    try:
+        _download_ranges(
+            object_client,
+            project_id,
+            datasets_path,
+            temporary_path,
+            size,
+            max_workers,
+            chunk_size,
+            chunk_policy,
+            etag=etag,
+        )
+        replace(temporary_path, local_path)
+    except BaseException:
+        _remove_if_exists(temporary_path)
+        raise
+
+
+def _download_ranges(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    size,
+    max_workers,
+    chunk_size,
+    chunk_policy=None,
+    completed_ranges=None,
+    journal=None,
+    etag=None,
+):
+
+    url = object_client.presign_download(project_id, datasets_path)
+    rate_limiter = throttle.global_limiter()
+
+    if chunk_policy is None:
+        byte_ranges = [
+            (start, min(start + DEFAULT_RANGE_SIZE, size) - 1)
+            for start in range(0, size, DEFAULT_RANGE_SIZE)
+            if not completed_ranges or start not in completed_ranges
+        ]
+    else:
+        # Ranges are sized as they are requested, so that later ranges
+        # benefit from measurements of earlier ones
+        byte_ranges = _policy_byte_ranges(
+            chunk_policy, size, _completed_prefix(completed_ranges or {})
+        )
+
+    with open(local_path, "r+b" if completed_ranges else "wb") as fp:
+        # Preallocate the file so that ranges can be written in any order
+        fp.truncate(size)
+        fileno = fp.fileno()
+
+        def download_range(byte_range):
+            start, end = byte_range
+            started_at = default_timer()
+            headers = {"Range": "bytes={}-{}".format(start, end)}
+            if etag is not None:
+                headers["If-Match"] = etag
+            with http_session().get(
+                url, headers=headers, stream=True
+            ) as response:
+                check_version(response, project_id, datasets_path, size)
+                if response.status_code != 206:
+                    raise DatasetsError(
+                        "Object store did not honour range request for {} in "
+                        "project {}".format(datasets_path, project_id)
+                    )
+                offset = start
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    rate_limiter.acquire(len(chunk))
+                    _pwrite(fileno, chunk, offset)
+                    offset += len(chunk)
+            if offset != end + 1:
+                raise DatasetsError(
+                    "Incomplete download of {} in project {}".format(
+                        datasets_path, project_id
+                    )
+                )
+            if chunk_policy is not None:
+                chunk_policy.record(
+                    end + 1 - start, default_timer() - started_at
+                )
+            return byte_range
+
+        for start, end in bounded_map(
+            download_range, byte_ranges, max_workers
+        ):
+            if journal is not None:
+                journal.record_range(start, end)
+
+
+def _temporary_path(local_path):
+    directory, name = os.path.split(os.path.abspath(local_path))
+    return os.path.join(
+        directory, ".{}.{}.part".format(name, uuid.uuid4().hex)
+    )
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _policy_byte_ranges(chunk_policy, size, start):
+    while start < size:
+        remaining = size - start
+        minimum = min(MIN_RANGE_SIZE, remaining)
+        range_size = chunk_policy.chunk_size(minimum, remaining)
+        range_size = max(minimum, min(range_size, remaining))
+        yield start, start + range_size - 1
+        start += range_size
+
+
+def _completed_prefix(completed_ranges):
+    """Find the end of the contiguous downloaded ranges from the start.
+
+    Ranges are recorded in order, so everything downloaded lies in this
+    prefix, except for ranges recorded without their end.
+    """
+    offset = 0
+    while completed_ranges.get(offset) is not None:
+        offset = completed_ranges[offset] + 1
+    return offset
+
+
+def get_object(object_client, project_id, datasets_path):
+    """Get an object, raising a DatasetsError if it does not exist.
+
+    Parameters
+    ----------
+    object_client : faculty.clients.object.ObjectClient
+    project_id : uuid.UUID
+    datasets_path : str
+
+    Returns
+    -------
+    faculty.clients.object.Object
+    """
+    try:
+        return object_client.get(project_id, datasets_path)
+    except NotFound:
+        raise DatasetsError(
+            "No such object {} in project {}".format(datasets_path, project_id)
+        )
+
+
+def check_download_status(response, project_id, datasets_path):
+    """Raise an error if a download from the object store failed.
+
+    Parameters
+    ----------
+    response : requests.Response
+    project_id : uuid.UUID
+    datasets_path : str
+    """
+    if response.status_code == 404:
+        raise DatasetsError(
+            "No such object {} in project {}".format(datasets_path, project_id)
+        )
+    response.raise_for_status()
+
+
+class _ObjectChanged(DatasetsError):
+    """The object being downloaded was replaced during the download."""
+
+
+def check_version(response, project_id, datasets_path, size):
+    """Check a response is from the version of an object being downloaded.
+
+    Requests should be made conditional on the object's ETag with an
+    ``If-Match`` header, so that a changed object is refused. The total size
+    in the Content-Range of a partial response is checked too.
+
+    Parameters
+    ----------
+    response : requests.Response
+    project_id : uuid.UUID
+    datasets_path : str
+    size : int
+        The size of the version of the object being downloaded
+
+    Raises
+    ------
+    faculty.datasets.util.DatasetsError
+        If the object has changed, or the object store returned an error.
+    """
+    changed = response.status_code == 412
+    if response.status_code == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        changed = total.isdigit() and int(total) != size
+    if changed:
+        raise _ObjectChanged(
+            "{} in project {} changed while being downloaded".format(
+                datasets_path, project_id
+            )
+        )
+    check_download_status(response, project_id, datasets_path)
+
+
+_pwrite_lock = threading.Lock()
+
+
+def _pwrite(fileno, data, offset):
+    data = memoryview(data)
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fileno, data, offset)
+            data = data[written:]
+            offset += written
+    else:
+        # Emulate positional writes on platforms without them
+        with _pwrite_lock:
+            os.lseek(fileno, offset, os.SEEK_SET)
+            while data:
+                written = os.write(fileno, data)
+                data = data[written:]
+
+
+def upload(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    max_workers=DEFAULT_MAX_WORKERS,
+    chunk_policy=None,
+):
     """Upload data to the object store.
 
     Parameters
@@ -119,6 +839,13 @@ def upload(object_client, project_id, datasets_path, content):
         The target path to upload to in the object store
     content : bytes
         The data to upload
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of each part of the upload, within the limits of the
+        storage provider, and is told how long each part took to upload. By
+        default, parts are of a fixed size.
     """
     # upload_stream will rechunk the data anyway so just pass as a single chunk
     _upload_stream(
@@ -127,10 +854,19 @@ def upload(object_client, project_id, datasets_path, content):
         datasets_path,
         [content],
         known_file_size=len(content),
+        max_workers=max_workers,
+        chunk_policy=chunk_policy,
     )
 
 
-def upload_stream(object_client, project_id, datasets_path, content):
+def upload_stream(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    max_workers=DEFAULT_MAX_WORKERS,
+    chunk_policy=None,
+):
     """Upload data to the object store from an iterable.
 
     Parameters
@@ -140,12 +876,37 @@ def upload_stream(object_client, project_id, datasets_path, content):
     datasets_path : str
         The target path to upload to in the object store
     content : Iterable[bytes]
-        The data to upload, chunked
+        The data to upload, chunked. Chunks may be read before earlier parts
+        have finished uploading, so bytearrays and writable memoryviews are
+        copied, and a buffer can safely be reused for successive chunks.
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of each part of the upload, within the limits of the
+        storage provider, and is told how long each part took to upload. By
+        default, parts are of a fixed size.
     """
-    _upload_stream(object_client, project_id, datasets_path, content)
+    _upload_stream(
+        object_client,
+        project_id,
+        datasets_path,
+        content,
+        max_workers=max_workers,
+        chunk_policy=chunk_policy,
+    )
 
 
-def upload_file(object_client, project_id, datasets_path, local_path):
+def upload_file(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers=DEFAULT_MAX_WORKERS,
+    resume=False,
+    chunk_policy=None,
+    verify=False,
+):
     """Upload a file to the object store.
 
     Parameters
@@ -156,73 +917,372 @@ def upload_file(object_client, project_id, datasets_path, local_path):
         The target path to upload to in the object store
     local_path : str
         The local path of the object to upload
+    max_workers : int, optional
+        The number of parts to upload concurrently. Only S3 multipart uploads
+        can be parallelised; GCS uploads are always sequential.
+    resume : bool, optional
+        If True, record the progress of the upload in a journal on local
+        disk. If an earlier upload of the same file to the same path was
+        interrupted, it is continued, skipping the data already uploaded.
+    chunk_policy : faculty.datasets.chunking.ChunkSizePolicy, optional
+        Chooses the size of each part of the upload, within the limits of the
+        storage provider, and is told how long each part took to upload. By
+        default, parts are of a fixed size.
+    verify : bool, optional
+        If True, compute the MD5 of each part as it is uploaded, and raise a
+        :class:`faculty.datasets.util.ChecksumMismatch` if it does not match
+        the one computed by the object store. On GCS, the MD5 of the whole
+        file is checked instead, unless the upload was resumed. See
+        :mod:`faculty.datasets.checksum`.
     """
+    journal = None
+    state = None
+    if resume:
+        journal = UploadJournal.for_file(project_id, datasets_path, local_path)
+        state = journal.load()
+
+    try:
+        _upload_file(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            max_workers,
+            chunk_policy,
+            journal,
+            state,
+            verify=verify,
+        )
+    except requests.HTTPError as err:
+        if (
+            state is None
+            or err.response is None
+            or err.response.status_code not in (404, 410)
+        ):
+            raise
+        # The upload being resumed has expired or been aborted on the server
+        _upload_file(
+            object_client,
+            project_id,
+            datasets_path,
+            local_path,
+            max_workers,
+            chunk_policy,
+            journal,
+            verify=verify,
+        )
+
+
+def _upload_file(
+    object_client,
+    project_id,
+    datasets_path,
+    local_path,
+    max_workers,
+    chunk_policy,
+    journal,
+    state=None,
+    verify=False,
+):
     file_size = os.path.getsize(local_path)
-    _upload_stream(
-        object_client,
-        project_id,
-        datasets_path,
-        _file_chunk_iterator(local_path),
-        known_file_size=file_size,
-    )
+    with _file_content(local_path) as content:
+        _upload_stream(
+            object_client,
+            project_id,
+            datasets_path,
+            content,
+            known_file_size=file_size,
+            max_workers=max_workers,
+            chunk_policy=chunk_policy,
+            journal=journal,
+            state=state,
+            verify=verify,
+        )
 
 
 def _upload_stream(
-    object_client, project_id, datasets_path, content, known_file_size=None
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    known_file_size=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    chunk_policy=None,
+    journal=None,
+    state=None,
+    verify=False,
+):
+    # Listings cached for the same object client would no longer include
+    # the uploaded file
+    with listing.invalidating(object_client, project_id, datasets_path):
+        _upload_content(
+            object_client,
+            project_id,
+            datasets_path,
+            content,
+            known_file_size,
+            max_workers,
+            chunk_policy,
+            journal,
+            state,
+            verify,
+        )
+
+
+def _upload_content(
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    known_file_size=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    chunk_policy=None,
+    journal=None,
+    state=None,
+    verify=False,
 ):
 
-    presign_response = object_client.presign_upload(project_id, datasets_path)
-    chunk_size = _chunk_size(presign_response.provider, known_file_size)
+    if state is None:
+        presign_response = object_client.presign_upload(
+            project_id, datasets_path
+        )
+        if chunk_policy is None:
+            chunk_size = upload_chunk_size(
+                presign_response.provider, known_file_size
+            )
+        else:
+            # Parts vary in size, which is recorded as None in the journal
+            chunk_size = None
+        state = UploadState(
+            provider=presign_response.provider,
+            upload_id=presign_response.upload_id,
+            url=presign_response.url,
+            chunk_size=chunk_size,
+            completed_parts=[],
+            offset=0,
+        )
+        if journal is not None:
+            journal.start(
+                state.provider, state.upload_id, state.url, state.chunk_size
+            )
+        resuming = False
+    else:
+        resuming = True
 
-    if presign_response.provider == CloudStorageProvider.S3:
+    if state.chunk_size is None:
+        # Resuming an upload begun with a chunk policy needs one to continue
+        chunk_policy = chunk_policy or FixedChunkSize(DEFAULT_CHUNK_SIZE)
+    else:
+        # A resumed upload must continue with the parts it was started with
+        chunk_policy = None
+
+    if state.provider == CloudStorageProvider.S3:
+        offset = 0
+        if chunk_policy is None:
+            chunk_size = state.chunk_size
+            if known_file_size is None:
+                num_parts = None
+            else:
+                num_parts = max(
+                    1, int(math.ceil(known_file_size / float(chunk_size)))
+                )
+        else:
+            # Parts are journaled in order along with the number of bytes
+            # uploaded so far, so a resumed upload continues from there
+            offset = state.offset
+            content = _skip_bytes(content, offset)
+            chunk_size = _policy_chunk_sizes(
+                chunk_policy,
+                state.provider,
+                known_file_size,
+                offset,
+                len(state.completed_parts) + 1,
+            )
+            if known_file_size is None:
+                num_parts = None
+            else:
+                # An upper bound, as no part is smaller than the default
+                remaining_size = max(0, known_file_size - offset)
+                num_parts = min(
+                    S3_MAX_CHUNKS,
+                    len(state.completed_parts)
+                    + max(
+                        1,
+                        int(
+                            math.ceil(
+                                remaining_size / float(DEFAULT_CHUNK_SIZE)
+                            )
+                        ),
+                    ),
+                )
         _s3_upload(
             object_client,
             project_id,
             datasets_path,
             content,
-            presign_response.upload_id,
+            state.upload_id,
             chunk_size,
+            max_workers,
+            state.completed_parts,
+            journal,
+            num_parts,
+            chunk_policy,
+            offset,
+            verify,
         )
-    elif presign_response.provider == CloudStorageProvider.GCS:
-        _gcs_upload(presign_response.url, content, chunk_size)
+    elif state.provider == CloudStorageProvider.GCS:
+        start_index = 0
+        if resuming:
+            # The session reports how much it has persisted, which may be
+            # more than was recorded if the last chunk's response was lost
+            start_index = _gcs_persisted_size(state.url, known_file_size)
+            content = _skip_bytes(content, start_index)
+        if start_index is not None:
+            if chunk_policy is None:
+                chunk_size = state.chunk_size
+            else:
+                chunk_size = _policy_chunk_sizes(
+                    chunk_policy, state.provider, known_file_size, start_index
+                )
+            _gcs_upload(
+                state.url,
+                content,
+                chunk_size,
+                start_index,
+                journal,
+                chunk_policy,
+                # The content uploaded before resuming is not seen again
+                verify and not resuming,
+            )
     else:
         raise ValueError(
-            "Unsupported cloud storage provider: {}".format(
-                presign_response.provider
-            )
+            "Unsupported cloud storage provider: {}".format(state.provider)
         )
 
+    if journal is not None:
+        journal.remove()
+
 
 def _s3_upload(
-    object_client, project_id, datasets_path, content, upload_id, chunk_size
+    object_client,
+    project_id,
+    datasets_path,
+    content,
+    upload_id,
+    chunk_size,
+    max_workers=DEFAULT_MAX_WORKERS,
+    completed_parts=(),
+    journal=None,
+    num_parts=None,
+    chunk_policy=None,
+    offset=0,
+    verify=False,
+    rate_limiter=None,
 ):
+    already_uploaded = set(part.part_number for part in completed_parts)
+    first_part_number = 1 if chunk_policy is None else len(completed_parts) + 1
 
-    completed_parts = []
-    for i, chunk in enumerate(_rechunk_data(content, chunk_size)):
-
-        part_number = i + 1
-
-        chunk_url = object_client.presign_upload_part(
-            project_id, datasets_path, upload_id, part_number
+    def presigned_parts():
+        # Presigning happens in the calling thread as the pool asks for more
+        # work, so URLs are ready before a worker becomes free to use them
+        urls = _presign_parts_in_batches(
+            object_client,
+            project_id,
+            datasets_path,
+            upload_id,
+            already_uploaded,
+            num_parts,
         )
-
-        upload_response = requests.put(chunk_url, data=chunk)
-        upload_response.raise_for_status()
-        completed_parts.append(
-            CompletedUploadPart(
-                part_number=part_number, etag=upload_response.headers["ETag"]
-            )
+        # With several workers, earlier parts are still being uploaded when
+        # the next is read, so a buffer reused by the caller must be copied
+        chunks = _rechunk_data(
+            content, chunk_size, copy_mutable=max_workers > 1
         )
+        for part_number, chunk in enumerate(chunks, first_part_number):
+            if part_number in already_uploaded:
+                continue
+            chunk_url = next(urls)
+            yield part_number, chunk_url, chunk
+
+    def upload_part(presigned_part):
+        started_at = default_timer()
+        part = _s3_upload_part(presigned_part, rate_limiter)
+        num_bytes = len(presigned_part[2])
+        if verify and normalise_etag(part.etag) != _md5_hex(presigned_part[2]):
+            raise ChecksumMismatch(
+                "Part {} of {} in project {} was corrupted in transit".format(
+                    part.part_number, datasets_path, project_id
+                )
+            )
+        if chunk_policy is not None:
+            chunk_policy.record(num_bytes, default_timer() - started_at)
+        return part, num_bytes
+
+    completed_parts = list(completed_parts)
+    for part, num_bytes in bounded_map(
+        upload_part, presigned_parts(), max_workers
+    ):
+        offset += num_bytes
+        if journal is not None:
+            journal.record_part(part)
+            if chunk_policy is not None:
+                journal.record_offset(offset)
+        completed_parts.append(part)
 
     object_client.complete_multipart_upload(
-        project_id, datasets_path, upload_id, completed_parts
+        project_id, datasets_path, upload_id, sorted(completed_parts)
     )
 
 
-def _gcs_upload(upload_url, content, chunk_size):
+def _presign_parts_in_batches(
+    object_client, project_id, datasets_path, upload_id, skip, num_parts
+):
+    """Presign successive upload parts not in skip, fetching URLs in batches.
 
-    start_index = 0
+    Each batch is requested when its first URL is needed, and covers up to
+    ``PRESIGN_BATCH_SIZE`` parts. When the number of parts is known, batches
+    stop at the last part. Otherwise, the first batch is of a single part and
+    each batch is twice the size of the last, so that short uploads do not
+    presign many parts they never use.
+    """
+    part_numbers = (n for n in itertools.count(1) if n not in skip)
+    batch_size = 1
+    while True:
+        first = next(part_numbers)
+        if num_parts is not None:
+            batch_size = max(1, min(PRESIGN_BATCH_SIZE, num_parts - first + 1))
+        batch = [first] + list(itertools.islice(part_numbers, batch_size - 1))
+        urls = object_client.presign_upload_parts(
+            project_id, datasets_path, upload_id, batch
+        )
+        for url in urls:
+            yield url
+        batch_size = min(2 * batch_size, PRESIGN_BATCH_SIZE)
+
+
+def _s3_upload_part(presigned_part, rate_limiter=None):
+    part_number, chunk_url, chunk = presigned_part
+    upload_response = http_session().put(
+        chunk_url, data=_throttled_body(chunk, rate_limiter)
+    )
+    upload_response.raise_for_status()
+    return CompletedUploadPart(
+        part_number=part_number, etag=upload_response.headers["ETag"]
+    )
 
+
+def _gcs_upload(
+    upload_url,
+    content,
+    chunk_size,
+    start_index=0,
+    journal=None,
+    chunk_policy=None,
+    verify=False,
+    rate_limiter=None,
+):
+
+    checksum = MultipartChecksum() if verify else None
     for i, (chunk, is_last) in enumerate(
         _rechunk_and_label_as_last(content, chunk_size)
     ):
@@ -231,22 +1291,160 @@ def _gcs_upload(upload_url, content, chunk_size):
         else:
             total_file_size = "*"
 
-        _gcs_upload_chunk(upload_url, chunk, start_index, total_file_size)
+        started_at = default_timer()
+        response = _gcs_upload_chunk(
+            upload_url, chunk, start_index, total_file_size, rate_limiter
+        )
+        if checksum is not None:
+            checksum.update(chunk)
+            expected = response_md5(response.headers) if is_last else None
+            if expected is not None and expected != checksum.hexdigest():
+                raise ChecksumMismatch(
+                    "Uploaded content was corrupted in transit"
+                )
+        if chunk_policy is not None:
+            chunk_policy.record(len(chunk), default_timer() - started_at)
         start_index += len(chunk)
+        if journal is not None:
+            journal.record_offset(start_index)
 
 
-def _gcs_upload_chunk(upload_url, content, start_index, total_file_size):
+def _gcs_upload_chunk(
+    upload_url, content, start_index, total_file_size, rate_limiter=None
+):
     headers = {"Content-Length": "{0}".format(len(content))}
-    # Only add Content-Range if not empty, otherwise this will result in
-    # a bad request
-    if start_index or content:
+    # Only add a byte range to Content-Range if not empty, otherwise this
+    # will result in a bad request
+    if content:
         end_index = start_index + len(content) - 1
         headers["Content-Range"] = "bytes {0}-{1}/{2}".format(
             start_index, end_index, total_file_size
         )
-    result = requests.put(upload_url, data=content, headers=headers)
+    elif start_index:
+        # All content was sent previously; this request finalises the upload
+        headers["Content-Range"] = "bytes */{0}".format(total_file_size)
+    result = http_session().put(
+        upload_url,
+        data=_throttled_body(content, rate_limiter),
+        headers=headers,
+    )
 
     result.raise_for_status()
+    return result
+
+
+def _rate_limiter(rate_limiter):
+    if rate_limiter is None:
+        return throttle.global_limiter()
+    return rate_limiter
+
+
+def _throttled_body(content, rate_limiter):
+    """Wrap content to upload so it is sent no faster than the rate limit.
+
+    Without a limit, the content is sent as it is, which avoids copying it,
+    so a limit set while an upload is in progress applies from its next part.
+    """
+    rate_limiter = _rate_limiter(rate_limiter)
+    if rate_limiter.rate is None or not len(content):
+        return content
+    return throttle.ThrottledReader(content, rate_limiter)
+
+
+def _md5_hex(data):
+    checksum = MultipartChecksum()
+    checksum.update(data)
+    return checksum.hexdigest()
+
+
+def _gcs_persisted_size(upload_url, total_file_size):
+    """Query how much of a GCS resumable upload has been persisted.
+
+    Returns None if the upload has already completed.
+    """
+    if total_file_size is None:
+        total_file_size = "*"
+    headers = {
+        "Content-Length": "0",
+        "Content-Range": "bytes */{0}".format(total_file_size),
+    }
+    result = http_session().put(upload_url, headers=headers)
+    if result.status_code in (200, 201):
+        return None
+    elif result.status_code != 308:
+        result.raise_for_status()
+        raise DatasetsError(
+            "Unexpected response querying upload status: {}".format(
+                result.status_code
+            )
+        )
+    # The Range header is absent if no bytes have been persisted
+    persisted_range = result.headers.get("Range")
+    if persisted_range is None:
+        return 0
+    return int(persisted_range.rsplit("-", 1)[1]) + 1
+
+
+def _skip_bytes(content, num_bytes):
+    for chunk in content:
+        if num_bytes >= len(chunk):
+            num_bytes -= len(chunk)
+            continue
+        if num_bytes:
+            chunk = memoryview(chunk)[num_bytes:]
+            num_bytes = 0
+        yield chunk
+
+
+@contextlib.contextmanager
+def _file_content(local_path):
+    """Provide the content of a local file as an iterable for upload.
+
+    Where possible the file is memory-mapped one window of
+    ``FILE_MAP_WINDOW_SIZE`` bytes at a time, and provided as a memoryview of
+    each window, which _rechunk_data slices into parts without copying them
+    into memory. Each window is unmapped once the parts sliced from it are no
+    longer referenced, so the pages read for a part do not stay resident
+    after it is uploaded. Empty files cannot be mapped and Python 2 mappings
+    do not support memoryviews, so in those cases the file is read in
+    chunks.
+    """
+    with open(local_path, "rb") as fp:
+        file_size = os.fstat(fp.fileno()).st_size
+        try:
+            content = _mapped_windows(
+                fp, file_size, _map_window(fp, 0, file_size)
+            )
+        except (ValueError, TypeError, EnvironmentError):
+            content = _file_chunk_iterator(local_path)
+        yield content
+
+
+def _mapped_windows(fp, file_size, first_window):
+    window = first_window
+    del first_window
+    offset = 0
+    while True:
+        offset += len(window)
+        yield window
+        # Drop the reference to the window before mapping the next, so that
+        # it is unmapped as soon as its parts have been uploaded
+        window = None
+        if offset >= file_size:
+            return
+        window = _map_window(fp, offset, file_size)
+
+
+def _map_window(fp, offset, file_size):
+    length = min(FILE_MAP_WINDOW_SIZE, file_size - offset)
+    mapping = mmap.mmap(
+        fp.fileno(), length, access=mmap.ACCESS_READ, offset=offset
+    )
+    try:
+        return memoryview(mapping)
+    except TypeError:
+        mapping.close()
+        raise
 
 
 def _file_chunk_iterator(local_path):
@@ -257,26 +1455,26 @@ def _file_chunk_iterator(local_path):
             chunk = fp.read(FILE_CHUNK_SIZE)
 
 
-def _rechunk_data(content, chunk_size):
-    chunk = b""
-    has_yielded = False
-    for original_chunk in content:
-
-        while len(original_chunk) > 0:
-            remaining = chunk_size - len(chunk)
-            chunk += original_chunk[:remaining]
-            original_chunk = original_chunk[remaining:]
-            if len(chunk) >= chunk_size:
-                has_yielded = True
-                yield chunk
-                chunk = b""
+def _rechunk_data(content, chunk_size, copy_mutable=False):
+    """Regroup an iterable of bytes into chunks of a given size.
 
-    if not has_yielded or len(chunk) > 0:
+    See :class:`faculty.datasets.util.Rechunker` for the meaning of the
+    arguments.
+    """
+    rechunker = Rechunker(chunk_size, copy_mutable)
+    for original_chunk in content:
+        for chunk in rechunker.feed(original_chunk):
+            yield chunk
+    for chunk in rechunker.finish():
         yield chunk
 
 
 def _rechunk_and_label_as_last(content, chunk_size):
-    chunks = _rechunk_data(content=content, chunk_size=chunk_size)
+    # Each chunk is held until the next has been read, so a buffer reused by
+    # the caller must be copied
+    chunks = _rechunk_data(
+        content=content, chunk_size=chunk_size, copy_mutable=True
+    )
     current_chunk = next(chunks, b"")
     while True:
         try:
@@ -288,7 +1486,19 @@ def _rechunk_and_label_as_last(content, chunk_size):
             break
 
 
-def _chunk_size(provider, known_file_size):
+def upload_chunk_size(provider, known_file_size):
+    """Get the size of parts to upload a file in.
+
+    Parameters
+    ----------
+    provider : faculty.clients.object.CloudStorageProvider
+    known_file_size : int or None
+        The size of the file, if known
+
+    Returns
+    -------
+    int
+    """
     if known_file_size is None:
         return DEFAULT_CHUNK_SIZE
     elif provider == CloudStorageProvider.S3:
@@ -296,3 +1506,53 @@ def _chunk_size(provider, known_file_size):
         return int(max([new_chunk_size, DEFAULT_CHUNK_SIZE]))
     else:
         return DEFAULT_CHUNK_SIZE
+
+
+def _policy_chunk_sizes(
+    chunk_policy, provider, known_file_size, offset=0, part_number=1
+):
+    """Build a function giving the size of each successive part of an upload.
+
+    The policy's choices are kept within the part size limits of the storage
+    provider, and such that an upload of unknown size cannot exceed the
+    maximum number of S3 parts.
+    """
+    position = {"offset": offset, "part_number": part_number}
+
+    def next_chunk_size():
+        minimum, maximum = _part_size_limits(
+            provider,
+            known_file_size,
+            position["offset"],
+            position["part_number"],
+        )
+        size = max(
+            minimum, min(chunk_policy.chunk_size(minimum, maximum), maximum)
+        )
+        if provider == CloudStorageProvider.GCS:
+            # All but the last chunk must be a multiple of 256 KiB
+            size = max(GCS_CHUNK_MULTIPLE, size - size % GCS_CHUNK_MULTIPLE)
+        position["offset"] += size
+        position["part_number"] += 1
+        return size
+
+    return next_chunk_size
+
+
+def _part_size_limits(provider, known_file_size, offset, part_number):
+    if provider == CloudStorageProvider.GCS:
+        return GCS_CHUNK_MULTIPLE, MAX_CHUNK_SIZE
+
+    minimum = DEFAULT_CHUNK_SIZE
+    if known_file_size is None:
+        # Double the minimum every tenth of the allowed parts, so that the
+        # parts can hold several terabytes of data in total
+        doublings = (part_number - 1) // max(1, S3_MAX_CHUNKS // 10)
+        minimum *= 2 ** doublings
+    else:
+        remaining_parts = max(1, S3_MAX_CHUNKS - part_number + 1)
+        remaining_size = max(0, known_file_size - offset)
+        minimum = max(
+            minimum, int(math.ceil(remaining_size / float(remaining_parts)))
+        )
+    return min(minimum, MAX_CHUNK_SIZE), MAX_CHUNK_SIZE
@@ -15,7 +15,243 @@
 """Common components for Faculty datasets."""
 
 
+import os
+import errno
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+
 class DatasetsError(Exception):
     """An error occurred when using Faculty datasets."""
 
     pass
+
+
+class BulkTransferError(DatasetsError):
+    """Some of the files in a bulk operation failed.
+
+    Parameters
+    ----------
+    message : str
+    failures : Dict[str, Exception]
+        The error raised for each path that failed.
+    """
+
+    def __init__(self, message, failures):
+        super(BulkTransferError, self).__init__(message)
+        self.failures = failures
+
+
+class ChecksumMismatch(DatasetsError):
+    """Data was found to have been corrupted during a transfer."""
+
+    pass
+
+
+class Rechunker(object):
+    """Regroup a stream of bytes into chunks of a given size.
+
+    Pass each input chunk to :meth:`feed` in turn, then call :meth:`finish`.
+    Both return an iterator over the output chunks completed so far, which
+    must be consumed before the next call. At least one chunk is produced,
+    which is empty if there is no content.
+
+    Input chunks that are already of the target size are passed through
+    untouched. Otherwise, chunks are assembled from memoryview slices of the
+    input so that each byte is copied at most once. When an input chunk is a
+    memoryview, output chunks lying entirely within it are slices of it.
+
+    Parameters
+    ----------
+    chunk_size : int or Callable[[], int]
+        The size of the output chunks, or a function called to get the size
+        of each output chunk before it is built.
+    copy_mutable : bool, optional
+        If True, output chunks never refer to a mutable input chunk, such as
+        a bytearray or a writable memoryview, so that the caller can reuse
+        its buffer for the next input chunk.
+    """
+
+    def __init__(self, chunk_size, copy_mutable=False):
+        if callable(chunk_size):
+            self._next_chunk_size = chunk_size
+            self._chunk_size = chunk_size()
+        else:
+            self._next_chunk_size = None
+            self._chunk_size = chunk_size
+        self._copy_mutable = copy_mutable
+        self._pending = []
+        self._pending_size = 0
+        self._pending_is_view = False
+        self._has_yielded = False
+
+    def feed(self, chunk):
+        """Add an input chunk.
+
+        Parameters
+        ----------
+        chunk : bytes-like
+
+        Returns
+        -------
+        Iterator[bytes-like]
+            The output chunks completed by this input chunk.
+        """
+        mutable = self._copy_mutable and _is_mutable(chunk)
+
+        if not self._pending and len(chunk) == self._chunk_size:
+            self._has_yielded = True
+            yield memoryview(chunk).tobytes() if mutable else chunk
+            self._advance()
+            return
+
+        is_view = isinstance(chunk, memoryview) and not mutable
+        view = memoryview(chunk)
+        start = 0
+        while start < len(view):
+            end = start + self._chunk_size - self._pending_size
+            piece = view[start:end]
+            start += len(piece)
+            if not self._pending:
+                self._pending_is_view = is_view
+            self._pending.append(piece)
+            self._pending_size += len(piece)
+            if self._pending_size >= self._chunk_size:
+                self._has_yielded = True
+                yield self._take_pending()
+                self._advance()
+
+        if self._pending and _is_mutable(chunk):
+            # The caller may reuse its buffer for the next input chunk
+            self._pending[-1] = memoryview(self._pending[-1].tobytes())
+
+    def finish(self):
+        """Complete the last output chunk.
+
+        Returns
+        -------
+        Iterator[bytes-like]
+        """
+        if self._pending or not self._has_yielded:
+            self._has_yielded = True
+            yield self._take_pending()
+
+    def _take_pending(self):
+        pieces = self._pending
+        self._pending = []
+        self._pending_size = 0
+        if len(pieces) == 1:
+            return pieces[0] if self._pending_is_view else pieces[0].tobytes()
+        elif six.PY2:
+            # Python 2 cannot join memoryviews directly
+            return b"".join(piece.tobytes() for piece in pieces)
+        else:
+            return b"".join(pieces)
+
+    def _advance(self):
+        if self._next_chunk_size is not None:
+            self._chunk_size = self._next_chunk_size()
+
+
+def _is_mutable(chunk):
+    if isinstance(chunk, bytearray):
+        return True
+    return isinstance(chunk, memoryview) and not chunk.readonly
+
+
+def bounded_map(function, iterable, max_workers):
+    """Apply a function to the items of an iterable using a pool of threads.
+
+    Unlike :meth:`concurrent.futures.Executor.map`, items are only drawn from
+    the iterable as workers become free, so that no more than
+    ``max_workers`` items are held in memory at any one time. Results are
+    yielded in the same order as the input.
+
+    Parameters
+    ----------
+    function : Callable
+        The function to apply to each item.
+    iterable : Iterable
+        The items to process.
+    max_workers : int
+        The number of threads to use. When 1, items are processed in the
+        calling thread.
+
+    Returns
+    -------
+    Iterable
+        The results of applying the function to each item.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            yield function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(function, item))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't start work that will never be consumed if we are exiting
+            # early due to an error
+            for future in pending:
+                future.cancel()
+
+
+def cache_directory(name):
+    """Get a directory for faculty to keep data in the user's cache directory.
+
+    Parameters
+    ----------
+    name : str
+        The name of the directory under ``$XDG_CACHE_HOME/faculty``.
+
+    Returns
+    -------
+    str
+    """
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not xdg_cache_home:
+        xdg_cache_home = os.path.expanduser("~/.cache")
+    return os.path.join(xdg_cache_home, "faculty", name)
+
+
+def makedirs(path, mode=None):
+    """Create a directory and its parents, if it does not already exist.
+
+    Parameters
+    ----------
+    path : str
+    mode : int, optional
+        The permissions of any directories created.
+    """
+    try:
+        if mode is None:
+            os.makedirs(path)
+        else:
+            os.makedirs(path, mode)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def replace(source, destination):
+    """Move a file into place, atomically replacing any existing file.
+
+    Parameters
+    ----------
+    source : str
+    destination : str
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+    else:
+        # Python 2. On POSIX, rename replaces the destination atomically
+        os.rename(source, destination)
@@ -40,6 +40,7 @@ setup(
         "pytz",
         "six",
         "enum34; python_version<'3.4'",
+        "futures; python_version<'3.2'",
         # Install marshmallow with 'reco' (recommended) extras to ensure a
         # compatible version of python-dateutil is available
         "attrs",
@@ -47,6 +48,15 @@ setup(
         "marshmallow; python_version>='3.5'",
         "marshmallow_enum",
     ],
+    extras_require={
+        "aio": ["aiohttp; python_version>='3.6'"],
+        "fsspec": ["fsspec; python_version>='3.6'"],
+    },
+    entry_points={
+        "fsspec.specs": [
+            "faculty = faculty.datasets.filesystem:FacultyFileSystem"
+        ]
+    },
     dependency_links=[
         "git+https://github.com/marshmallow-code/marshmallow"
         "@3.0.0rc3#egg=marshmallow"
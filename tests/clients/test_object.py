@@ -13,6 +13,8 @@
 # limitations under the License.
 
 
+import threading
+import time
 import uuid
 from datetime import datetime
 
@@ -20,11 +22,18 @@ import pytest
 from marshmallow import ValidationError
 from pytz import UTC
 
-from faculty.clients.base import BadRequest, Conflict, NotFound
+from faculty.clients.base import (
+    BadRequest,
+    Conflict,
+    MethodNotAllowed,
+    NotFound,
+)
 from faculty.clients.object import (
     CloudStorageProvider,
     CompletedUploadPart,
+    DeleteOutcome,
     ListObjectsResponse,
+    MoveNotSupported,
     Object,
     ObjectClient,
     PathAlreadyExists,
@@ -32,6 +41,8 @@ from faculty.clients.object import (
     PresignUploadResponse,
     SourceIsADirectory,
     TargetIsADirectory,
+    _BatchPresignResponse,
+    _BatchPresignResponseSchema,
     _CompleteMultipartUploadSchema,
     _CompletedUploadPartSchema,
     _ListObjectsResponseSchema,
@@ -378,6 +389,87 @@ def test_object_client_copy_source_is_a_directory(mocker):
         client.copy(PROJECT_ID, "source", "destination")
 
 
+def test_object_client_move(mocker):
+    mocker.patch.object(ObjectClient, "_post_raw")
+
+    client = ObjectClient(mocker.Mock())
+    client.move(PROJECT_ID, "/source", "/[1]/", recursive=True)
+
+    ObjectClient._post_raw.assert_called_once_with(
+        "/project/{}/move/%5B1%5D/".format(PROJECT_ID),
+        params={"sourcePath": "/source", "recursive": 1},
+    )
+
+
+def test_object_client_move_source_not_found(mocker):
+    error_code = "source_path_not_found"
+    exception = NotFound(mocker.Mock(), mocker.Mock(), error_code)
+    mocker.patch.object(ObjectClient, "_post_raw", side_effect=exception)
+
+    client = ObjectClient(mocker.Mock())
+    with pytest.raises(PathNotFound, match="'source' cannot be found"):
+        client.move(PROJECT_ID, "source", "destination")
+
+
+def test_object_client_move_source_is_a_directory(mocker):
+    error_code = "source_is_a_directory"
+    exception = BadRequest(mocker.Mock(), mocker.Mock(), error_code)
+    mocker.patch.object(ObjectClient, "_post_raw", side_effect=exception)
+
+    client = ObjectClient(mocker.Mock())
+    with pytest.raises(SourceIsADirectory, match="'source' is a directory"):
+        client.move(PROJECT_ID, "source", "destination")
+
+
+@pytest.mark.parametrize(
+    "exception_class, error_code",
+    [
+        (NotFound, None),
+        (NotFound, "route_not_found"),
+        (MethodNotAllowed, None),
+        (MethodNotAllowed, "code"),
+    ],
+)
+def test_object_client_move_unsupported(mocker, exception_class, error_code):
+    exception = exception_class(mocker.Mock(), mocker.Mock(), error_code)
+    mocker.patch.object(ObjectClient, "_post_raw", side_effect=exception)
+
+    client = ObjectClient(mocker.Mock())
+    with pytest.raises(MoveNotSupported):
+        client.move(PROJECT_ID, "source", "destination")
+    with pytest.raises(MoveNotSupported):
+        client.move(PROJECT_ID, "source", "destination")
+
+    # Once found to be unsupported, the endpoint is not tried again
+    ObjectClient._post_raw.assert_called_once()
+
+
+def _session(mocker):
+    session = mocker.Mock()
+    session.service_url.return_value = "https://{}.example.com/".format(
+        uuid.uuid4()
+    )
+    return session
+
+
+def test_object_client_move_unsupported_shared_between_clients(mocker):
+    exception = MethodNotAllowed(mocker.Mock(), mocker.Mock())
+    mocker.patch.object(ObjectClient, "_post_raw", side_effect=exception)
+    session = _session(mocker)
+
+    for _ in range(2):
+        with pytest.raises(MoveNotSupported):
+            ObjectClient(session).move(PROJECT_ID, "source", "destination")
+
+    ObjectClient._post_raw.assert_called_once()
+    # Another server may still support it
+    with pytest.raises(MoveNotSupported):
+        ObjectClient(_session(mocker)).move(
+            PROJECT_ID, "source", "destination"
+        )
+    assert ObjectClient._post_raw.call_count == 2
+
+
 def test_object_client_delete_default(mocker):
     path = "test-path"
     mocker.patch.object(ObjectClient, "_delete_raw")
@@ -442,6 +534,62 @@ def test_object_client_delete_target_is_a_directory(mocker):
         client.delete(PROJECT_ID, path)
 
 
+def test_object_client_delete_many(mocker):
+    error = PathNotFound("/missing")
+
+    def delete(project_id, path, recursive=False):
+        if path == "/missing":
+            raise error
+
+    mocker.patch.object(ObjectClient, "delete", side_effect=delete)
+
+    client = ObjectClient(mocker.Mock())
+    outcomes = client.delete_many(
+        PROJECT_ID,
+        (path for path in ["/a", "/missing", "/b"]),
+        recursive=True,
+        max_workers=2,
+    )
+
+    assert outcomes == [
+        DeleteOutcome("/a", None),
+        DeleteOutcome("/missing", error),
+        DeleteOutcome("/b", None),
+    ]
+    ObjectClient.delete.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/a", recursive=True),
+            mocker.call(PROJECT_ID, "/missing", recursive=True),
+            mocker.call(PROJECT_ID, "/b", recursive=True),
+        ],
+        any_order=True,
+    )
+
+
+def test_object_client_delete_many_bounds_requests(mocker):
+    lock = threading.Lock()
+    in_progress = [0]
+    max_in_progress = [0]
+
+    def delete(project_id, path, recursive=False):
+        with lock:
+            in_progress[0] += 1
+            max_in_progress[0] = max(max_in_progress[0], in_progress[0])
+        time.sleep(0.001)
+        with lock:
+            in_progress[0] -= 1
+
+    mocker.patch.object(ObjectClient, "delete", side_effect=delete)
+
+    client = ObjectClient(mocker.Mock())
+    outcomes = client.delete_many(
+        PROJECT_ID, ["/{}".format(i) for i in range(50)], max_workers=3
+    )
+
+    assert len(outcomes) == 50
+    assert max_in_progress[0] <= 3
+
+
 def test_object_client_presign_download(mocker):
     mocker.patch.object(
         ObjectClient, "_post", return_value=SIMPLE_PRESIGN_RESPONSE
@@ -535,6 +683,103 @@ def test_object_client_presign_upload_part(mocker):
     )
 
 
+def test_batch_presign_response_schema():
+    data = _BatchPresignResponseSchema().load({"urls": ["url-1", "url-2"]})
+    assert data == _BatchPresignResponse(urls=["url-1", "url-2"])
+
+
+def test_object_client_presign_upload_parts(mocker):
+    mocker.patch.object(
+        ObjectClient,
+        "_put",
+        return_value=_BatchPresignResponse(urls=["url-1", "url-2"]),
+    )
+    schema_mock = mocker.patch(
+        "faculty.clients.object._BatchPresignResponseSchema"
+    )
+
+    client = ObjectClient(mocker.Mock())
+    returned = client.presign_upload_parts(
+        PROJECT_ID, "/path", "upload-id", iter([1, 2])
+    )
+
+    assert returned == ["url-1", "url-2"]
+
+    schema_mock.assert_called_once_with()
+    ObjectClient._put.assert_called_once_with(
+        "/project/{}/presign/upload/parts".format(PROJECT_ID),
+        schema_mock.return_value,
+        json={
+            "path": "/path",
+            "uploadId": "upload-id",
+            "partNumbers": [1, 2],
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "exception_class, error_code",
+    [(NotFound, None), (MethodNotAllowed, None), (MethodNotAllowed, "code")],
+)
+def test_object_client_presign_upload_parts_unsupported(
+    mocker, exception_class, error_code
+):
+    exception = exception_class(mocker.Mock(), mocker.Mock(), error_code)
+    mocker.patch.object(ObjectClient, "_put", side_effect=exception)
+    presign_part_mock = mocker.patch.object(
+        ObjectClient,
+        "presign_upload_part",
+        side_effect=lambda project_id, path, upload_id, part_number: (
+            "url-{}".format(part_number)
+        ),
+    )
+
+    client = ObjectClient(mocker.Mock())
+    first = client.presign_upload_parts(
+        PROJECT_ID, "/path", "upload-id", [1, 2]
+    )
+    second = client.presign_upload_parts(PROJECT_ID, "/path", "upload-id", [3])
+
+    assert first == ["url-1", "url-2"]
+    assert second == ["url-3"]
+    # Once found to be unsupported, the batch endpoint is not tried again
+    ObjectClient._put.assert_called_once()
+    presign_part_mock.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/path", "upload-id", 1),
+            mocker.call(PROJECT_ID, "/path", "upload-id", 2),
+            mocker.call(PROJECT_ID, "/path", "upload-id", 3),
+        ]
+    )
+
+
+def test_object_client_presign_upload_parts_unsupported_shared(
+    mocker,
+):
+    exception = NotFound(mocker.Mock(), mocker.Mock())
+    mocker.patch.object(ObjectClient, "_put", side_effect=exception)
+    mocker.patch.object(
+        ObjectClient, "presign_upload_part", return_value="url"
+    )
+    session = _session(mocker)
+
+    for _ in range(2):
+        assert ObjectClient(session).presign_upload_parts(
+            PROJECT_ID, "/path", "upload-id", [1]
+        ) == ["url"]
+
+    ObjectClient._put.assert_called_once()
+
+
+def test_object_client_presign_upload_parts_error(mocker):
+    exception = NotFound(mocker.Mock(), mocker.Mock(), "upload_not_found")
+    mocker.patch.object(ObjectClient, "_put", side_effect=exception)
+
+    client = ObjectClient(mocker.Mock())
+    with pytest.raises(NotFound):
+        client.presign_upload_parts(PROJECT_ID, "/path", "upload-id", [1])
+
+
 def test_object_client_complete_multipart_upload(mocker):
     mocker.patch.object(ObjectClient, "_put_raw")
     payload_schema_mock = mocker.patch(
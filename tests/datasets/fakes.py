@@ -0,0 +1,35 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake object store responses shared by the datasets tests."""
+
+
+def range_response(content):
+    """Build a requests_mock callback serving byte ranges of some content.
+
+    Requests without a Range header get the whole content.
+    """
+
+    def respond(request, context):
+        if "Range" not in request.headers:
+            return content
+        start, end = request.headers["Range"][len("bytes=") :].split("-")
+        end = int(end) if end else len(content) - 1
+        context.status_code = 206
+        context.headers["Content-Range"] = "bytes {}-{}/{}".format(
+            start, end, len(content)
+        )
+        return content[int(start) : end + 1]
+
+    return respond
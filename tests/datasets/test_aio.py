@@ -0,0 +1,366 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import random
+import string
+from uuid import uuid4
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from faculty.clients.object import (  # noqa: E402
+    CloudStorageProvider,
+    CompletedUploadPart,
+)
+from faculty.datasets import aio, listing  # noqa: E402
+from faculty.datasets.util import DatasetsError  # noqa: E402
+
+
+PROJECT_ID = uuid4()
+TEST_PATH = "/path/to/file"
+TEST_S3_UPLOAD_ID = 123
+
+TEST_CONTENT = "".join(
+    random.choice(string.printable) for _ in range(2000)
+).encode("utf8")
+
+
+class _FakeObjectStore(object):
+    """Serves presigned URLs for a single object on a local test server."""
+
+    def __init__(self):
+        self.parts = {}
+        self.gcs_requests = []
+        self.app = web.Application()
+        self.app.router.add_get("/object", self.get_object)
+        self.app.router.add_put("/parts/{part_number}", self.put_part)
+        self.app.router.add_put("/gcs", self.put_gcs)
+        self.server = None
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+    async def get_object(self, request):
+        return web.Response(body=TEST_CONTENT)
+
+    async def put_part(self, request):
+        part_number = int(request.match_info["part_number"])
+        self.parts[part_number] = await request.read()
+        return web.Response(headers={"ETag": "tag-{}".format(part_number)})
+
+    async def put_gcs(self, request):
+        body = await request.read()
+        self.gcs_requests.append((request.headers["Content-Range"], body))
+        return web.Response()
+
+    def presign_upload_parts(self, project_id, path, upload_id, part_numbers):
+        return [self.url("/parts/{}".format(n)) for n in part_numbers]
+
+
+def _run_with_store(test):
+    store = _FakeObjectStore()
+
+    async def main():
+        async with TestServer(store.app) as server:
+            store.server = server
+            await test(store)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    return store
+
+
+@pytest.fixture
+def s3_client(mocker):
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3, upload_id=TEST_S3_UPLOAD_ID
+    )
+    return object_client
+
+
+def _record_blocking_calls(mocker):
+    calls = []
+    run_blocking = aio._run_blocking
+
+    async def recording_run_blocking(function, *args):
+        calls.append(function)
+        return await run_blocking(function, *args)
+
+    mocker.patch("faculty.datasets.aio._run_blocking", recording_run_blocking)
+    return calls
+
+
+def test_download(mocker):
+    object_client = mocker.Mock()
+
+    async def test(store):
+        object_client.presign_download.return_value = store.url("/object")
+        content = await aio.download(object_client, PROJECT_ID, TEST_PATH)
+        assert content == TEST_CONTENT
+
+    _run_with_store(test)
+    object_client.presign_download.assert_called_once_with(
+        PROJECT_ID, TEST_PATH
+    )
+
+
+def test_download_stream(mocker):
+    object_client = mocker.Mock()
+
+    async def test(store):
+        object_client.presign_download.return_value = store.url("/object")
+        chunks = [
+            chunk
+            async for chunk in aio.download_stream(
+                object_client, PROJECT_ID, TEST_PATH, chunk_size=100
+            )
+        ]
+        assert b"".join(chunks) == TEST_CONTENT
+        assert all(len(chunk) <= 100 for chunk in chunks)
+
+    _run_with_store(test)
+
+
+def test_download_file(mocker, tmpdir):
+    object_client = mocker.Mock()
+    blocking_calls = _record_blocking_calls(mocker)
+    destination = tmpdir.join("destination.txt")
+
+    async def test(store):
+        object_client.presign_download.return_value = store.url("/object")
+        await aio.download_file(
+            object_client, PROJECT_ID, TEST_PATH, destination
+        )
+
+    _run_with_store(test)
+    assert destination.read(mode="rb") == TEST_CONTENT
+    assert any(
+        getattr(function, "__name__", None) == "write"
+        for function in blocking_calls
+    )
+
+
+def test_download_missing_object(mocker, tmpdir):
+    object_client = mocker.Mock()
+    destination = tmpdir.join("destination.txt")
+
+    async def test(store):
+        object_client.presign_download.return_value = store.url("/missing")
+        with pytest.raises(DatasetsError):
+            await aio.download_file(
+                object_client, PROJECT_ID, TEST_PATH, destination
+            )
+
+    _run_with_store(test)
+    assert not destination.exists()
+
+
+def test_many_downloads_share_session(mocker):
+    object_client = mocker.Mock()
+
+    async def test(store):
+        object_client.presign_download.return_value = store.url("/object")
+        async with aiohttp.ClientSession() as session:
+            contents = await asyncio.gather(
+                *[
+                    aio.download(
+                        object_client, PROJECT_ID, TEST_PATH, session=session
+                    )
+                    for _ in range(10)
+                ]
+            )
+        assert contents == [TEST_CONTENT] * 10
+
+    _run_with_store(test)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_s3_upload(mocker, s3_client, max_workers):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=300)
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload(
+            s3_client,
+            PROJECT_ID,
+            TEST_PATH,
+            TEST_CONTENT,
+            max_workers=max_workers,
+        )
+
+    store = _run_with_store(test)
+
+    assert sorted(store.parts) == list(range(1, 8))
+    assert b"".join(store.parts[n] for n in range(1, 8)) == TEST_CONTENT
+    s3_client.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [CompletedUploadPart(n, "tag-{}".format(n)) for n in range(1, 8)],
+    )
+
+
+def test_s3_upload_stream_presigns_parts_as_needed(mocker, s3_client):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=300)
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload_stream(
+            s3_client, PROJECT_ID, TEST_PATH, [TEST_CONTENT]
+        )
+
+    _run_with_store(test)
+
+    batches = [
+        call[0][3] for call in s3_client.presign_upload_parts.call_args_list
+    ]
+    assert batches == [[1], [2, 3], list(range(4, 8))]
+
+
+def test_upload_invalidates_listings(mocker, s3_client):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=1000)
+    cache = listing.listing_cache(s3_client)
+    cache.set(PROJECT_ID, "/path/", [])
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload(s3_client, PROJECT_ID, TEST_PATH, TEST_CONTENT)
+
+    _run_with_store(test)
+
+    assert cache.get(PROJECT_ID, "/path/") is None
+
+
+def test_s3_upload_stream_async_iterable(mocker, s3_client):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=1000)
+
+    async def content():
+        for i in range(0, len(TEST_CONTENT), 300):
+            yield TEST_CONTENT[i : i + 300]
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload_stream(s3_client, PROJECT_ID, TEST_PATH, content())
+
+    store = _run_with_store(test)
+
+    assert store.parts == {
+        1: TEST_CONTENT[:1000],
+        2: TEST_CONTENT[1000:],
+    }
+
+
+def test_s3_upload_file(mocker, s3_client, tmpdir):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=1500)
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload_file(s3_client, PROJECT_ID, TEST_PATH, source)
+
+    store = _run_with_store(test)
+
+    assert store.parts == {
+        1: TEST_CONTENT[:1500],
+        2: TEST_CONTENT[1500:],
+    }
+
+
+def test_upload_file_reads_off_the_event_loop(mocker, s3_client, tmpdir):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=1500)
+    blocking_calls = _record_blocking_calls(mocker)
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+
+    async def test(store):
+        s3_client.presign_upload_parts.side_effect = store.presign_upload_parts
+        await aio.upload_file(s3_client, PROJECT_ID, TEST_PATH, source)
+
+    _run_with_store(test)
+
+    assert open in blocking_calls
+    assert any(
+        getattr(function, "__name__", None) == "read"
+        for function in blocking_calls
+    )
+
+
+def test_gcs_upload(mocker):
+    mocker.patch("faculty.datasets.aio.upload_chunk_size", return_value=1000)
+    object_client = mocker.Mock()
+
+    async def test(store):
+        object_client.presign_upload.return_value = mocker.Mock(
+            provider=CloudStorageProvider.GCS, url=store.url("/gcs")
+        )
+        await aio.upload(object_client, PROJECT_ID, TEST_PATH, TEST_CONTENT)
+
+    store = _run_with_store(test)
+
+    assert store.gcs_requests == [
+        ("bytes 0-999/*", TEST_CONTENT[:1000]),
+        ("bytes 1000-1999/2000", TEST_CONTENT[1000:]),
+    ]
+
+
+@pytest.mark.parametrize("content", [[], [b""]])
+def test_rechunking_of_empty_content(content):
+    async def rechunk():
+        return [chunk async for chunk in aio._rechunk_data(content, 4)]
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(rechunk()) == [b""]
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("input_chunk_size", [3, 4, 7])
+def test_rechunking_copies_reused_buffers(input_chunk_size):
+    content = b"0123456789abcdef"
+
+    def reused_buffer():
+        buffer = bytearray(input_chunk_size)
+        for i in range(0, len(content), input_chunk_size):
+            piece = content[i : i + input_chunk_size]
+            buffer[: len(piece)] = piece
+            yield memoryview(buffer)[: len(piece)]
+
+    async def rechunk():
+        return [
+            bytes(chunk)
+            async for chunk in aio._rechunk_data(reused_buffer(), 4)
+        ]
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(rechunk()) == [
+            b"0123",
+            b"4567",
+            b"89ab",
+            b"cdef",
+        ]
+    finally:
+        loop.close()
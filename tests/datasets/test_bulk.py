@@ -0,0 +1,632 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from faculty.clients.object import (
+    ListObjectsResponse,
+    Object,
+    PathAlreadyExists,
+)
+from faculty.datasets import bulk
+from faculty.datasets.manifest import SyncManifest
+from faculty.datasets.util import BulkTransferError, DatasetsError
+
+
+PROJECT_ID = uuid4()
+
+
+@pytest.fixture
+def local_tree(tmpdir):
+    root = tmpdir.mkdir("root")
+    root.join("a.txt").write(b"a" * 10, mode="wb")
+    root.mkdir("empty")
+    nested = root.mkdir("dir").mkdir("nested")
+    nested.join("b.txt").write(b"b" * 100, mode="wb")
+    root.join("dir", "c.txt").write(b"c" * 1000, mode="wb")
+    return root
+
+
+def test_scan_tree(local_tree):
+    directories, files = bulk._scan_tree(str(local_tree))
+
+    assert directories == ["dir", "dir/nested", "empty"]
+    assert files == [
+        bulk._File("a.txt", 10, None),
+        bulk._File("dir/c.txt", 1000, None),
+        bulk._File("dir/nested/b.txt", 100, None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "directories, expected",
+    [
+        ([], [""]),
+        (["a"], ["a"]),
+        (["a", "a/b", "a/b/c", "a/d", "e"], ["a/b/c", "a/d", "e"]),
+    ],
+)
+def test_leaf_directories(directories, expected):
+    assert bulk._leaf_directories(directories) == expected
+
+
+def test_put_tree(mocker, local_tree):
+    object_client = mocker.Mock()
+    upload_mock = mocker.patch("faculty.datasets.transfer.upload_file")
+    progress = mocker.Mock()
+
+    bulk.put_tree(
+        object_client,
+        PROJECT_ID,
+        str(local_tree),
+        "/target",
+        large_file_size=1000,
+        part_workers=3,
+        progress=progress,
+    )
+
+    create_calls = object_client.create_directory.call_args_list
+    assert create_calls[0] == mocker.call(PROJECT_ID, "/target")
+    assert sorted(call[0][1] for call in create_calls[1:]) == [
+        "/target/dir/nested",
+        "/target/empty",
+    ]
+    for call in create_calls[1:]:
+        assert call[1] == {"parents": True}
+    upload_mock.assert_has_calls(
+        [
+            mocker.call(
+                object_client,
+                PROJECT_ID,
+                "/target/a.txt",
+                os.path.join(str(local_tree), "a.txt"),
+                max_workers=1,
+            ),
+            mocker.call(
+                object_client,
+                PROJECT_ID,
+                "/target/dir/c.txt",
+                os.path.join(str(local_tree), "dir", "c.txt"),
+                max_workers=3,
+            ),
+            mocker.call(
+                object_client,
+                PROJECT_ID,
+                "/target/dir/nested/b.txt",
+                os.path.join(str(local_tree), "dir", "nested", "b.txt"),
+                max_workers=1,
+            ),
+        ],
+        any_order=True,
+    )
+    reports = [call[0][0] for call in progress.call_args_list]
+    assert sorted(report.path for report in reports) == [
+        "a.txt",
+        "dir/c.txt",
+        "dir/nested/b.txt",
+    ]
+    assert [report.files_done for report in reports] == [1, 2, 3]
+    assert reports[-1].bytes_done == reports[-1].bytes_total == 1110
+    assert all(report.error is None for report in reports)
+
+
+def test_put_tree_empty_directory(mocker, tmpdir):
+    object_client = mocker.Mock()
+    upload_mock = mocker.patch("faculty.datasets.transfer.upload_file")
+
+    bulk.put_tree(object_client, PROJECT_ID, str(tmpdir), "/target")
+
+    object_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/target"
+    )
+    upload_mock.assert_not_called()
+
+
+def test_put_tree_existing_destination(mocker, local_tree):
+    object_client = mocker.Mock()
+    object_client.create_directory.side_effect = PathAlreadyExists("/target")
+    upload_mock = mocker.patch("faculty.datasets.transfer.upload_file")
+
+    with pytest.raises(PathAlreadyExists):
+        bulk.put_tree(object_client, PROJECT_ID, str(local_tree), "/target")
+
+    object_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/target"
+    )
+    upload_mock.assert_not_called()
+
+
+def test_put_tree_reports_failures(mocker, local_tree):
+    error = ValueError("failed")
+
+    def upload_file(object_client, project_id, project_path, *args, **kw):
+        if project_path.endswith("c.txt"):
+            raise error
+
+    upload_mock = mocker.patch(
+        "faculty.datasets.transfer.upload_file", side_effect=upload_file
+    )
+    progress = mocker.Mock()
+
+    with pytest.raises(BulkTransferError) as excinfo:
+        bulk.put_tree(
+            mocker.Mock(),
+            PROJECT_ID,
+            str(local_tree),
+            "/target",
+            progress=progress,
+        )
+
+    assert excinfo.value.failures == {"dir/c.txt": error}
+    assert upload_mock.call_count == 3
+    errors = {
+        call[0][0].path: call[0][0].error for call in progress.call_args_list
+    }
+    assert errors == {
+        "a.txt": None,
+        "dir/c.txt": error,
+        "dir/nested/b.txt": None,
+    }
+
+
+def _object(path, size=0):
+    return Object(path, size, "etag", None)
+
+
+@pytest.fixture
+def remote_tree(mocker):
+    object_client = mocker.Mock()
+    object_client.list.side_effect = [
+        ListObjectsResponse(
+            objects=[
+                _object("/source/"),
+                _object("/source/a.txt", 10),
+                _object("/source/dir/"),
+                _object("/source/dir/c.txt", 1000),
+            ],
+            next_page_token="token",
+        ),
+        ListObjectsResponse(
+            objects=[
+                _object("/source/dir/nested/b.txt", 100),
+                _object("/source/empty/"),
+            ],
+            next_page_token=None,
+        ),
+    ]
+    return object_client
+
+
+def test_get_tree(mocker, remote_tree, tmpdir):
+    download_mock = mocker.patch("faculty.datasets.transfer.download_file")
+    ranged_mock = mocker.patch(
+        "faculty.datasets.transfer.download_file_ranged"
+    )
+    progress = mocker.Mock()
+    destination = tmpdir.join("destination")
+
+    bulk.get_tree(
+        remote_tree,
+        PROJECT_ID,
+        "source",
+        str(destination),
+        large_file_size=1000,
+        range_workers=3,
+        progress=progress,
+    )
+
+    remote_tree.list.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/source/"),
+            mocker.call(PROJECT_ID, "/source/", "token"),
+        ]
+    )
+    for directory in [[], ["dir"], ["dir", "nested"], ["empty"]]:
+        assert destination.join(*directory).isdir()
+    download_mock.assert_has_calls(
+        [
+            mocker.call(
+                remote_tree,
+                PROJECT_ID,
+                "/source/a.txt",
+                os.path.join(str(destination), "a.txt"),
+            ),
+            mocker.call(
+                remote_tree,
+                PROJECT_ID,
+                "/source/dir/nested/b.txt",
+                os.path.join(str(destination), "dir", "nested", "b.txt"),
+            ),
+        ],
+        any_order=True,
+    )
+    assert download_mock.call_count == 2
+    ranged_mock.assert_called_once_with(
+        remote_tree,
+        PROJECT_ID,
+        "/source/dir/c.txt",
+        os.path.join(str(destination), "dir", "c.txt"),
+        1000,
+        3,
+        bulk.transfer.DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        etag="etag",
+    )
+    reports = [call[0][0] for call in progress.call_args_list]
+    assert [report.files_done for report in reports] == [1, 2, 3]
+    assert reports[-1].bytes_done == reports[-1].bytes_total == 1110
+
+
+def test_get_tree_reports_failures(mocker, remote_tree, tmpdir):
+    error = ValueError("failed")
+
+    def download_file(object_client, project_id, project_path, *args):
+        if project_path.endswith("a.txt"):
+            raise error
+
+    download_mock = mocker.patch(
+        "faculty.datasets.transfer.download_file", side_effect=download_file
+    )
+
+    with pytest.raises(BulkTransferError) as excinfo:
+        bulk.get_tree(
+            remote_tree, PROJECT_ID, "/source", str(tmpdir.join("target"))
+        )
+
+    assert excinfo.value.failures == {"a.txt": error}
+    assert download_mock.call_count == 3
+
+
+def test_move_tree(mocker, remote_tree):
+    progress = mocker.Mock()
+
+    bulk.move_tree(
+        remote_tree, PROJECT_ID, "/source", "/target", progress=progress
+    )
+
+    remote_tree.create_directory.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/target/dir/nested", parents=True),
+            mocker.call(PROJECT_ID, "/target/empty", parents=True),
+        ],
+        any_order=True,
+    )
+    assert remote_tree.create_directory.call_count == 2
+    remote_tree.copy.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/source/a.txt", "/target/a.txt"),
+            mocker.call(PROJECT_ID, "/source/dir/c.txt", "/target/dir/c.txt"),
+            mocker.call(
+                PROJECT_ID,
+                "/source/dir/nested/b.txt",
+                "/target/dir/nested/b.txt",
+            ),
+        ],
+        any_order=True,
+    )
+    assert remote_tree.copy.call_count == 3
+    assert remote_tree.delete.call_args_list[-1] == mocker.call(
+        PROJECT_ID, "/source/", recursive=True
+    )
+    assert remote_tree.delete.call_count == 4
+    reports = [call[0][0] for call in progress.call_args_list]
+    assert [report.files_done for report in reports] == [1, 2, 3]
+    assert reports[-1].bytes_done == 1110
+
+
+def test_move_tree_file(mocker):
+    object_client = mocker.Mock()
+    object_client.list.return_value = ListObjectsResponse([], None)
+
+    bulk.move_tree(object_client, PROJECT_ID, "/file.txt", "/moved.txt")
+
+    object_client.copy.assert_called_once_with(
+        PROJECT_ID, "/file.txt", "/moved.txt"
+    )
+    object_client.delete.assert_called_once_with(PROJECT_ID, "/file.txt")
+
+
+def test_move_tree_keeps_files_that_failed(mocker, remote_tree):
+    error = ValueError("failed")
+
+    def copy(project_id, source, destination):
+        if source.endswith("a.txt"):
+            raise error
+
+    remote_tree.copy.side_effect = copy
+
+    with pytest.raises(BulkTransferError) as excinfo:
+        bulk.move_tree(remote_tree, PROJECT_ID, "/source", "/target")
+
+    assert excinfo.value.failures == {"a.txt": error}
+    deleted = [call[0][1] for call in remote_tree.delete.call_args_list]
+    assert sorted(deleted) == ["/source/dir/c.txt", "/source/dir/nested/b.txt"]
+
+
+class _FakeDatasets(object):
+    """An in-memory datasets directory, for testing sync."""
+
+    def __init__(self):
+        self.contents = {}
+        self.directories = set()
+        self.version = 0
+        self.uploaded = []
+        self.downloaded = []
+        self.deleted = []
+
+    def write(self, path, content, modified=None):
+        self.version += 1
+        if modified is None:
+            modified = datetime.utcnow()
+        etag = "etag-{}".format(self.version)
+        self.contents[path] = (content, etag, modified)
+
+    def list(self, project_id, prefix, page_token=None):
+        objects = [
+            Object(path, len(content), etag, modified)
+            for path, (content, etag, modified) in self.contents.items()
+        ]
+        objects += [_object(path) for path in self.directories]
+        return ListObjectsResponse(
+            objects=sorted(o for o in objects if o.path.startswith(prefix)),
+            next_page_token=None,
+        )
+
+    def create_directory(self, project_id, path, parents=False):
+        self.directories.add(path.rstrip("/") + "/")
+
+    def delete(self, project_id, path, recursive=False):
+        self.deleted.append(path)
+        for existing in list(self.contents):
+            if existing == path or (recursive and existing.startswith(path)):
+                del self.contents[existing]
+
+    def upload_file(self, object_client, project_id, path, local_path, **kw):
+        self.uploaded.append(path)
+        with open(local_path, "rb") as fp:
+            self.write(path, fp.read())
+
+    def download_file(self, object_client, project_id, path, local_path):
+        self.downloaded.append(path)
+        with open(local_path, "wb") as fp:
+            fp.write(self.contents[path][0])
+
+
+@pytest.fixture
+def fake_datasets(mocker):
+    datasets = _FakeDatasets()
+    mocker.patch(
+        "faculty.datasets.transfer.upload_file",
+        side_effect=datasets.upload_file,
+    )
+    mocker.patch(
+        "faculty.datasets.transfer.download_file",
+        side_effect=datasets.download_file,
+    )
+    return datasets
+
+
+def _sync(fake_datasets, local_tree, tmpdir, **kwargs):
+    return bulk.sync_tree(
+        fake_datasets,
+        PROJECT_ID,
+        str(local_tree),
+        "/target",
+        manifest_directory=str(tmpdir.join("manifests")),
+        **kwargs
+    )
+
+
+def test_sync_put(fake_datasets, local_tree, tmpdir):
+    result = _sync(fake_datasets, local_tree, tmpdir)
+
+    assert result.transferred == ["a.txt", "dir/c.txt", "dir/nested/b.txt"]
+    assert result.unchanged == []
+    assert result.deleted == []
+    assert fake_datasets.contents["/target/dir/c.txt"][0] == b"c" * 1000
+    assert "/target/empty/" in fake_datasets.directories
+
+
+def test_sync_put_only_transfers_changes(fake_datasets, local_tree, tmpdir):
+    _sync(fake_datasets, local_tree, tmpdir)
+    fake_datasets.uploaded = []
+    local_tree.join("a.txt").write(b"A" * 10, mode="wb")
+    # Make sure the modification time changes whatever its resolution
+    os.utime(str(local_tree.join("a.txt")), (0, 0))
+    local_tree.join("new.txt").write(b"new", mode="wb")
+
+    result = _sync(fake_datasets, local_tree, tmpdir)
+
+    assert result.transferred == ["a.txt", "new.txt"]
+    assert result.unchanged == ["dir/c.txt", "dir/nested/b.txt"]
+    assert sorted(fake_datasets.uploaded) == [
+        "/target/a.txt",
+        "/target/new.txt",
+    ]
+    assert fake_datasets.contents["/target/a.txt"][0] == b"A" * 10
+
+
+def test_sync_put_replaces_changed_remote_file(
+    fake_datasets, local_tree, tmpdir
+):
+    _sync(fake_datasets, local_tree, tmpdir)
+    fake_datasets.write("/target/a.txt", b"x" * 10)
+
+    result = _sync(fake_datasets, local_tree, tmpdir)
+
+    assert result.transferred == ["a.txt"]
+    assert fake_datasets.contents["/target/a.txt"][0] == b"a" * 10
+
+
+def test_sync_put_without_manifest_compares_timestamps(
+    fake_datasets, local_tree, tmpdir
+):
+    future = datetime.utcnow() + timedelta(days=1)
+    fake_datasets.write("/target/a.txt", b"x" * 10, modified=future)
+    fake_datasets.write("/target/dir/c.txt", b"x" * 10, modified=future)
+    past = datetime(2000, 1, 1)
+    fake_datasets.write("/target/dir/nested/b.txt", b"x" * 100, past)
+
+    result = _sync(fake_datasets, local_tree, tmpdir)
+
+    # a.txt is newer remotely with the same size; c.txt differs in size and
+    # b.txt is older remotely
+    assert result.transferred == ["dir/c.txt", "dir/nested/b.txt"]
+    assert result.unchanged == ["a.txt"]
+
+
+def test_sync_put_with_checksum(fake_datasets, local_tree, tmpdir):
+    past = datetime(2000, 1, 1)
+    future = datetime.utcnow() + timedelta(days=1)
+    # Same content but older remotely
+    fake_datasets.contents["/target/a.txt"] = (
+        b"a" * 10,
+        hashlib.md5(b"a" * 10).hexdigest(),
+        past,
+    )
+    # Same size but different content, and newer remotely
+    fake_datasets.contents["/target/dir/nested/b.txt"] = (
+        b"x" * 100,
+        hashlib.md5(b"x" * 100).hexdigest(),
+        future,
+    )
+
+    result = _sync(fake_datasets, local_tree, tmpdir, checksum=True)
+
+    assert result.transferred == ["dir/c.txt", "dir/nested/b.txt"]
+    assert result.unchanged == ["a.txt"]
+
+
+def test_sync_put_delete(fake_datasets, local_tree, tmpdir):
+    fake_datasets.write("/target/extra.txt", b"extra")
+    fake_datasets.write("/target/old/file.txt", b"old")
+    fake_datasets.directories.add("/target/old/")
+
+    result = _sync(fake_datasets, local_tree, tmpdir, delete=True)
+
+    assert result.deleted == ["extra.txt", "old/"]
+    assert sorted(fake_datasets.deleted) == [
+        "/target/extra.txt",
+        "/target/old/",
+    ]
+    assert "/target/old/file.txt" not in fake_datasets.contents
+
+
+def test_sync_get(fake_datasets, tmpdir):
+    fake_datasets.write("/target/a.txt", b"a")
+    fake_datasets.write("/target/dir/b.txt", b"b")
+    destination = tmpdir.join("destination")
+
+    result = _sync(fake_datasets, destination, tmpdir, direction="get")
+
+    assert result.transferred == ["a.txt", "dir/b.txt"]
+    assert destination.join("dir", "b.txt").read(mode="rb") == b"b"
+
+    fake_datasets.downloaded = []
+    fake_datasets.write("/target/a.txt", b"A")
+    result = _sync(fake_datasets, destination, tmpdir, direction="get")
+
+    assert result.transferred == ["a.txt"]
+    assert result.unchanged == ["dir/b.txt"]
+    assert fake_datasets.downloaded == ["/target/a.txt"]
+    assert destination.join("a.txt").read(mode="rb") == b"A"
+
+
+def test_sync_get_delete(fake_datasets, local_tree, tmpdir):
+    fake_datasets.write("/target/a.txt", b"a" * 10)
+
+    result = _sync(
+        fake_datasets, local_tree, tmpdir, direction="get", delete=True
+    )
+
+    assert result.deleted == ["dir/", "empty/"]
+    assert sorted(os.listdir(str(local_tree))) == ["a.txt"]
+
+
+def test_sync_get_missing_source(fake_datasets, local_tree, tmpdir):
+    fake_datasets.write("/other/a.txt", b"a")
+
+    with pytest.raises(DatasetsError):
+        _sync(fake_datasets, local_tree, tmpdir, direction="get", delete=True)
+
+    assert sorted(os.listdir(str(local_tree))) == ["a.txt", "dir", "empty"]
+
+
+def test_sync_failure_skips_deletion(fake_datasets, local_tree, tmpdir):
+    fake_datasets.write("/target/extra.txt", b"extra")
+    error = ValueError("failed")
+    bulk.transfer.upload_file.side_effect = error
+
+    with pytest.raises(BulkTransferError):
+        _sync(fake_datasets, local_tree, tmpdir, delete=True)
+
+    assert "/target/extra.txt" in fake_datasets.contents
+    manifest = SyncManifest.for_directories(
+        PROJECT_ID, "/target/", str(local_tree), str(tmpdir.join("manifests"))
+    )
+    manifest.load()
+    assert manifest.entries == {}
+
+
+def test_sync_invalid_direction(mocker, local_tree):
+    with pytest.raises(ValueError):
+        bulk.sync_tree(
+            mocker.Mock(), PROJECT_ID, str(local_tree), "/", direction="up"
+        )
+
+
+def test_run_lanes_small_tasks_not_blocked_by_large():
+    large_may_finish = threading.Event()
+    small_done = []
+
+    def function(task):
+        if task == "large":
+            assert large_may_finish.wait(5)
+        else:
+            small_done.append(task)
+            if len(small_done) == 20:
+                large_may_finish.set()
+
+    lanes = [
+        bulk._Lane(["large"], 1),
+        bulk._Lane(["small-{}".format(i) for i in range(20)], 2),
+    ]
+    results = list(bulk._run_lanes(function, lanes))
+
+    # The large task only finishes once all the small ones have, so would
+    # time out and fail if they had to wait for it
+    assert len(results) == 21
+    assert all(error is None for _, error in results)
+
+
+def test_run_lanes_bounds_tasks_in_progress():
+    lock = threading.Lock()
+    state = {"running": 0, "max_running": 0}
+
+    def function(task):
+        with lock:
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        with lock:
+            state["running"] -= 1
+
+    list(bulk._run_lanes(function, [bulk._Lane(range(50), 3)]))
+
+    assert state["max_running"] <= 3
@@ -0,0 +1,197 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import time
+from uuid import uuid4
+
+import pytest
+
+from faculty.clients.base import NotFound
+from faculty.clients.object import Object
+from faculty.datasets.cache import CacheStats, DownloadCache
+from faculty.datasets.util import DatasetsError
+
+
+PROJECT_ID = uuid4()
+TEST_URL = "https://example.com/presigned/url"
+
+
+class _FakeDatasets(object):
+    def __init__(self):
+        self.contents = {}
+        self.downloads = 0
+
+    def get(self, project_id, path):
+        content, etag = self.contents[path]
+        return Object(path, len(content), etag, None)
+
+    def download_file_from_offset(
+        self, object_client, project_id, path, local_path, offset, _, obj
+    ):
+        self.downloads += 1
+        content, etag = self.contents[path]
+        if etag != obj.etag:
+            raise DatasetsError("Precondition failed")
+        with open(local_path, "wb") as fp:
+            fp.write(content[offset:])
+
+
+@pytest.fixture
+def fake_datasets(mocker):
+    datasets = _FakeDatasets()
+    mocker.patch(
+        "faculty.datasets.transfer.download_file_from_offset",
+        side_effect=datasets.download_file_from_offset,
+    )
+    return datasets
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return DownloadCache(str(tmpdir.join("cache")), max_size=100)
+
+
+def test_download_hit_and_miss(fake_datasets, cache):
+    fake_datasets.contents["/file"] = (b"content", "etag-1")
+
+    assert cache.download(fake_datasets, PROJECT_ID, "/file") == b"content"
+    assert cache.download(fake_datasets, PROJECT_ID, "/file") == b"content"
+
+    assert fake_datasets.downloads == 1
+    assert cache.stats == CacheStats(hits=1, misses=1, evictions=0)
+
+
+def test_changed_etag_is_a_miss(fake_datasets, cache):
+    fake_datasets.contents["/file"] = (b"old", "etag-1")
+    cache.download(fake_datasets, PROJECT_ID, "/file")
+    fake_datasets.contents["/file"] = (b"new", "etag-2")
+
+    assert cache.download(fake_datasets, PROJECT_ID, "/file") == b"new"
+    assert cache.stats == CacheStats(hits=0, misses=2, evictions=0)
+
+
+def test_download_file(fake_datasets, cache, tmpdir):
+    fake_datasets.contents["/file"] = (b"content", "etag-1")
+    destination = tmpdir.join("destination")
+
+    cache.download_file(fake_datasets, PROJECT_ID, "/file", str(destination))
+
+    assert destination.read(mode="rb") == b"content"
+
+
+def test_open_text(fake_datasets, cache):
+    fake_datasets.contents["/file"] = (b"line\n", "etag-1")
+    with cache.open(fake_datasets, PROJECT_ID, "/file", "r") as fp:
+        assert fp.read() == u"line\n"
+
+
+def test_open_for_writing(fake_datasets, cache):
+    with pytest.raises(ValueError):
+        cache.open(fake_datasets, PROJECT_ID, "/file", "wb")
+
+
+def test_evicts_least_recently_used(fake_datasets, cache):
+    for name in ["a", "b", "c"]:
+        fake_datasets.contents["/" + name] = (name.encode() * 40, name)
+
+    cache.download(fake_datasets, PROJECT_ID, "/a")
+    cache.download(fake_datasets, PROJECT_ID, "/b")
+    # Make sure the cached files have distinct modification times
+    a_path = cache.path(fake_datasets, PROJECT_ID, "/a")
+    b_path = cache._cached_path(PROJECT_ID, "/b", "b")
+    os.utime(b_path, (time.time() - 100, time.time() - 100))
+    os.utime(a_path, None)
+
+    cache.download(fake_datasets, PROJECT_ID, "/c")
+
+    assert os.path.exists(a_path)
+    assert not os.path.exists(b_path)
+    assert cache.stats.evictions == 1
+
+
+def test_removes_stale_temporary_files(fake_datasets, cache):
+    fake_datasets.contents["/a"] = (b"a", "a")
+    cache.download(fake_datasets, PROJECT_ID, "/a")
+    directory = os.path.dirname(cache._cached_path(PROJECT_ID, "/a", "a"))
+    stale = os.path.join(directory, ".tmp-stale")
+    recent = os.path.join(directory, ".tmp-recent")
+    for path in [stale, recent]:
+        open(path, "wb").close()
+    os.utime(stale, (0, 0))
+
+    fake_datasets.contents["/b"] = (b"b", "b")
+    cache.download(fake_datasets, PROJECT_ID, "/b")
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(recent)
+
+
+def test_incomplete_download_not_cached(fake_datasets, cache, mocker):
+    fake_datasets.contents["/file"] = (b"content", "etag-1")
+    mocker.patch.object(
+        fake_datasets,
+        "get",
+        return_value=Object("/file", 1000, "etag-1", None),
+    )
+
+    with pytest.raises(DatasetsError):
+        cache.download(fake_datasets, PROJECT_ID, "/file")
+
+    assert list(cache._cached_files()) == []
+
+
+def test_replaced_object_not_cached(fake_datasets, cache, mocker):
+    fake_datasets.contents["/file"] = (b"new", "etag-2")
+    mocker.patch.object(
+        fake_datasets, "get", return_value=Object("/file", 3, "etag-1", None)
+    )
+
+    with pytest.raises(DatasetsError):
+        cache.download(fake_datasets, PROJECT_ID, "/file")
+
+    assert list(cache._cached_files()) == []
+
+
+def test_download_is_conditional_on_etag(mocker, requests_mock, cache):
+    object_client = mocker.Mock()
+    object_client.get.return_value = Object("/file", 3, '"etag-1"', None)
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, status_code=412)
+
+    with pytest.raises(DatasetsError, match="changed"):
+        cache.download(object_client, PROJECT_ID, "/file")
+
+    assert requests_mock.last_request.headers["If-Match"] == '"etag-1"'
+    assert list(cache._cached_files()) == []
+
+
+def test_missing_object(mocker, cache):
+    object_client = mocker.Mock()
+    object_client.get.side_effect = NotFound(mocker.Mock())
+
+    with pytest.raises(DatasetsError, match="No such object"):
+        cache.path(object_client, PROJECT_ID, "/file")
+
+
+def test_clear(fake_datasets, cache):
+    fake_datasets.contents["/file"] = (b"content", "etag-1")
+    cache.download(fake_datasets, PROJECT_ID, "/file")
+
+    cache.clear()
+
+    assert list(cache._cached_files()) == []
+    cache.download(fake_datasets, PROJECT_ID, "/file")
+    assert fake_datasets.downloads == 2
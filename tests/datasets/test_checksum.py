@@ -0,0 +1,112 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import base64
+import hashlib
+
+import pytest
+
+from faculty.datasets import checksum
+
+
+CONTENT = b"".join(bytes(bytearray([i % 256])) * 7 for i in range(100))
+
+
+def _multipart_etag(content, part_size):
+    digests = [
+        hashlib.md5(content[start : start + part_size]).digest()
+        for start in range(0, max(1, len(content)), part_size)
+    ]
+    return "{}-{}".format(
+        hashlib.md5(b"".join(digests)).hexdigest(), len(digests)
+    )
+
+
+@pytest.mark.parametrize("update_size", [1, 33, 100, 700, 1000])
+def test_multipart_checksum(update_size):
+    result = checksum.MultipartChecksum(part_size=100)
+    for start in range(0, len(CONTENT), update_size):
+        result.update(memoryview(CONTENT)[start : start + update_size])
+
+    assert result.hexdigest() == hashlib.md5(CONTENT).hexdigest()
+    assert result.multipart_etag() == _multipart_etag(CONTENT, 100)
+
+
+def test_multipart_checksum_partial_last_part():
+    result = checksum.MultipartChecksum(part_size=300)
+    result.update(CONTENT)
+    assert result.multipart_etag() == _multipart_etag(CONTENT, 300)
+
+
+def test_multipart_checksum_empty():
+    result = checksum.MultipartChecksum(part_size=100)
+    assert result.multipart_etag() == _multipart_etag(b"", 100)
+
+
+@pytest.mark.parametrize(
+    "etag, expected",
+    [
+        ('"{}"'.format(hashlib.md5(CONTENT).hexdigest()), True),
+        (hashlib.md5(b"other").hexdigest(), False),
+        (_multipart_etag(CONTENT, 100), True),
+        (_multipart_etag(CONTENT[:-1] + b"x", 100), False),
+        (_multipart_etag(CONTENT, 200), None),
+    ],
+)
+def test_etag_matches(etag, expected):
+    result = checksum.MultipartChecksum(part_size=100)
+    result.update(CONTENT)
+    assert checksum.etag_matches(etag, result) is expected
+
+
+def test_etag_matches_without_part_size():
+    result = checksum.MultipartChecksum()
+    result.update(CONTENT)
+    assert checksum.etag_matches(_multipart_etag(CONTENT, 100), result) is None
+
+
+def test_file_matches_etag(tmpdir):
+    path = tmpdir.join("file")
+    path.write(CONTENT, mode="wb")
+
+    assert checksum.file_matches_etag(
+        str(path), _multipart_etag(CONTENT, 100), 100
+    )
+    assert not checksum.file_matches_etag(
+        str(path), hashlib.md5(b"other").hexdigest(), 100
+    )
+
+
+def test_response_md5():
+    md5 = hashlib.md5(CONTENT)
+    encoded = base64.b64encode(md5.digest()).decode("ascii")
+    headers = {
+        "x-goog-hash": "crc32c=n03x6A==, md5={}".format(encoded),
+        "ETag": '"other"',
+    }
+    assert checksum.response_md5(headers) == md5.hexdigest()
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"ETag": '"abc"'}, "abc"),
+        ({"ETag": '"abc-2"'}, None),
+        ({"x-goog-hash": "crc32c=n03x6A=="}, None),
+        ({}, None),
+    ],
+)
+def test_response_md5_etag(headers, expected):
+    assert checksum.response_md5(headers) == expected
@@ -0,0 +1,88 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from faculty.datasets.chunking import AdaptiveChunkSize, FixedChunkSize
+
+
+@pytest.mark.parametrize(
+    "minimum, maximum, expected",
+    [(10, 1000, 100), (200, 1000, 200), (10, 50, 50)],
+)
+def test_fixed_chunk_size(minimum, maximum, expected):
+    assert FixedChunkSize(100).chunk_size(minimum, maximum) == expected
+
+
+def test_adaptive_chunk_size_initial():
+    policy = AdaptiveChunkSize(initial_chunk_size=100)
+    assert policy.throughput is None
+    assert policy.chunk_size(1, 1000) == 100
+
+
+def test_adaptive_chunk_size_grows_gradually():
+    policy = AdaptiveChunkSize(
+        initial_chunk_size=100, target_seconds=1.0, max_growth=2.0
+    )
+    # Fast transfers support parts much larger than the initial size
+    policy.record(100, 0.01)
+
+    sizes = [policy.chunk_size(1, 100000) for _ in range(6)]
+
+    assert sizes == [200, 400, 800, 1600, 3200, 6400]
+
+
+def test_adaptive_chunk_size_converges_on_target():
+    policy = AdaptiveChunkSize(
+        initial_chunk_size=1000, target_seconds=2.0, max_growth=2.0
+    )
+    policy.record(1000, 2.0)
+
+    assert policy.throughput == 500
+    assert policy.chunk_size(1, 100000) == 1000
+
+
+def test_adaptive_chunk_size_shrinks():
+    policy = AdaptiveChunkSize(
+        initial_chunk_size=1000, target_seconds=1.0, max_growth=2.0
+    )
+    policy.record(1000, 10.0)
+
+    assert policy.chunk_size(1, 100000) == 500
+    assert policy.chunk_size(1, 100000) == 250
+    assert policy.chunk_size(1, 100000) == 125
+    assert policy.chunk_size(1, 100000) == 100
+
+
+def test_adaptive_chunk_size_smooths_measurements():
+    policy = AdaptiveChunkSize(smoothing=0.5)
+    policy.record(100, 1.0)
+    policy.record(300, 1.0)
+    assert policy.throughput == 200
+
+
+def test_adaptive_chunk_size_ignores_instant_transfers():
+    policy = AdaptiveChunkSize()
+    policy.record(100, 0.0)
+    assert policy.throughput is None
+
+
+@pytest.mark.parametrize(
+    "minimum, maximum, expected",
+    [(1, 100000, 500), (800, 100000, 800), (1, 300, 300)],
+)
+def test_adaptive_chunk_size_limits(minimum, maximum, expected):
+    policy = AdaptiveChunkSize(initial_chunk_size=1000, max_chunk_size=500)
+    assert policy.chunk_size(minimum, maximum) == expected
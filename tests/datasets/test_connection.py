@@ -0,0 +1,61 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from faculty.datasets import connection
+
+
+@pytest.fixture(autouse=True)
+def reset_connection_settings():
+    yield
+    connection.configure()
+
+
+def test_http_session_is_reused():
+    assert connection.http_session() is connection.http_session()
+
+
+def test_http_session_is_not_shared_after_fork(mocker):
+    session = connection.http_session()
+    mocker.patch("os.getpid", return_value=-1)
+    assert connection.http_session() is not session
+
+
+def test_configure(mocker):
+    session = connection.http_session()
+    close_mock = mocker.patch.object(session, "close")
+
+    connection.configure(
+        pool_size=4, keep_alive=False, retries=7, backoff_factor=2
+    )
+
+    close_mock.assert_called_once_with()
+    new_session = connection.http_session()
+    assert new_session is not session
+    assert new_session.headers["Connection"] == "close"
+    adapter = new_session.get_adapter("https://example.com")
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 7
+    assert adapter.max_retries.backoff_factor == 2
+
+
+def test_default_configuration():
+    session = connection.http_session()
+    assert session.headers["Connection"] == "keep-alive"
+    adapter = session.get_adapter("https://example.com")
+    assert adapter._pool_maxsize == connection.DEFAULT_POOL_SIZE
+    assert adapter.max_retries.total == connection.DEFAULT_RETRIES
+    assert 503 in adapter.max_retries.status_forcelist
@@ -0,0 +1,347 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import os
+from uuid import uuid4
+
+import pytest
+
+fsspec = pytest.importorskip("fsspec")
+
+from faculty.clients.object import (  # noqa: E402
+    ListObjectsResponse,
+    Object,
+    PathAlreadyExists,
+)
+from faculty.datasets import listing  # noqa: E402
+from faculty.datasets.filesystem import FacultyFileSystem  # noqa: E402
+from tests.datasets.fakes import range_response  # noqa: E402
+
+
+PROJECT_ID = str(uuid4())
+OTHER_PROJECT_ID = str(uuid4())
+TEST_URL = "https://example.com/presigned/url"
+TEST_CONTENT = b"0123456789" * 20
+
+OBJECTS = [
+    Object("/data/", 0, "etag-0", None),
+    Object("/data/a.csv", len(TEST_CONTENT), "etag-1", None),
+    Object("/data/sub/", 0, "etag-2", None),
+    Object("/data/sub/b.csv", 3, "etag-3", None),
+    Object("/data/sub/deeper/c.csv", 4, "etag-4", None),
+    Object("/database.csv", 5, "etag-5", None),
+    Object("/empty/", 0, "etag-6", None),
+]
+
+
+def _name(path):
+    return PROJECT_ID + path
+
+
+@pytest.fixture
+def object_client(mocker):
+    object_client = mocker.Mock()
+
+    def list_objects(project_id, prefix, page_token=None):
+        return ListObjectsResponse(
+            [obj for obj in OBJECTS if obj.path.startswith(prefix)], None
+        )
+
+    object_client.list.side_effect = list_objects
+    return object_client
+
+
+@pytest.fixture
+def fs(object_client):
+    return FacultyFileSystem(object_client=object_client, max_workers=4)
+
+
+def test_split(fs):
+    assert fs._split("faculty://{}/a/b".format(PROJECT_ID)) == (
+        PROJECT_ID,
+        "/a/b",
+    )
+    assert fs._split(PROJECT_ID) == (PROJECT_ID, "/")
+    with pytest.raises(ValueError):
+        fs._split("faculty://")
+
+
+def test_ls(fs):
+    assert fs.ls(_name("/data")) == [
+        {
+            "name": _name("/data/a.csv"),
+            "size": len(TEST_CONTENT),
+            "type": "file",
+            "etag": "etag-1",
+            "last_modified": None,
+        },
+        {"name": _name("/data/sub"), "size": 0, "type": "directory"},
+    ]
+    assert fs.ls("faculty://" + PROJECT_ID, detail=False) == [
+        _name("/data"),
+        _name("/database.csv"),
+        _name("/empty"),
+    ]
+
+
+def test_ls_file(fs):
+    assert fs.ls(_name("/data/sub/b.csv"), detail=False) == [
+        _name("/data/sub/b.csv")
+    ]
+
+
+def test_ls_empty_directory(fs):
+    assert fs.ls(_name("/empty")) == []
+
+
+def test_ls_missing(fs):
+    with pytest.raises(FileNotFoundError):
+        fs.ls(_name("/missing"))
+
+
+def test_info(fs):
+    assert fs.info(_name("/data/sub/b.csv"))["type"] == "file"
+    assert fs.info(_name("/data/sub/b.csv"))["size"] == 3
+    assert fs.info(_name("/data"))["type"] == "directory"
+    assert fs.info(_name("/data/sub/deeper/"))["type"] == "directory"
+    assert fs.info(PROJECT_ID)["type"] == "directory"
+    with pytest.raises(FileNotFoundError):
+        fs.info(_name("/dat"))
+
+
+def test_listings_are_cached(fs, object_client):
+    fs.ls(_name("/data"))
+    fs.info(_name("/data/sub/b.csv"))
+    fs.isdir(_name("/data/sub"))
+    object_client.list.assert_called_once_with(PROJECT_ID, "/data/")
+
+
+def test_find(fs, object_client):
+    assert fs.find(_name("/data")) == [
+        _name("/data/a.csv"),
+        _name("/data/sub/b.csv"),
+        _name("/data/sub/deeper/c.csv"),
+    ]
+    object_client.list.assert_called_once_with(PROJECT_ID, "/data/")
+
+
+def test_find_withdirs(fs):
+    assert fs.find(_name("/data"), withdirs=True) == [
+        _name("/data"),
+        _name("/data/a.csv"),
+        _name("/data/sub"),
+        _name("/data/sub/b.csv"),
+        _name("/data/sub/deeper"),
+        _name("/data/sub/deeper/c.csv"),
+    ]
+
+
+def test_find_maxdepth(fs):
+    assert fs.find(_name("/data"), maxdepth=1) == [_name("/data/a.csv")]
+
+
+def test_find_file(fs):
+    assert fs.find(_name("/data/a.csv")) == [_name("/data/a.csv")]
+
+
+def test_glob(fs):
+    assert fs.glob(_name("/data/**/*.csv")) == [
+        _name("/data/a.csv"),
+        _name("/data/sub/b.csv"),
+        _name("/data/sub/deeper/c.csv"),
+    ]
+
+
+def test_cat_file(mocker, fs):
+    download = mocker.patch(
+        "faculty.datasets.transfer.download", return_value=TEST_CONTENT
+    )
+
+    assert fs.cat_file(_name("/data/a.csv")) == TEST_CONTENT
+
+    download.assert_called_once_with(
+        fs.object_client, PROJECT_ID, "/data/a.csv"
+    )
+
+
+@pytest.mark.parametrize(
+    "start, end, expected_range",
+    [(10, 20, "bytes=10-19"), (-15, None, "bytes=185-199"), (5, -5, None)],
+)
+def test_cat_file_range(
+    fs, object_client, requests_mock, start, end, expected_range
+):
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = "etag-1"
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+
+    content = fs.cat_file(_name("/data/a.csv"), start=start, end=end)
+
+    assert content == TEST_CONTENT[start:end]
+    if expected_range is not None:
+        assert requests_mock.last_request.headers["Range"] == expected_range
+
+
+def test_open_read(fs, object_client, requests_mock):
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = "etag-1"
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+
+    with fs.open(_name("/data/a.csv"), block_size=50) as fp:
+        fp.seek(120)
+        assert fp.read(10) == TEST_CONTENT[120:130]
+
+    assert [r.headers["Range"] for r in requests_mock.request_history] == [
+        "bytes=100-199"
+    ]
+
+
+def test_open_write(mocker, fs, object_client):
+    written = io.BytesIO()
+    written.close = mocker.Mock()
+    writer = mocker.patch(
+        "faculty.datasets.remote.RemoteFileWriter", return_value=written
+    )
+    fs.ls(_name("/data"))
+
+    with fs.open(_name("/data/new.csv"), "wb") as fp:
+        fp.write(b"content")
+
+    assert written.getvalue() == b"content"
+    writer.assert_called_once_with(object_client, PROJECT_ID, "/data/new.csv")
+    object_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/data", parents=True
+    )
+    assert (
+        listing.listing_cache(object_client).get(PROJECT_ID, "/data/") is None
+    )
+
+
+def test_open_text(mocker, fs, object_client):
+    written = io.BytesIO()
+    written.close = mocker.Mock()
+    mocker.patch(
+        "faculty.datasets.remote.RemoteFileWriter", return_value=written
+    )
+
+    with fs.open(_name("/data/new.txt"), "w") as fp:
+        fp.write(u"text")
+
+    assert written.getvalue() == b"text"
+
+
+def test_pipe_file(mocker, fs, object_client):
+    upload = mocker.patch("faculty.datasets.transfer.upload")
+    fs.ls(_name("/data"))
+
+    fs.pipe_file(_name("/data/new.csv"), b"content")
+
+    upload.assert_called_once_with(
+        object_client, PROJECT_ID, "/data/new.csv", b"content"
+    )
+    assert (
+        listing.listing_cache(object_client).get(PROJECT_ID, "/data/") is None
+    )
+
+
+def test_makedirs(fs, object_client):
+    object_client.create_directory.side_effect = PathAlreadyExists("/data")
+
+    fs.makedirs(_name("/data"), exist_ok=True)
+    with pytest.raises(FileExistsError):
+        fs.makedirs(_name("/data"))
+
+    object_client.create_directory.assert_called_with(
+        PROJECT_ID, "/data", parents=True
+    )
+
+
+def test_rm_recursive(fs, object_client):
+    fs.rm(_name("/data"), recursive=True)
+
+    object_client.delete.assert_called_once_with(
+        PROJECT_ID, "/data", recursive=True
+    )
+
+
+def test_rm_file(fs, object_client):
+    fs.rm(_name("/data/a.csv"))
+
+    object_client.delete.assert_called_once_with(PROJECT_ID, "/data/a.csv")
+
+
+def test_rmdir_not_empty(fs, object_client):
+    with pytest.raises(OSError):
+        fs.rmdir(_name("/data"))
+    fs.rmdir(_name("/empty"))
+
+    object_client.delete.assert_called_once_with(
+        PROJECT_ID, "/empty/", recursive=True
+    )
+
+
+def test_cp_file(fs, object_client):
+    fs.cp_file(_name("/data/a.csv"), _name("/copy/a.csv"))
+
+    object_client.copy.assert_called_once_with(
+        PROJECT_ID, "/data/a.csv", "/copy/a.csv"
+    )
+
+
+def test_cp_file_between_projects(fs):
+    with pytest.raises(ValueError):
+        fs.cp_file(_name("/data/a.csv"), OTHER_PROJECT_ID + "/a.csv")
+
+
+def test_get(mocker, fs, object_client, tmpdir):
+    download_file = mocker.patch("faculty.datasets.transfer.download_file")
+    callback = mocker.Mock()
+
+    fs.get(
+        _name("/data/sub"),
+        str(tmpdir.join("local")),
+        recursive=True,
+        callback=callback,
+    )
+
+    assert os.path.isdir(str(tmpdir.join("local", "deeper")))
+    assert sorted(call[0][2:] for call in download_file.call_args_list) == [
+        ("/data/sub/b.csv", str(tmpdir.join("local", "b.csv"))),
+        (
+            "/data/sub/deeper/c.csv",
+            str(tmpdir.join("local", "deeper", "c.csv")),
+        ),
+    ]
+    callback.set_size.assert_called_once_with(4)
+    assert callback.relative_update.call_count == 4
+
+
+def test_put(mocker, fs, object_client, tmpdir):
+    upload_file = mocker.patch("faculty.datasets.transfer.upload_file")
+    tmpdir.join("local", "a.csv").write("a", ensure=True)
+    tmpdir.join("local", "sub", "b.csv").write("b", ensure=True)
+
+    fs.put(str(tmpdir.join("local")), _name("/uploaded"), recursive=True)
+
+    assert sorted(call[0][2:] for call in upload_file.call_args_list) == [
+        ("/uploaded/a.csv", str(tmpdir.join("local", "a.csv"))),
+        ("/uploaded/sub/b.csv", str(tmpdir.join("local", "sub", "b.csv"))),
+    ]
+    object_client.create_directory.assert_any_call(
+        PROJECT_ID, "/uploaded/sub", parents=True
+    )
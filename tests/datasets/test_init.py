@@ -17,6 +17,11 @@ import pytest
 import uuid
 
 from faculty import datasets
+from faculty.clients.object import (
+    ListObjectsResponse,
+    MoveNotSupported,
+    Object,
+)
 from faculty.datasets.util import DatasetsError
 
 
@@ -92,13 +97,21 @@ def test_ls_with_continuation(mocker, mock_client):
     )
 
 
+def _objects(paths):
+    return [Object(path, 1, "etag", None) for path in paths]
+
+
 def test_glob(mocker):
-    content = [
-        "/project-path/",
-        "/project-path/this-path",
-        "/project-path/other-path",
-    ]
-    ls_mock = mocker.patch("faculty.datasets.ls", return_value=content)
+    content = _objects(
+        [
+            "/project-path/",
+            "/project-path/this-path",
+            "/project-path/other-path",
+        ]
+    )
+    iter_ls_mock = mocker.patch(
+        "faculty.datasets.iter_ls", return_value=iter(content)
+    )
 
     result = datasets.glob(
         "*this*",
@@ -110,7 +123,7 @@ def test_glob(mocker):
 
     assert result == ["/project-path/this-path"]
 
-    ls_mock.assert_called_once_with(
+    iter_ls_mock.assert_called_once_with(
         prefix="project-path",
         project_id=PROJECT_ID,
         show_hidden=True,
@@ -118,6 +131,78 @@ def test_glob(mocker):
     )
 
 
+@pytest.mark.parametrize(
+    "pattern, prefix, expected",
+    [
+        ("/raw/2024-06-*/part-*.parquet", "/", "/raw/2024-06-"),
+        ("/raw/data.csv", "/", "/raw/data.csv"),
+        ("/raw/*", "/raw/sub", "/raw/sub"),
+        ("/raw/?", "raw/", "/raw/"),
+        ("/raw/[ab]", "/", "/raw/"),
+        ("*.csv", "/raw", "/raw"),
+        ("/other/*", "/raw", None),
+    ],
+)
+def test_glob_list_prefix(pattern, prefix, expected):
+    assert datasets._glob_list_prefix(pattern, prefix) == expected
+
+
+def test_glob_narrows_listing(mocker):
+    content = _objects(
+        [
+            "/raw/2024-06-01/part-0.parquet",
+            "/raw/2024-06-01/part-0.json",
+            "/raw/2024-06-02/nested/part-1.parquet",
+        ]
+    )
+    iter_ls_mock = mocker.patch(
+        "faculty.datasets.iter_ls", return_value=iter(content)
+    )
+
+    result = datasets.glob(
+        "/raw/2024-06-*/part-*.parquet", project_id=PROJECT_ID
+    )
+
+    assert result == [
+        "/raw/2024-06-01/part-0.parquet",
+        "/raw/2024-06-02/nested/part-1.parquet",
+    ]
+    iter_ls_mock.assert_called_once_with(
+        prefix="/raw/2024-06-",
+        project_id=PROJECT_ID,
+        show_hidden=False,
+        object_client=None,
+    )
+
+
+def test_glob_disjoint_prefix(mocker):
+    iter_ls_mock = mocker.patch("faculty.datasets.iter_ls")
+    assert datasets.glob("/other/*", prefix="/raw") == []
+    iter_ls_mock.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "pattern, path, matches",
+    [
+        ("/raw/*/part-*.parquet", "/raw/a/part-0.parquet", True),
+        ("/raw/*/part-*.parquet", "/raw/a/b/part-0.parquet", False),
+        ("/raw/**/part-*.parquet", "/raw/part-0.parquet", True),
+        ("/raw/**/part-*.parquet", "/raw/a/b/part-0.parquet", True),
+        ("/raw/**", "/raw/a/b", True),
+        ("/raw/?", "/raw/a", True),
+        ("/raw/?", "/raw/ab", False),
+        ("/raw/[ab].txt", "/raw/b.txt", True),
+        ("/raw/[!ab].txt", "/raw/b.txt", False),
+        ("/raw/[!ab].txt", "/raw/c.txt", True),
+        ("/raw/[].txt", "/raw/[].txt", True),
+        ("/raw/a+b.txt", "/raw/a+b.txt", True),
+    ],
+)
+def test_compile_glob_recursive(pattern, path, matches):
+    matcher = datasets._compile_glob(pattern, recursive=True)
+    assert bool(matcher.match(path)) == matches
+
+
 def test_get_file(mocker, mock_client):
     ls_mock = mocker.patch("faculty.datasets.ls", return_value=[])
 
@@ -250,10 +335,49 @@ def test_get_directory(mocker, mock_client):
         ]
     )
     _get_file_mock.assert_called_once_with(
-        "/project-path/test-file", local_dests[1], PROJECT_ID, mock_client
+        "/project-path/test-file",
+        local_dests[1],
+        PROJECT_ID,
+        mock_client,
+        None,
+    )
+
+
+def test_get_file_with_cache(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    download_mock = mocker.patch("faculty.datasets.transfer.download_file")
+    cache = mocker.Mock()
+
+    datasets.get("project-path", "local-path", PROJECT_ID, cache=cache)
+
+    cache.download_file.assert_called_once_with(
+        mock_client, PROJECT_ID, "project-path", "local-path"
+    )
+    download_mock.assert_not_called()
+
+
+def test_open_with_cache(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    cache = mocker.MagicMock()
+    file_object = cache.open.return_value.__enter__.return_value
+
+    with datasets.open(
+        "project-path", "r", project_id=PROJECT_ID, cache=cache, newline=""
+    ) as fp:
+        assert fp is file_object
+
+    cache.open.assert_called_once_with(
+        mock_client, PROJECT_ID, "project-path", "r", newline=""
     )
 
 
+def test_open_lazy_with_cache(mocker):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    with pytest.raises(ValueError):
+        with datasets.open("project-path", lazy=True, cache=mocker.Mock()):
+            pass
+
+
 def test_put_file(mocker, mock_client):
     posixpath_dirname_mock = mocker.patch(
         "posixpath.dirname", return_value="/"
@@ -419,25 +543,58 @@ def test_rmdir_nonempty_directory(mocker, prefix):
 
 
 def test_mv(mocker, mock_client):
-    cp_mock = mocker.patch("faculty.datasets.cp")
-    rm_mock = mocker.patch("faculty.datasets.rm")
+    move_tree_mock = mocker.patch("faculty.datasets.bulk.move_tree")
 
-    datasets.mv("source-path", "destination-path", project_id=PROJECT_ID)
+    datasets.mv("/source-path", "/dir/destination-path", project_id=PROJECT_ID)
 
-    cp_mock.assert_called_once_with(
-        "source-path",
-        "destination-path",
+    mock_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/dir", parents=True
+    )
+    mock_client.move.assert_called_once_with(
+        PROJECT_ID, "/source-path", "/dir/destination-path", recursive=True
+    )
+    move_tree_mock.assert_not_called()
+
+
+def test_mv_move_not_supported(mocker, mock_client):
+    mock_client.move.side_effect = MoveNotSupported()
+    move_tree_mock = mocker.patch("faculty.datasets.bulk.move_tree")
+    progress = mocker.Mock()
+
+    datasets.mv(
+        "/source-path",
+        "/destination-path",
         project_id=PROJECT_ID,
-        recursive=True,
-        object_client=mock_client,
+        max_workers=3,
+        progress=progress,
     )
-    rm_mock.assert_called_once_with(
-        "source-path",
+
+    move_tree_mock.assert_called_once_with(
+        mock_client,
+        PROJECT_ID,
+        "/source-path",
+        "/destination-path",
+        max_workers=3,
+        progress=progress,
+    )
+
+
+def test_mv_invalidates_listings(mocker):
+    object_client = mocker.Mock()
+    cache = datasets.listing.listing_cache(object_client)
+    cache.set(PROJECT_ID, "/source-path/", [])
+    cache.set(PROJECT_ID, "/destination-path/", [])
+
+    datasets.mv(
+        "/source-path",
+        "/destination-path",
         project_id=PROJECT_ID,
-        recursive=True,
-        object_client=mock_client,
+        object_client=object_client,
     )
 
+    assert cache.get(PROJECT_ID, "/source-path/") is None
+    assert cache.get(PROJECT_ID, "/destination-path/") is None
+
 
 def test_mv_identical_source_and_destination(mocker, mock_client):
     cp_mock = mocker.patch("faculty.datasets.cp")
@@ -447,6 +604,7 @@ def test_mv_identical_source_and_destination(mocker, mock_client):
 
     cp_mock.assert_not_called()
     rm_mock.assert_not_called()
+    mock_client.move.assert_not_called()
 
 
 def test_etag(mocker, mock_client):
@@ -476,3 +634,284 @@ def test_etag(mocker, mock_client):
 )
 def test_rationalise_path(input_path, rationalised_path):
     assert datasets._rationalise_path(input_path) == rationalised_path
+
+
+def test_open_lazy(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    reader = mocker.Mock()
+    reader_mock = mocker.patch(
+        "faculty.datasets.remote.RemoteFileReader", return_value=reader
+    )
+    file_object = mocker.MagicMock()
+    wrap_mock = mocker.patch(
+        "faculty.datasets.remote.wrap_file", return_value=file_object
+    )
+    get_mock = mocker.patch("faculty.datasets.get")
+
+    with datasets.open(
+        "project-path", "rb", project_id=PROJECT_ID, lazy=True, buffering=10
+    ) as fp:
+        assert fp is file_object.__enter__.return_value
+
+    reader_mock.assert_called_once_with(
+        mock_client, PROJECT_ID, "project-path"
+    )
+    wrap_mock.assert_called_once_with(reader, "rb", buffering=10)
+    get_mock.assert_not_called()
+
+
+def test_open_write(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    writer = mocker.Mock()
+    writer_mock = mocker.patch(
+        "faculty.datasets.remote.RemoteFileWriter", return_value=writer
+    )
+    file_object = mocker.Mock()
+    wrap_mock = mocker.patch(
+        "faculty.datasets.remote.wrap_file", return_value=file_object
+    )
+
+    with datasets.open(
+        "/path/file", "w", project_id=PROJECT_ID, encoding="utf-8"
+    ) as fp:
+        assert fp is file_object
+
+    mock_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/path", parents=True
+    )
+    writer_mock.assert_called_once_with(mock_client, PROJECT_ID, "/path/file")
+    wrap_mock.assert_called_once_with(writer, "w", encoding="utf-8")
+    file_object.close.assert_called_once_with()
+    writer.abort.assert_not_called()
+
+
+def test_open_write_aborts_on_error(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    writer = mocker.Mock()
+    mocker.patch(
+        "faculty.datasets.remote.RemoteFileWriter", return_value=writer
+    )
+    file_object = mocker.Mock()
+    mocker.patch("faculty.datasets.remote.wrap_file", return_value=file_object)
+
+    with pytest.raises(RuntimeError):
+        with datasets.open("/path/file", "wb", project_id=PROJECT_ID):
+            raise RuntimeError()
+
+    writer.abort.assert_called_once_with()
+    file_object.close.assert_not_called()
+
+
+def test_open_exclusive_existing_file(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+    mocker.patch("faculty.datasets._isfile", return_value=True)
+    writer_mock = mocker.patch("faculty.datasets.remote.RemoteFileWriter")
+
+    with pytest.raises(DatasetsError, match="exists"):
+        with datasets.open("/path/file", "xb", project_id=PROJECT_ID):
+            pass
+
+    writer_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("mode", ["a", "ab", "r+", "w+b"])
+def test_open_append_or_update(mocker, mode):
+    mocker.patch("faculty.datasets._isdir", return_value=False)
+
+    with pytest.raises(NotImplementedError):
+        with datasets.open("/path/file", mode, project_id=PROJECT_ID):
+            pass
+
+
+def test_get_directory_parallel(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=True)
+    mocker.patch("os.path.isdir", return_value=True)
+    get_tree_mock = mocker.patch("faculty.datasets.bulk.get_tree")
+    progress = mocker.Mock()
+
+    datasets.get(
+        "/project-path",
+        "local-path",
+        PROJECT_ID,
+        max_workers=4,
+        progress=progress,
+    )
+
+    get_tree_mock.assert_called_once_with(
+        mock_client,
+        PROJECT_ID,
+        "/project-path",
+        "local-path",
+        max_workers=4,
+        progress=progress,
+        cache=None,
+    )
+
+
+def test_get_directory_parallel_missing_destination(mocker, mock_client):
+    mocker.patch("faculty.datasets._isdir", return_value=True)
+    get_tree_mock = mocker.patch("faculty.datasets.bulk.get_tree")
+
+    with pytest.raises(IOError):
+        datasets.get(
+            "/project-path", "missing/local-path", PROJECT_ID, max_workers=4
+        )
+
+    get_tree_mock.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "direction, source, destination",
+    [
+        ("put", "local-path", "/project-path"),
+        ("get", "/project-path", "local-path"),
+    ],
+)
+def test_sync(mocker, mock_client, direction, source, destination):
+    mocker.patch("os.path.isdir", return_value=True)
+    sync_tree_mock = mocker.patch("faculty.datasets.bulk.sync_tree")
+    progress = mocker.Mock()
+
+    result = datasets.sync(
+        source,
+        destination,
+        direction,
+        PROJECT_ID,
+        delete=True,
+        max_workers=4,
+        progress=progress,
+        checksum=True,
+    )
+
+    assert result == sync_tree_mock.return_value
+    sync_tree_mock.assert_called_once_with(
+        mock_client,
+        PROJECT_ID,
+        "local-path",
+        "/project-path",
+        direction=direction,
+        delete=True,
+        max_workers=4,
+        progress=progress,
+        checksum=True,
+    )
+
+
+def test_sync_invalid_direction(mocker, mock_client):
+    with pytest.raises(ValueError):
+        datasets.sync("source", "destination", "up", PROJECT_ID)
+
+
+@pytest.mark.parametrize(
+    "show_hidden, expected",
+    [(False, ["/visible"]), (True, ["/visible", "/.hidden", "/dir/.x"])],
+)
+def test_iter_ls(mocker, mock_client, show_hidden, expected):
+    objects = [
+        Object(path, 1, "etag", None)
+        for path in ["/visible", "/.hidden", "/dir/.x"]
+    ]
+    iter_objects_mock = mocker.patch(
+        "faculty.datasets.listing.iter_objects", return_value=iter(objects)
+    )
+
+    result = datasets.iter_ls("/prefix", PROJECT_ID, show_hidden=show_hidden)
+
+    assert [obj.path for obj in result] == expected
+    iter_objects_mock.assert_called_once_with(
+        mock_client, PROJECT_ID, "/prefix"
+    )
+
+
+def test_isfile_lists_once(mocker):
+    object_client = mocker.Mock()
+    object_client.list.return_value = ListObjectsResponse(
+        [Object("/path/file", 1, "etag", None)], None
+    )
+
+    assert datasets._isfile("/path/file", PROJECT_ID, object_client)
+
+    object_client.list.assert_called_once_with(PROJECT_ID, "/path/file")
+
+
+def test_rm_invalidates_listings(mocker):
+    object_client = mocker.Mock()
+    object_client.list.side_effect = [
+        ListObjectsResponse([Object("/path/file", 1, "etag", None)], None),
+        ListObjectsResponse([], None),
+    ]
+
+    def ls():
+        return datasets.ls("/path", PROJECT_ID, object_client=object_client)
+
+    assert ls() == ["/path/file"]
+    assert ls() == ["/path/file"]
+    datasets.rm("/path/file", PROJECT_ID, object_client=object_client)
+    assert ls() == []
+
+    assert object_client.list.call_count == 2
+
+
+def test_rm_many(mocker, mock_client):
+    outcomes = [mocker.Mock()]
+    mock_client.delete_many.return_value = outcomes
+    paths = ["/a", "/b"]
+
+    assert (
+        datasets.rm_many(paths, PROJECT_ID, recursive=True, max_workers=4)
+        == outcomes
+    )
+
+    mock_client.delete_many.assert_called_once_with(
+        PROJECT_ID, paths, recursive=True, max_workers=4
+    )
+
+
+def test_rm_many_invalidates_listings(mocker):
+    object_client = mocker.Mock()
+    cache = datasets.listing.listing_cache(object_client)
+    cache.set(PROJECT_ID, "/path/", [])
+
+    datasets.rm_many(["/path/file"], PROJECT_ID, object_client=object_client)
+
+    assert cache.get(PROJECT_ID, "/path/") is None
+
+
+def test_download_many(mocker, mock_client):
+    download_many_mock = mocker.patch(
+        "faculty.datasets.transfer.download_many"
+    )
+    paths = ["/a.json", "/b.json"]
+
+    result = datasets.download_many(paths, PROJECT_ID, max_workers=3)
+
+    assert result == download_many_mock.return_value
+    download_many_mock.assert_called_once_with(
+        mock_client, PROJECT_ID, paths, max_workers=3
+    )
+
+
+def test_put_directory_parallel(mocker, mock_client):
+    mocker.patch("os.path.isdir", return_value=True)
+    put_tree_mock = mocker.patch("faculty.datasets.bulk.put_tree")
+    progress = mocker.Mock()
+
+    datasets.put(
+        "local-path",
+        "/project-path",
+        PROJECT_ID,
+        max_workers=4,
+        progress=progress,
+    )
+
+    mock_client.create_directory.assert_called_once_with(
+        PROJECT_ID, "/", parents=True
+    )
+    put_tree_mock.assert_called_once_with(
+        mock_client,
+        PROJECT_ID,
+        "local-path",
+        "/project-path",
+        max_workers=4,
+        progress=progress,
+    )
@@ -0,0 +1,89 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
+from faculty.datasets.journal import (
+    DownloadJournal,
+    DownloadState,
+    UploadJournal,
+    UploadState,
+)
+
+
+FINGERPRINT = [2000, 1600000000.0]
+
+
+def test_upload_journal_round_trip(tmpdir):
+    journal = UploadJournal(str(tmpdir.join("upload.journal")), FINGERPRINT)
+    journal.start(CloudStorageProvider.S3, "upload-id", None, 1000)
+    journal.record_part(CompletedUploadPart(1, "etag-1"))
+    journal.record_part(CompletedUploadPart(2, "etag-2"))
+
+    assert journal.load() == UploadState(
+        provider=CloudStorageProvider.S3,
+        upload_id="upload-id",
+        url=None,
+        chunk_size=1000,
+        completed_parts=[
+            CompletedUploadPart(1, "etag-1"),
+            CompletedUploadPart(2, "etag-2"),
+        ],
+        offset=0,
+    )
+
+
+def test_upload_journal_missing(tmpdir):
+    journal = UploadJournal(str(tmpdir.join("upload.journal")), FINGERPRINT)
+    assert journal.load() is None
+
+
+def test_upload_journal_for_changed_file(tmpdir):
+    path = str(tmpdir.join("upload.journal"))
+    UploadJournal(path, FINGERPRINT).start(
+        CloudStorageProvider.GCS, None, "https://example.com", 1000
+    )
+    assert UploadJournal(path, [2001, 1600000000.0]).load() is None
+
+
+def test_upload_journal_ignores_partial_record(tmpdir):
+    journal = UploadJournal(str(tmpdir.join("upload.journal")), FINGERPRINT)
+    journal.start(CloudStorageProvider.GCS, None, "https://example.com", 1000)
+    journal.record_offset(1000)
+    with open(journal.path, "a") as fp:
+        fp.write('{"offs')
+
+    assert journal.load().offset == 1000
+
+
+def test_upload_journal_remove(tmpdir):
+    journal = UploadJournal(str(tmpdir.join("upload.journal")), FINGERPRINT)
+    journal.start(CloudStorageProvider.GCS, None, "https://example.com", 1000)
+    journal.remove()
+    assert journal.load() is None
+    journal.remove()
+
+
+def test_download_journal_round_trip(tmpdir):
+    journal = DownloadJournal(str(tmpdir.join("download.journal")))
+    journal.start("etag", 2000, 0)
+    journal.record_range(0, 299)
+    journal.record_range(300)
+
+    assert journal.load() == DownloadState(
+        etag="etag",
+        size=2000,
+        range_size=0,
+        completed_ranges={0: 299, 300: None},
+    )
@@ -0,0 +1,182 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+from uuid import uuid4
+
+import pytest
+
+from faculty.clients.object import ListObjectsResponse, Object
+from faculty.datasets import listing
+
+
+PROJECT_ID = uuid4()
+OTHER_PROJECT_ID = uuid4()
+
+OBJECTS = [
+    Object("/dir/", 0, "etag", None),
+    Object("/dir/a.txt", 1, "etag", None),
+    Object("/dir/sub/b.txt", 1, "etag", None),
+    Object("/directory.txt", 1, "etag", None),
+]
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = mocker.patch("faculty.datasets.listing.default_timer")
+    clock.return_value = 100.0
+    return clock
+
+
+def test_cache_exact_prefix(clock):
+    cache = listing.ListingCache()
+    cache.set(PROJECT_ID, "/dir", OBJECTS[:3])
+    assert cache.get(PROJECT_ID, "dir") == OBJECTS[:3]
+    assert cache.get(OTHER_PROJECT_ID, "/dir") is None
+
+
+def test_cache_longer_prefix(clock):
+    cache = listing.ListingCache()
+    cache.set(PROJECT_ID, "/dir", OBJECTS)
+    assert cache.get(PROJECT_ID, "/dir/") == OBJECTS[:3]
+    assert cache.get(PROJECT_ID, "/dir/sub") == OBJECTS[2:3]
+    assert cache.get(PROJECT_ID, "/") is None
+
+
+def test_cache_expiry(clock):
+    cache = listing.ListingCache(ttl=5)
+    cache.set(PROJECT_ID, "/dir", OBJECTS)
+    clock.return_value = 105.0
+    assert cache.get(PROJECT_ID, "/dir") == OBJECTS
+    clock.return_value = 105.1
+    assert cache.get(PROJECT_ID, "/dir") is None
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = listing.ListingCache(max_entries=2)
+    cache.set(PROJECT_ID, "/a", [])
+    cache.set(PROJECT_ID, "/b", [])
+    cache.get(PROJECT_ID, "/a")
+    cache.set(PROJECT_ID, "/c", [])
+    assert cache.get(PROJECT_ID, "/a") == []
+    assert cache.get(PROJECT_ID, "/b") is None
+    assert cache.get(PROJECT_ID, "/c") == []
+
+
+@pytest.mark.parametrize(
+    "path, invalidated",
+    [
+        ("/dir/sub/new.txt", ["/", "/dir/", "/dir/sub/"]),
+        ("/dir/", ["/", "/dir/", "/dir/sub/"]),
+        ("/other.txt", ["/"]),
+        (None, ["/", "/dir/", "/dir/sub/"]),
+    ],
+)
+def test_cache_invalidate(clock, path, invalidated):
+    cache = listing.ListingCache()
+    prefixes = ["/", "/dir/", "/dir/sub/"]
+    for prefix in prefixes:
+        cache.set(PROJECT_ID, prefix, [])
+        cache.set(OTHER_PROJECT_ID, prefix, [])
+
+    cache.invalidate(PROJECT_ID, path)
+
+    for prefix in prefixes:
+        cached = cache._entries.get((PROJECT_ID, prefix))
+        assert (cached is None) == (prefix in invalidated)
+        assert (OTHER_PROJECT_ID, prefix) in cache._entries
+
+
+def test_listing_cache_per_client(mocker):
+    client = mocker.Mock()
+    other_client = mocker.Mock()
+    assert listing.listing_cache(client) is listing.listing_cache(client)
+    assert listing.listing_cache(client) is not listing.listing_cache(
+        other_client
+    )
+
+
+def test_list_objects(mocker):
+    object_client = mocker.Mock()
+    object_client.list.side_effect = [
+        ListObjectsResponse(OBJECTS[:2], "token"),
+        ListObjectsResponse(OBJECTS[2:], None),
+    ]
+
+    assert listing.list_objects(object_client, PROJECT_ID, "/") == OBJECTS
+    assert listing.list_objects(object_client, PROJECT_ID, "/") == OBJECTS
+    assert listing.list_objects(object_client, PROJECT_ID, "/dir/sub/") == [
+        OBJECTS[2]
+    ]
+
+    object_client.list.assert_has_calls(
+        [
+            mocker.call(PROJECT_ID, "/"),
+            mocker.call(PROJECT_ID, "/", "token"),
+        ]
+    )
+    assert object_client.list.call_count == 2
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iter_objects(mocker, prefetch):
+    object_client = mocker.Mock()
+    object_client.list.side_effect = [
+        ListObjectsResponse(OBJECTS[:2], "token-1"),
+        ListObjectsResponse(OBJECTS[2:3], "token-2"),
+        ListObjectsResponse(OBJECTS[3:], None),
+    ]
+
+    objects = listing.iter_objects(
+        object_client, PROJECT_ID, "/", prefetch=prefetch
+    )
+
+    assert list(objects) == OBJECTS
+    assert object_client.list.call_args_list == [
+        mocker.call(PROJECT_ID, "/"),
+        mocker.call(PROJECT_ID, "/", "token-1"),
+        mocker.call(PROJECT_ID, "/", "token-2"),
+    ]
+    # Streamed listings are not cached
+    assert listing.listing_cache(object_client).get(PROJECT_ID, "/") is None
+
+
+def test_iter_objects_prefetches_next_page(mocker):
+    next_page_requested = threading.Event()
+
+    def list_objects(project_id, prefix, page_token=None):
+        if page_token is None:
+            return ListObjectsResponse(OBJECTS[:2], "token")
+        next_page_requested.set()
+        return ListObjectsResponse(OBJECTS[2:], None)
+
+    object_client = mocker.Mock()
+    object_client.list.side_effect = list_objects
+
+    objects = listing.iter_objects(object_client, PROJECT_ID, "/")
+
+    assert next(objects) == OBJECTS[0]
+    assert next_page_requested.wait(5)
+    assert list(objects) == OBJECTS[1:]
+
+
+def test_iter_objects_uses_cache(mocker):
+    object_client = mocker.Mock()
+    listing.listing_cache(object_client).set(PROJECT_ID, "/", OBJECTS)
+
+    objects = listing.iter_objects(object_client, PROJECT_ID, "/dir/sub/")
+
+    assert list(objects) == [OBJECTS[2]]
+    object_client.list.assert_not_called()
@@ -0,0 +1,64 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from uuid import uuid4
+
+from faculty.datasets.manifest import ManifestEntry, SyncManifest
+
+
+PROJECT_ID = uuid4()
+
+
+def test_manifest_round_trip(tmpdir):
+    directory = str(tmpdir.join("manifests"))
+    manifest = SyncManifest.for_directories(
+        PROJECT_ID, "/remote/", "local", directory
+    )
+    manifest.entries = {"a.txt": ManifestEntry(10, 1.5, "etag")}
+    manifest.save()
+
+    loaded = SyncManifest.for_directories(
+        PROJECT_ID, "/remote/", "local", directory
+    )
+    loaded.load()
+    assert loaded.entries == {"a.txt": ManifestEntry(10, 1.5, "etag")}
+
+
+def test_manifest_depends_on_directories(tmpdir):
+    directory = str(tmpdir)
+    manifest = SyncManifest.for_directories(
+        PROJECT_ID, "/remote/", "local", directory
+    )
+    other_remote = SyncManifest.for_directories(
+        PROJECT_ID, "/other/", "local", directory
+    )
+    other_local = SyncManifest.for_directories(
+        PROJECT_ID, "/remote/", "other", directory
+    )
+    assert len({manifest.path, other_remote.path, other_local.path}) == 3
+
+
+def test_manifest_missing(tmpdir):
+    manifest = SyncManifest(str(tmpdir.join("missing.json")))
+    manifest.load()
+    assert manifest.entries == {}
+
+
+def test_manifest_corrupt(tmpdir):
+    path = tmpdir.join("corrupt.json")
+    path.write("{not json")
+    manifest = SyncManifest(str(path))
+    manifest.load()
+    assert manifest.entries == {}
@@ -0,0 +1,356 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import random
+import string
+import threading
+from uuid import uuid4
+
+import pytest
+from requests import HTTPError
+from requests_mock import ANY
+
+from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
+from faculty.datasets import remote, throttle
+from faculty.datasets.util import DatasetsError
+from tests.datasets.fakes import range_response
+
+
+PROJECT_ID = uuid4()
+TEST_PATH = "/path/to/file"
+TEST_URL = "https://example.com/presigned/url"
+OTHER_URL = "https://example.com/other-presigned/url"
+TEST_ETAG = '"5d24e152bcdfa5a0357f46471be3be6c"'
+
+TEST_CONTENT = "".join(
+    random.choice(string.printable) for _ in range(2000)
+).encode("utf8")
+
+
+def _requested_ranges(requests_mock):
+    return [
+        request.headers["Range"] for request in requests_mock.request_history
+    ]
+
+
+@pytest.fixture
+def object_client(mocker, requests_mock):
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = TEST_ETAG
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+    return object_client
+
+
+def _reader(object_client, **kwargs):
+    kwargs.setdefault("block_size", 100)
+    return remote.RemoteFileReader(
+        object_client, PROJECT_ID, TEST_PATH, **kwargs
+    )
+
+
+def test_reader_read_all(object_client, requests_mock):
+    reader = _reader(object_client)
+
+    assert reader.read() == TEST_CONTENT
+    assert reader.read() == b""
+    assert _requested_ranges(requests_mock) == ["bytes=0-1999"]
+    object_client.get.assert_called_once_with(PROJECT_ID, TEST_PATH)
+    object_client.presign_download.assert_called_once_with(
+        PROJECT_ID, TEST_PATH
+    )
+
+
+def test_reader_fetches_only_blocks_read(object_client, requests_mock):
+    reader = _reader(object_client)
+
+    reader.seek(-10, io.SEEK_END)
+    assert reader.read(10) == TEST_CONTENT[-10:]
+    reader.seek(550)
+    assert reader.read(100) == TEST_CONTENT[550:650]
+    assert reader.tell() == 650
+
+    assert _requested_ranges(requests_mock) == [
+        "bytes=1900-1999",
+        "bytes=500-699",
+    ]
+
+
+def test_reader_uses_cached_blocks(object_client, requests_mock):
+    reader = _reader(object_client)
+
+    reader.seek(120)
+    assert reader.read(10) == TEST_CONTENT[120:130]
+    reader.seek(150)
+    assert reader.read(10) == TEST_CONTENT[150:160]
+
+    assert _requested_ranges(requests_mock) == ["bytes=100-199"]
+
+
+def test_reader_fetches_only_missing_blocks(object_client, requests_mock):
+    reader = _reader(object_client)
+
+    reader.seek(250)
+    reader.read(10)
+    reader.seek(0)
+    assert reader.read(500) == TEST_CONTENT[:500]
+
+    assert _requested_ranges(requests_mock) == [
+        "bytes=200-299",
+        "bytes=0-199",
+        "bytes=300-499",
+    ]
+
+
+def test_reader_reads_ahead_sequentially(object_client, requests_mock):
+    reader = _reader(object_client, max_read_ahead=4)
+
+    chunks = []
+    chunk = reader.read(100)
+    while chunk:
+        chunks.append(chunk)
+        chunk = reader.read(100)
+
+    assert b"".join(chunks) == TEST_CONTENT
+    assert _requested_ranges(requests_mock) == [
+        "bytes=0-99",
+        "bytes=100-299",
+        "bytes=300-699",
+        "bytes=700-1099",
+        "bytes=1100-1499",
+        "bytes=1500-1899",
+        "bytes=1900-1999",
+    ]
+
+
+def test_reader_evicts_least_recently_used_blocks(
+    object_client, requests_mock
+):
+    reader = _reader(object_client, cache_blocks=2)
+
+    for position in [0, 500, 0, 1000, 500]:
+        reader.seek(position)
+        assert reader.read(10) == TEST_CONTENT[position : position + 10]
+
+    assert _requested_ranges(requests_mock) == [
+        "bytes=0-99",
+        "bytes=500-599",
+        "bytes=1000-1099",
+        "bytes=500-599",
+    ]
+
+
+def test_reader_renews_expired_url(mocker, object_client, requests_mock):
+    object_client.presign_download.side_effect = [TEST_URL, OTHER_URL]
+    requests_mock.get(TEST_URL, status_code=403)
+    requests_mock.get(OTHER_URL, content=range_response(TEST_CONTENT))
+    reader = _reader(object_client)
+
+    assert reader.read(10) == TEST_CONTENT[:10]
+    assert object_client.presign_download.call_count == 2
+
+
+def test_reader_object_changed(object_client, requests_mock):
+    requests_mock.get(
+        TEST_URL,
+        status_code=206,
+        headers={"Content-Range": "bytes 0-99/5000"},
+        content=TEST_CONTENT[:100],
+    )
+    reader = _reader(object_client)
+
+    with pytest.raises(DatasetsError, match="changed"):
+        reader.read(10)
+
+
+def test_reader_object_replaced(object_client, requests_mock):
+    requests_mock.get(TEST_URL, status_code=412)
+    reader = _reader(object_client)
+
+    with pytest.raises(DatasetsError, match="changed"):
+        reader.read(10)
+    assert requests_mock.last_request.headers["If-Match"] == TEST_ETAG
+
+
+def test_reader_range_not_honoured(object_client, requests_mock):
+    requests_mock.get(TEST_URL, content=TEST_CONTENT)
+    reader = _reader(object_client)
+
+    with pytest.raises(DatasetsError, match="range"):
+        reader.read(10)
+
+
+def test_reader_read_range(object_client, requests_mock):
+    reader = _reader(object_client)
+
+    assert reader.read_range(1950, 3000) == TEST_CONTENT[1950:]
+    assert reader.read_range(120, 130) == TEST_CONTENT[120:130]
+    assert reader.read_range(2500, 3000) == b""
+    assert reader.tell() == 0
+    assert _requested_ranges(requests_mock) == [
+        "bytes=1950-1999",
+        "bytes=120-129",
+    ]
+
+
+def test_reader_rate_limited(mocker, object_client):
+    throttle.set_bandwidth_limit(10 ** 9)
+    try:
+        acquire = mocker.spy(throttle.global_limiter(), "acquire")
+        reader = _reader(object_client)
+
+        assert reader.read(150) == TEST_CONTENT[:150]
+        assert reader.read_range(500, 550) == TEST_CONTENT[500:550]
+    finally:
+        throttle.set_bandwidth_limit(None)
+
+    assert [call[0][0] for call in acquire.call_args_list] == [200, 50]
+
+
+def test_reader_closed(object_client):
+    reader = _reader(object_client)
+    reader.close()
+
+    with pytest.raises(ValueError):
+        reader.read(10)
+
+
+def test_wrap_file_binary(object_client):
+    with remote.wrap_file(_reader(object_client), "rb") as fp:
+        assert isinstance(fp, io.BufferedReader)
+        fp.seek(1000)
+        assert fp.read(5) == TEST_CONTENT[1000:1005]
+
+
+def test_wrap_file_text(object_client):
+    with remote.wrap_file(_reader(object_client), "r", newline="") as fp:
+        assert fp.read() == TEST_CONTENT.decode("utf-8")
+
+
+def test_wrap_file_unbuffered_text(object_client):
+    with pytest.raises(ValueError):
+        remote.wrap_file(_reader(object_client), "r", buffering=0)
+
+
+@pytest.fixture
+def s3_object_client(mocker, requests_mock):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3, upload_id="upload-id"
+    )
+    object_client.presign_upload_parts.side_effect = (
+        lambda project_id, path, upload_id, part_numbers: [
+            "https://example.com/part-{}".format(n) for n in part_numbers
+        ]
+    )
+    requests_mock.put(ANY, headers={"ETag": "etag"})
+    return object_client
+
+
+def _uploaded_parts(requests_mock):
+    return [
+        bytes(request.body or b"") for request in requests_mock.request_history
+    ]
+
+
+def test_writer(s3_object_client, requests_mock):
+    writer = remote.RemoteFileWriter(s3_object_client, PROJECT_ID, TEST_PATH)
+    for i in range(0, 250, 30):
+        assert writer.write(TEST_CONTENT[i : i + 30]) == len(
+            TEST_CONTENT[i : i + 30]
+        )
+    writer.close()
+
+    assert writer.closed
+    assert _uploaded_parts(requests_mock) == [
+        TEST_CONTENT[:100],
+        TEST_CONTENT[100:200],
+        TEST_CONTENT[200:270],
+    ]
+    s3_object_client.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        "upload-id",
+        [CompletedUploadPart(n, "etag") for n in range(1, 4)],
+    )
+
+
+def test_writer_empty_file(s3_object_client, requests_mock):
+    writer = remote.RemoteFileWriter(s3_object_client, PROJECT_ID, TEST_PATH)
+    writer.close()
+
+    assert _uploaded_parts(requests_mock) == [b""]
+    s3_object_client.complete_multipart_upload.assert_called_once()
+
+
+def test_writer_abort(s3_object_client, requests_mock):
+    writer = remote.RemoteFileWriter(s3_object_client, PROJECT_ID, TEST_PATH)
+    writer.write(TEST_CONTENT[:250])
+    writer.abort()
+
+    assert writer.closed
+    assert len(requests_mock.request_history) <= 2
+    s3_object_client.complete_multipart_upload.assert_not_called()
+
+
+def test_writer_upload_error(s3_object_client, requests_mock):
+    requests_mock.put(ANY, status_code=500)
+    writer = remote.RemoteFileWriter(s3_object_client, PROJECT_ID, TEST_PATH)
+    writer.write(TEST_CONTENT[:150])
+
+    with pytest.raises(HTTPError):
+        writer.close()
+    assert writer.closed
+    s3_object_client.complete_multipart_upload.assert_not_called()
+
+
+def test_writer_bounds_pending_parts(mocker):
+    can_upload = threading.Event()
+    received = []
+
+    def upload_stream(object_client, project_id, path, content, **kwargs):
+        assert can_upload.wait(5)
+        received.extend(content)
+
+    mocker.patch(
+        "faculty.datasets.remote.transfer.upload_stream",
+        side_effect=upload_stream,
+    )
+    writer = remote.RemoteFileWriter(
+        mocker.Mock(), PROJECT_ID, TEST_PATH, part_size=10, max_pending_parts=2
+    )
+
+    writing = threading.Thread(target=writer.write, args=(TEST_CONTENT[:50],))
+    writing.start()
+    writing.join(0.5)
+    # Only two parts fit in the queue while the upload is not consuming it
+    assert writing.is_alive()
+
+    can_upload.set()
+    writing.join(5)
+    writer.close()
+
+    assert b"".join(received) == TEST_CONTENT[:50]
+
+
+def test_wrap_file_writer(s3_object_client, requests_mock):
+    writer = remote.RemoteFileWriter(s3_object_client, PROJECT_ID, TEST_PATH)
+    with remote.wrap_file(writer, "w", encoding="utf-8") as fp:
+        fp.write(u"some text")
+
+    assert _uploaded_parts(requests_mock) == [b"some text"]
@@ -0,0 +1,120 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import threading
+from timeit import default_timer
+
+import pytest
+
+from faculty.datasets import throttle
+
+
+@pytest.fixture
+def global_limit():
+    yield throttle.global_limiter()
+    throttle.set_bandwidth_limit(None)
+
+
+def _timed_acquire(limiter, num_bytes):
+    started_at = default_timer()
+    limiter.acquire(num_bytes)
+    return default_timer() - started_at
+
+
+def test_unlimited():
+    limiter = throttle.RateLimiter()
+    assert limiter.rate is None
+    assert _timed_acquire(limiter, 10 ** 12) < 0.1
+
+
+def test_limits_rate():
+    limiter = throttle.RateLimiter(rate=1000000, burst=10000)
+    assert 0.25 < _timed_acquire(limiter, 300000) < 1.0
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        throttle.RateLimiter(rate=0)
+
+
+def test_set_rate_while_waiting():
+    limiter = throttle.RateLimiter(rate=1, burst=1)
+    limiter.acquire(1)
+    waiting = threading.Thread(target=limiter.acquire, args=(100,))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+
+    limiter.set_rate(None)
+
+    waiting.join(5)
+    assert not waiting.is_alive()
+
+
+def test_shared_fairly(mocker):
+    mocker.patch("faculty.datasets.throttle.PIECE_SIZE", 1000)
+    limiter = throttle.RateLimiter(rate=100000, burst=1000)
+    granted = []
+    acquire_piece = limiter._acquire_piece
+
+    def record_piece(num_bytes):
+        acquire_piece(num_bytes)
+        granted.append(threading.current_thread().name)
+
+    mocker.patch.object(limiter, "_acquire_piece", side_effect=record_piece)
+    threads = [
+        threading.Thread(target=limiter.acquire, args=(10000,), name=name)
+        for name in ["first", "second"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(granted) == ["first"] * 10 + ["second"] * 10
+    # While both transfers are waiting, they take turns
+    both_waiting = granted[
+        granted.index("second") : len(granted) - granted[::-1].index("first")
+    ]
+    assert all(a != b for a, b in zip(both_waiting, both_waiting[1:]))
+    assert len(both_waiting) >= 10
+
+
+def test_throttled_reader(mocker):
+    limiter = mocker.Mock()
+    reader = throttle.ThrottledReader(b"0123456789", limiter)
+
+    assert len(reader) == 10
+    assert reader.read(4) == b"0123"
+    assert reader.tell() == 4
+    assert reader.read() == b"456789"
+    assert reader.read(4) == b""
+    assert reader.seek(0) == 0
+    assert reader.read(2) == b"01"
+    assert reader.seek(-3, io.SEEK_END) == 7
+    assert [call[0][0] for call in limiter.acquire.call_args_list] == [
+        4,
+        6,
+        0,
+        2,
+    ]
+
+
+def test_set_bandwidth_limit(global_limit):
+    throttle.set_bandwidth_limit(1000000)
+    assert global_limit.rate == 1000000
+    throttle.set_bandwidth_limit(None)
+    assert global_limit.rate is None
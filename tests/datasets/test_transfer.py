@@ -13,15 +13,25 @@
 # limitations under the License.
 
 
+import base64
+import hashlib
 import random
 import string
 import math
+import mmap
+import weakref
 from uuid import uuid4
 
 import pytest
+from requests_mock import ANY
 
 from faculty.clients.object import CloudStorageProvider, CompletedUploadPart
-from faculty.datasets import transfer
+from faculty.datasets.checksum import MultipartChecksum
+from faculty.datasets.chunking import ChunkSizePolicy, FixedChunkSize
+from faculty.datasets import listing, throttle, transfer
+from faculty.datasets.journal import DownloadJournal, UploadJournal
+from faculty.datasets.util import ChecksumMismatch, DatasetsError
+from tests.datasets.fakes import range_response
 
 
 PROJECT_ID = uuid4()
@@ -70,6 +80,9 @@ def mock_client_upload_s3(mocker, requests_mock):
 
     object_client = mocker.Mock()
     object_client.presign_upload.return_value = presigned_response_mock
+    object_client.presign_upload_parts.side_effect = (
+        _presign_parts_individually(object_client)
+    )
 
     yield object_client
     object_client.presign_upload.assert_called_once_with(PROJECT_ID, TEST_PATH)
@@ -88,6 +101,18 @@ def mock_client_upload_gcs(mocker, requests_mock):
     object_client.presign_upload.assert_called_once_with(PROJECT_ID, TEST_PATH)
 
 
+def _presign_parts_individually(object_client):
+    def presign_upload_parts(project_id, path, upload_id, part_numbers):
+        return [
+            object_client.presign_upload_part(
+                project_id, path, upload_id, part_number
+            )
+            for part_number in part_numbers
+        ]
+
+    return presign_upload_parts
+
+
 def _assert_contains(dict_1, dict_2):
     for key, value in dict_2.items():
         assert dict_1[key] == value
@@ -107,6 +132,84 @@ def test_download_stream(mock_client_download):
     assert b"".join(stream) == TEST_CONTENT
 
 
+def test_download_stream_rate_limited(mocker, mock_client_download):
+    rate_limiter = mocker.Mock()
+
+    stream = transfer.download_stream(
+        mock_client_download,
+        PROJECT_ID,
+        TEST_PATH,
+        chunk_size=500,
+        rate_limiter=rate_limiter,
+    )
+
+    assert b"".join(stream) == TEST_CONTENT
+    assert [call[0][0] for call in rate_limiter.acquire.call_args_list] == [
+        500
+    ] * 4
+
+
+def test_download_many(mocker, requests_mock):
+    contents = {
+        "/path/{}".format(i): TEST_CONTENT[i * 100 : (i + 1) * 100]
+        for i in range(20)
+    }
+    object_client = mocker.Mock()
+    object_client.presign_download.side_effect = (
+        lambda project_id, path: "https://example.com" + path
+    )
+    for path, content in contents.items():
+        requests_mock.get(
+            "https://example.com" + path,
+            content=content,
+            headers={"Content-Length": str(len(content))},
+        )
+
+    downloaded = transfer.download_many(
+        object_client, PROJECT_ID, iter(sorted(contents)), max_workers=4
+    )
+
+    assert dict(downloaded) == contents
+    assert object_client.presign_download.call_count == 20
+
+
+@pytest.mark.parametrize(
+    "headers", [{}, {"Content-Length": "2000", "Content-Encoding": "gzip"}]
+)
+def test_download_many_unknown_size(mocker, requests_mock, headers):
+    object_client = mocker.Mock()
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=TEST_CONTENT, headers=headers)
+    mocker.patch("requests.models.Response.iter_content").return_value = [
+        TEST_CONTENT[:1000],
+        TEST_CONTENT[1000:],
+    ]
+
+    assert list(
+        transfer.download_many(object_client, PROJECT_ID, [TEST_PATH])
+    ) == [(TEST_PATH, TEST_CONTENT)]
+
+
+def test_download_many_truncated(mocker, requests_mock):
+    object_client = mocker.Mock()
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(
+        TEST_URL, content=TEST_CONTENT, headers={"Content-Length": "3000"}
+    )
+
+    with pytest.raises(transfer.DatasetsError, match="ended early"):
+        list(transfer.download_many(object_client, PROJECT_ID, [TEST_PATH]))
+
+
+def test_download_many_missing(mocker, requests_mock):
+    object_client = mocker.Mock()
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, status_code=404)
+
+    with pytest.raises(transfer.DatasetsError, match="No such object"):
+        list(transfer.download_many(object_client, PROJECT_ID, [TEST_PATH]))
+
+
 def test_download_file(mock_client_download, tmpdir):
     destination = tmpdir.join("destination.txt")
 
@@ -152,6 +255,88 @@ def test_chunking_and_labelling_of_greater_sizes(mocker):
     ]
 
 
+@pytest.mark.parametrize("input_chunk_size", [1, 3, 4, 7, 2000])
+def test_rechunking(input_chunk_size):
+    content = [
+        TEST_CONTENT[i : i + input_chunk_size]
+        for i in range(0, len(TEST_CONTENT), input_chunk_size)
+    ]
+    chunks = list(transfer._rechunk_data(content, 300))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert [len(chunk) for chunk in chunks] == [300] * 6 + [200]
+    assert b"".join(chunks) == TEST_CONTENT
+
+
+def test_rechunking_passes_through_chunks_of_target_size():
+    content = [b"1111", b"2222", b"3333"]
+    chunks = list(transfer._rechunk_data(content, 4))
+    assert all(chunk is original for chunk, original in zip(chunks, content))
+
+
+def test_rechunking_slices_memoryviews_without_copying():
+    buffer = bytearray(b"11112222la")
+    chunks = list(transfer._rechunk_data([memoryview(buffer)], 4))
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert [chunk.tobytes() for chunk in chunks] == [b"1111", b"2222", b"la"]
+    buffer[0:1] = b"X"
+    assert chunks[0].tobytes() == b"X111"
+
+
+def _reused_buffer(content, size):
+    buffer = bytearray(size)
+    for i in range(0, len(content), size):
+        piece = content[i : i + size]
+        buffer[: len(piece)] = piece
+        yield memoryview(buffer)[: len(piece)]
+
+
+@pytest.mark.parametrize("input_chunk_size", [3, 4, 7])
+def test_rechunking_copies_reused_buffers(input_chunk_size):
+    content = b"0123456789abcdef"
+    chunks = []
+    for chunk in transfer._rechunk_data(
+        _reused_buffer(content, input_chunk_size), 4, copy_mutable=True
+    ):
+        chunks.append(chunk)
+    assert [bytes(chunk) for chunk in chunks] == [
+        b"0123",
+        b"4567",
+        b"89ab",
+        b"cdef",
+    ]
+
+
+def test_s3_upload_stream_parallel_reused_buffer(
+    mocker, mock_client_upload_s3, requests_mock
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    mock_client_upload_s3.presign_upload_part.side_effect = (
+        lambda project_id, path, upload_id, part_number: (
+            "https://example.com/part-{}".format(part_number)
+        )
+    )
+    requests_mock.put(ANY, headers={"ETag": TEST_ETAG})
+
+    transfer.upload_stream(
+        mock_client_upload_s3,
+        PROJECT_ID,
+        TEST_PATH,
+        _reused_buffer(TEST_CONTENT, 100),
+        max_workers=4,
+    )
+
+    uploaded = {
+        request.url: bytes(request.body)
+        for request in requests_mock.request_history
+    }
+    assert uploaded == {
+        "https://example.com/part-{}".format(i + 1): TEST_CONTENT[
+            i * 100 : (i + 1) * 100
+        ]
+        for i in range(20)
+    }
+
+
 @pytest.mark.parametrize(
     "file_size, expected_chunk_size", [(100, 20), (50, 10), (None, 10)]
 )
@@ -161,7 +346,7 @@ def test_s3_chunk_sizing(
     mocker.patch("faculty.datasets.transfer.S3_MAX_CHUNKS", 5)
     mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 10)
 
-    chunk_size = transfer._chunk_size(
+    chunk_size = transfer.upload_chunk_size(
         mock_presigned_response_s3.provider, file_size
     )
     assert chunk_size == expected_chunk_size
@@ -186,6 +371,44 @@ def test_s3_upload(mock_client_upload_s3, requests_mock):
     )
 
 
+@pytest.fixture
+def bandwidth_limit():
+    throttle.set_bandwidth_limit(10 ** 9)
+    yield throttle.global_limiter()
+    throttle.set_bandwidth_limit(None)
+
+
+def test_s3_upload_rate_limited(
+    mocker, mock_client_upload_s3, requests_mock, bandwidth_limit
+):
+    acquire = mocker.spy(bandwidth_limit, "acquire")
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    mock_client_upload_s3.presign_upload_part.return_value = TEST_URL
+
+    transfer.upload(mock_client_upload_s3, PROJECT_ID, TEST_PATH, TEST_CONTENT)
+
+    body = requests_mock.last_request.body
+    assert isinstance(body, throttle.ThrottledReader)
+    assert body.rate_limiter is bandwidth_limit
+    assert requests_mock.last_request.headers["Content-Length"] == "2000"
+    body.seek(0)
+    assert body.read() == TEST_CONTENT
+    acquire.assert_called_with(len(TEST_CONTENT))
+
+
+def test_upload_invalidates_listings(mock_client_upload_s3, requests_mock):
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    mock_client_upload_s3.presign_upload_part.return_value = TEST_URL
+    cache = listing.listing_cache(mock_client_upload_s3)
+    cache.set(PROJECT_ID, "/path/", [])
+    cache.set(PROJECT_ID, "/other/", [])
+
+    transfer.upload(mock_client_upload_s3, PROJECT_ID, TEST_PATH, TEST_CONTENT)
+
+    assert cache.get(PROJECT_ID, "/path/") is None
+    assert cache.get(PROJECT_ID, "/other/") == []
+
+
 def test_s3_upload_chunks(mocker, mock_client_upload_s3, requests_mock):
     mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
 
@@ -281,6 +504,27 @@ def test_gcs_upload(mock_client_upload_gcs, requests_mock):
     )
 
 
+def test_gcs_upload_rate_limited(
+    mock_client_upload_gcs, requests_mock, bandwidth_limit
+):
+    requests_mock.put(
+        TEST_URL,
+        request_headers={
+            "Content-Length": "2000",
+            "Content-Range": "bytes 0-1999/2000",
+        },
+    )
+
+    transfer.upload(
+        mock_client_upload_gcs, PROJECT_ID, TEST_PATH, TEST_CONTENT
+    )
+
+    body = requests_mock.last_request.body
+    assert isinstance(body, throttle.ThrottledReader)
+    body.seek(0)
+    assert body.read() == TEST_CONTENT
+
+
 def test_gcs_upload_chunking(mocker, mock_client_upload_gcs, requests_mock):
     mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
     chunk_headers = [
@@ -314,3 +558,967 @@ def test_gcs_upload_empty_object(mock_client_upload_gcs, requests_mock):
     transfer.upload(
         mock_client_upload_gcs, PROJECT_ID, TEST_PATH, test_content
     )
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_s3_upload_parallel(
+    mocker, mock_client_upload_s3, requests_mock, max_workers
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    num_parts = len(TEST_CONTENT) // 100
+    urls = [
+        "https://example.com/presigned-url-{}/url".format(i)
+        for i in range(num_parts)
+    ]
+    for i, url in enumerate(urls):
+        requests_mock.put(
+            url, status_code=200, headers={"ETag": "tag-{}".format(i)}
+        )
+    mock_client_upload_s3.presign_upload_part.side_effect = urls
+
+    transfer.upload(
+        mock_client_upload_s3,
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_CONTENT,
+        max_workers=max_workers,
+    )
+
+    uploaded = {
+        request.url: request.text.encode("utf-8")
+        for request in requests_mock.request_history
+    }
+    assert uploaded == {
+        url: TEST_CONTENT[i * 100 : (i + 1) * 100]
+        for i, url in enumerate(urls)
+    }
+    mock_client_upload_s3.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [
+            CompletedUploadPart(i + 1, "tag-{}".format(i))
+            for i in range(num_parts)
+        ],
+    )
+
+
+@pytest.mark.parametrize("range_size", [100, 300, 5000])
+def test_download_file_parallel(mocker, requests_mock, tmpdir, range_size):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", range_size)
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = TEST_ETAG
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+    destination = tmpdir.join("destination.txt")
+
+    transfer.download_file(
+        object_client, PROJECT_ID, TEST_PATH, destination, max_workers=4
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    object_client.get.assert_called_once_with(PROJECT_ID, TEST_PATH)
+    object_client.presign_download.assert_called_once_with(
+        PROJECT_ID, TEST_PATH
+    )
+    expected_ranges = int(math.ceil(len(TEST_CONTENT) / float(range_size)))
+    assert len(requests_mock.request_history) == expected_ranges
+
+
+def test_download_file_parallel_range_not_honoured(
+    mocker, requests_mock, tmpdir
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = TEST_ETAG
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=TEST_CONTENT)
+
+    with pytest.raises(transfer.DatasetsError, match="range"):
+        transfer.download_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            tmpdir.join("destination.txt"),
+            max_workers=4,
+        )
+
+
+def test_download_file_parallel_failure_leaves_no_file(
+    mocker, requests_mock, tmpdir
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = TEST_ETAG
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+    requests_mock.get(
+        TEST_URL, request_headers={"Range": "bytes=100-199"}, status_code=500
+    )
+
+    with pytest.raises(transfer.requests.HTTPError):
+        transfer.download_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            tmpdir.join("destination.txt"),
+            max_workers=4,
+        )
+
+    assert tmpdir.listdir() == []
+
+
+def test_download_stream_chunk_size(mock_client_download):
+    stream = transfer.download_stream(
+        mock_client_download, PROJECT_ID, TEST_PATH, chunk_size=100
+    )
+    chunks = list(stream)
+    assert len(chunks) == 20
+    assert b"".join(chunks) == TEST_CONTENT
+
+
+@pytest.mark.parametrize(
+    "second_etag, raises", [(None, False), ('"corrupted"', True)]
+)
+def test_s3_upload_file_verify(
+    mocker, mock_client_upload_s3, requests_mock, tmpdir, second_etag, raises
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+    etags = [
+        '"{}"'.format(hashlib.md5(TEST_CONTENT[:1000]).hexdigest()),
+        second_etag or hashlib.md5(TEST_CONTENT[1000:]).hexdigest(),
+    ]
+
+    mock_client_upload_s3.presign_upload_part.side_effect = [
+        TEST_URL,
+        OTHER_URL,
+    ]
+    requests_mock.put(TEST_URL, headers={"ETag": etags[0]})
+    requests_mock.put(OTHER_URL, headers={"ETag": etags[1]})
+
+    def upload():
+        transfer.upload_file(
+            mock_client_upload_s3,
+            PROJECT_ID,
+            TEST_PATH,
+            str(source),
+            verify=True,
+        )
+
+    if raises:
+        with pytest.raises(ChecksumMismatch, match="Part 2"):
+            upload()
+        mock_client_upload_s3.complete_multipart_upload.assert_not_called()
+    else:
+        upload()
+        mock_client_upload_s3.complete_multipart_upload.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "content, raises", [(TEST_CONTENT, False), (b"other", True)]
+)
+def test_gcs_upload_file_verify(
+    mock_client_upload_gcs, requests_mock, tmpdir, content, raises
+):
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+    md5 = base64.b64encode(hashlib.md5(content).digest()).decode("ascii")
+    requests_mock.put(
+        TEST_URL,
+        status_code=200,
+        headers={"x-goog-hash": "crc32c=AAAAAA==,md5={}".format(md5)},
+    )
+
+    def upload():
+        transfer.upload_file(
+            mock_client_upload_gcs,
+            PROJECT_ID,
+            TEST_PATH,
+            str(source),
+            verify=True,
+        )
+
+    if raises:
+        with pytest.raises(ChecksumMismatch):
+            upload()
+    else:
+        upload()
+
+
+def _multipart_etag(content, part_size):
+    checksum = MultipartChecksum(part_size)
+    checksum.update(content)
+    return checksum.multipart_etag()
+
+
+@pytest.mark.parametrize(
+    "etag, raises",
+    [
+        (hashlib.md5(TEST_CONTENT).hexdigest(), None),
+        (hashlib.md5(b"other").hexdigest(), ChecksumMismatch),
+        (_multipart_etag(TEST_CONTENT, transfer.DEFAULT_CHUNK_SIZE), None),
+        (
+            _multipart_etag(b"other", transfer.DEFAULT_CHUNK_SIZE),
+            ChecksumMismatch,
+        ),
+        ("multipart-2", DatasetsError),
+    ],
+)
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_download_file_verify(
+    mocker, requests_mock, tmpdir, etag, raises, max_workers
+):
+    object_client = mocker.Mock()
+    # Too small to be worth splitting into ranges
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(
+        TEST_URL, content=TEST_CONTENT, headers={"ETag": '"{}"'.format(etag)}
+    )
+    destination = tmpdir.join("destination.txt")
+
+    def download():
+        transfer.download_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            destination,
+            max_workers=max_workers,
+            verify=True,
+        )
+
+    if raises:
+        with pytest.raises(raises):
+            download()
+    else:
+        download()
+        assert destination.read(mode="rb") == TEST_CONTENT
+
+
+def test_download_file_verify_resumable(mocker, tmpdir):
+    object_client = mocker.Mock()
+    destination = tmpdir.join("destination.txt")
+
+    with pytest.raises(ValueError):
+        transfer.download_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            destination,
+            resume=True,
+            verify=True,
+        )
+
+    object_client.presign_download.assert_not_called()
+    assert not destination.check()
+
+
+def test_download_file_verify_ranged(mocker, tmpdir):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    destination = tmpdir.join("destination.txt")
+
+    with pytest.raises(ValueError):
+        transfer.download_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            destination,
+            max_workers=4,
+            verify=True,
+        )
+
+    object_client.presign_download.assert_not_called()
+    assert not destination.check()
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_s3_upload_file(
+    mocker, mock_client_upload_s3, requests_mock, tmpdir, max_workers
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+
+    mock_client_upload_s3.presign_upload_part.side_effect = [
+        TEST_URL,
+        OTHER_URL,
+    ]
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    requests_mock.put(OTHER_URL, headers={"ETag": OTHER_ETAG})
+
+    transfer.upload_file(
+        mock_client_upload_s3,
+        PROJECT_ID,
+        TEST_PATH,
+        str(source),
+        max_workers=max_workers,
+    )
+
+    history = requests_mock.request_history
+    # Parts are sent as slices of the memory-mapped file
+    assert all(isinstance(request.body, memoryview) for request in history)
+    bodies = {request.url: bytes(request.body) for request in history}
+    assert bodies == {
+        TEST_URL: TEST_CONTENT[:1000],
+        OTHER_URL: TEST_CONTENT[1000:],
+    }
+    mock_client_upload_s3.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [TEST_COMPLETED_PART, OTHER_COMPLETED_PART],
+    )
+
+
+def test_s3_upload_file_unmaps_uploaded_parts(
+    mocker, mock_client_upload_s3, tmpdir
+):
+    window_size = mmap.ALLOCATIONGRANULARITY
+    mocker.patch("faculty.datasets.transfer.FILE_MAP_WINDOW_SIZE", window_size)
+    mocker.patch(
+        "faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", window_size // 2
+    )
+    content = bytes(bytearray(i % 251 for i in range(window_size * 10)))
+    source = tmpdir.join("source.txt")
+    source.write(content, mode="wb")
+
+    mock_client_upload_s3.presign_upload_part.side_effect = (
+        lambda project_id, path, upload_id, part_number: part_number
+    )
+
+    mappings = []
+    map_file = mmap.mmap
+
+    def tracked_mmap(*args, **kwargs):
+        mapping = map_file(*args, **kwargs)
+        mappings.append(weakref.ref(mapping))
+        return mapping
+
+    mocker.patch.object(transfer.mmap, "mmap", tracked_mmap)
+
+    # Record the parts without keeping references to the uploaded slices
+    parts = {}
+    most_mapped = []
+
+    def put(part_number, data):
+        parts[part_number] = bytes(data)
+        most_mapped.append(sum(ref() is not None for ref in mappings))
+        return mocker.Mock(headers={"ETag": TEST_ETAG})
+
+    mocker.patch(
+        "faculty.datasets.transfer.http_session"
+    ).return_value.put = put
+
+    transfer.upload_file(
+        mock_client_upload_s3, PROJECT_ID, TEST_PATH, str(source), 2
+    )
+
+    assert b"".join(parts[n] for n in sorted(parts)) == content
+    assert len(mappings) == 10
+    assert max(most_mapped) <= 2
+    assert all(ref() is None for ref in mappings)
+
+
+def test_gcs_upload_empty_file(mock_client_upload_gcs, requests_mock, tmpdir):
+    source = tmpdir.join("source.txt")
+    source.write(b"", mode="wb")
+
+    requests_mock.put(
+        TEST_URL, request_headers={"Content-Length": "0"}, status_code=200
+    )
+
+    transfer.upload_file(
+        mock_client_upload_gcs, PROJECT_ID, TEST_PATH, str(source)
+    )
+
+    assert len(requests_mock.request_history) == 1
+
+
+@pytest.fixture
+def journal_directory(monkeypatch, tmpdir):
+    cache_home = tmpdir.mkdir("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    yield cache_home.join("faculty", "transfers")
+
+
+@pytest.fixture
+def upload_source(tmpdir):
+    source = tmpdir.join("source.txt")
+    source.write(TEST_CONTENT, mode="wb")
+    yield source
+
+
+def test_s3_upload_file_resume(
+    mocker, requests_mock, journal_directory, upload_source
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3,
+        upload_id=TEST_S3_UPLOAD_ID,
+        url=None,
+    )
+    object_client.presign_upload_parts.side_effect = (
+        _presign_parts_individually(object_client)
+    )
+    object_client.presign_upload_part.side_effect = [
+        TEST_URL,
+        OTHER_URL,
+        OTHER_URL,
+    ]
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    requests_mock.put(OTHER_URL, status_code=500)
+
+    with pytest.raises(transfer.requests.HTTPError):
+        transfer.upload_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            str(upload_source),
+            resume=True,
+        )
+    assert len(journal_directory.listdir()) == 1
+
+    requests_mock.put(OTHER_URL, headers={"ETag": OTHER_ETAG})
+    transfer.upload_file(
+        object_client, PROJECT_ID, TEST_PATH, str(upload_source), resume=True
+    )
+
+    object_client.presign_upload.assert_called_once_with(PROJECT_ID, TEST_PATH)
+    assert [
+        call[0][3] for call in object_client.presign_upload_part.call_args_list
+    ] == [1, 2, 2]
+    last_request = requests_mock.request_history[-1]
+    assert bytes(last_request.body) == TEST_CONTENT[1000:]
+    object_client.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [TEST_COMPLETED_PART, OTHER_COMPLETED_PART],
+    )
+    assert journal_directory.listdir() == []
+
+
+def test_s3_upload_file_resume_expired_upload(
+    mocker, requests_mock, journal_directory, upload_source
+):
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3,
+        upload_id=TEST_S3_UPLOAD_ID,
+        url=None,
+    )
+    object_client.presign_upload_parts.side_effect = (
+        _presign_parts_individually(object_client)
+    )
+    journal = UploadJournal.for_file(PROJECT_ID, TEST_PATH, str(upload_source))
+    journal.start(CloudStorageProvider.S3, "expired-upload", None, 1000)
+    object_client.presign_upload_part.side_effect = [
+        OTHER_URL,
+        OTHER_URL,
+        TEST_URL,
+    ]
+    requests_mock.put(OTHER_URL, status_code=404)
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+
+    transfer.upload_file(
+        object_client, PROJECT_ID, TEST_PATH, str(upload_source), resume=True
+    )
+
+    object_client.presign_upload.assert_called_once_with(PROJECT_ID, TEST_PATH)
+    object_client.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID, TEST_PATH, TEST_S3_UPLOAD_ID, [TEST_COMPLETED_PART]
+    )
+    assert journal_directory.listdir() == []
+
+
+def test_gcs_upload_file_resume(
+    mocker, requests_mock, journal_directory, upload_source
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 1000)
+    object_client = mocker.Mock()
+    journal = UploadJournal.for_file(PROJECT_ID, TEST_PATH, str(upload_source))
+    journal.start(CloudStorageProvider.GCS, None, TEST_URL, 1000)
+    journal.record_offset(1000)
+
+    requests_mock.put(
+        TEST_URL,
+        request_headers={"Content-Range": "bytes */2000"},
+        status_code=308,
+        headers={"Range": "bytes=0-999"},
+    )
+    requests_mock.put(
+        TEST_URL,
+        request_headers={"Content-Range": "bytes 1000-1999/2000"},
+        status_code=200,
+    )
+
+    transfer.upload_file(
+        object_client, PROJECT_ID, TEST_PATH, str(upload_source), resume=True
+    )
+
+    object_client.presign_upload.assert_not_called()
+    history = requests_mock.request_history
+    assert len(history) == 2
+    assert bytes(history[1].body) == TEST_CONTENT[1000:]
+    assert journal_directory.listdir() == []
+
+
+def test_gcs_upload_file_resume_already_complete(
+    mocker, requests_mock, journal_directory, upload_source
+):
+    object_client = mocker.Mock()
+    journal = UploadJournal.for_file(PROJECT_ID, TEST_PATH, str(upload_source))
+    journal.start(CloudStorageProvider.GCS, None, TEST_URL, 1000)
+    requests_mock.put(TEST_URL, status_code=200)
+
+    transfer.upload_file(
+        object_client, PROJECT_ID, TEST_PATH, str(upload_source), resume=True
+    )
+
+    assert len(requests_mock.request_history) == 1
+    assert journal_directory.listdir() == []
+
+
+@pytest.fixture
+def mock_client_resumable_download(mocker, requests_mock):
+    object_client = mocker.Mock()
+    object_client.get.return_value = mocker.Mock(
+        size=len(TEST_CONTENT), etag=TEST_ETAG
+    )
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+    yield object_client
+
+
+def test_download_file_resume(
+    mock_client_resumable_download, requests_mock, journal_directory, tmpdir
+):
+    destination = tmpdir.join("destination.txt")
+    destination.write(TEST_CONTENT[:1000], mode="wb")
+    journal = DownloadJournal.for_file(PROJECT_ID, TEST_PATH, destination)
+    journal.start(TEST_ETAG, len(TEST_CONTENT), None)
+
+    transfer.download_file(
+        mock_client_resumable_download,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        resume=True,
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    (request,) = requests_mock.request_history
+    assert request.headers["Range"] == "bytes=1000-"
+    assert journal_directory.listdir() == []
+
+
+def test_download_file_resume_changed_object(
+    mock_client_resumable_download, requests_mock, journal_directory, tmpdir
+):
+    destination = tmpdir.join("destination.txt")
+    destination.write(b"x" * 1000, mode="wb")
+    journal = DownloadJournal.for_file(PROJECT_ID, TEST_PATH, destination)
+    journal.start(OTHER_ETAG, len(TEST_CONTENT), None)
+
+    transfer.download_file(
+        mock_client_resumable_download,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        resume=True,
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    (request,) = requests_mock.request_history
+    assert "Range" not in request.headers
+    assert journal_directory.listdir() == []
+
+
+def test_download_file_resume_object_replaced(
+    mocker,
+    mock_client_resumable_download,
+    requests_mock,
+    journal_directory,
+    tmpdir,
+):
+    mock_client_resumable_download.get.side_effect = [
+        mocker.Mock(size=len(TEST_CONTENT), etag=TEST_ETAG),
+        mocker.Mock(size=len(TEST_CONTENT), etag=OTHER_ETAG),
+    ]
+    requests_mock.get(
+        TEST_URL, request_headers={"If-Match": TEST_ETAG}, status_code=412
+    )
+    requests_mock.get(
+        TEST_URL,
+        request_headers={"If-Match": OTHER_ETAG},
+        content=range_response(TEST_CONTENT),
+    )
+    destination = tmpdir.join("destination.txt")
+    destination.write(b"x" * 1000, mode="wb")
+    journal = DownloadJournal.for_file(PROJECT_ID, TEST_PATH, destination)
+    journal.start(TEST_ETAG, len(TEST_CONTENT), None)
+
+    transfer.download_file(
+        mock_client_resumable_download,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        resume=True,
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    resumed, restarted = requests_mock.request_history
+    assert resumed.headers["Range"] == "bytes=1000-"
+    assert "Range" not in restarted.headers
+    assert journal_directory.listdir() == []
+
+
+def test_download_file_parallel_object_changed(mocker, requests_mock, tmpdir):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 1000)
+    object_client = mocker.Mock()
+    object_client.get.return_value = mocker.Mock(
+        size=len(TEST_CONTENT), etag=TEST_ETAG
+    )
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(
+        TEST_URL,
+        status_code=206,
+        headers={"Content-Range": "bytes 0-999/5000"},
+        content=TEST_CONTENT[:1000],
+    )
+    destination = tmpdir.join("destination.txt")
+
+    with pytest.raises(transfer.DatasetsError, match="changed"):
+        transfer.download_file(
+            object_client, PROJECT_ID, TEST_PATH, destination, max_workers=2
+        )
+
+    assert not destination.exists()
+    assert all(
+        request.headers["If-Match"] == TEST_ETAG
+        for request in requests_mock.request_history
+    )
+
+
+def test_download_file_resume_parallel(
+    mocker,
+    mock_client_resumable_download,
+    requests_mock,
+    journal_directory,
+    tmpdir,
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 500)
+    destination = tmpdir.join("destination.txt")
+    destination.write(
+        TEST_CONTENT[:500] + b"x" * 1000 + TEST_CONTENT[1500:], mode="wb"
+    )
+    journal = DownloadJournal.for_file(PROJECT_ID, TEST_PATH, destination)
+    journal.start(TEST_ETAG, len(TEST_CONTENT), 500)
+    journal.record_range(0)
+    journal.record_range(1500)
+
+    transfer.download_file(
+        mock_client_resumable_download,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        max_workers=2,
+        resume=True,
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    requested = sorted(
+        request.headers["Range"] for request in requests_mock.request_history
+    )
+    assert requested == ["bytes=1000-1499", "bytes=500-999"]
+    assert journal_directory.listdir() == []
+
+
+@pytest.mark.parametrize(
+    "upload_function, content, expected_batches",
+    [
+        (transfer.upload, TEST_CONTENT, [[1, 2, 3], [4, 5, 6], [7]]),
+        (
+            transfer.upload_stream,
+            [TEST_CONTENT],
+            [[1], [2, 3], [4, 5, 6], [7, 8, 9]],
+        ),
+    ],
+    ids=["known size", "unknown size"],
+)
+def test_s3_upload_presigns_parts_in_batches(
+    mocker, requests_mock, upload_function, content, expected_batches
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 300)
+    mocker.patch("faculty.datasets.transfer.PRESIGN_BATCH_SIZE", 3)
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3, upload_id=TEST_S3_UPLOAD_ID
+    )
+    object_client.presign_upload_parts.side_effect = (
+        lambda project_id, path, upload_id, part_numbers: [
+            "https://example.com/part-{}".format(n) for n in part_numbers
+        ]
+    )
+    requests_mock.put(ANY, headers={"ETag": TEST_ETAG})
+
+    upload_function(object_client, PROJECT_ID, TEST_PATH, content)
+
+    batches = [
+        call[0][3]
+        for call in object_client.presign_upload_parts.call_args_list
+    ]
+    assert batches == expected_batches
+    assert [request.url for request in requests_mock.request_history] == [
+        "https://example.com/part-{}".format(n) for n in range(1, 8)
+    ]
+
+
+def test_s3_upload_stream_small_presigns_one_part(mocker, requests_mock):
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3, upload_id=TEST_S3_UPLOAD_ID
+    )
+    object_client.presign_upload_parts.return_value = [TEST_URL]
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+
+    transfer.upload_stream(object_client, PROJECT_ID, TEST_PATH, [b"abc"])
+
+    object_client.presign_upload_parts.assert_called_once_with(
+        PROJECT_ID, TEST_PATH, TEST_S3_UPLOAD_ID, [1]
+    )
+
+
+class _ScriptedChunkSize(ChunkSizePolicy):
+    def __init__(self, sizes):
+        self.sizes = iter(sizes)
+        self.limits = []
+        self.recorded = []
+
+    def chunk_size(self, minimum, maximum):
+        self.limits.append((minimum, maximum))
+        return next(self.sizes)
+
+    def record(self, num_bytes, seconds):
+        self.recorded.append(num_bytes)
+
+
+def test_rechunking_variable_sizes():
+    sizes = iter([3, 5, 2, 100])
+    content = [TEST_CONTENT[:4], TEST_CONTENT[4:20]]
+    chunks = list(transfer._rechunk_data(content, lambda: next(sizes)))
+    assert chunks == [
+        TEST_CONTENT[:3],
+        TEST_CONTENT[3:8],
+        TEST_CONTENT[8:10],
+        TEST_CONTENT[10:20],
+    ]
+
+
+@pytest.mark.parametrize(
+    "provider, known_file_size, offset, part_number, expected",
+    [
+        (CloudStorageProvider.S3, 2000, 0, 1, (200, 5000)),
+        (CloudStorageProvider.S3, 2000, 0, 9, (1000, 5000)),
+        (CloudStorageProvider.S3, 2000, 1900, 10, (100, 5000)),
+        (CloudStorageProvider.S3, None, 0, 1, (100, 5000)),
+        (CloudStorageProvider.S3, None, 0, 2, (200, 5000)),
+        (CloudStorageProvider.S3, None, 0, 4, (800, 5000)),
+        (CloudStorageProvider.GCS, 2000, 0, 9, (50, 5000)),
+    ],
+)
+def test_part_size_limits(
+    mocker, provider, known_file_size, offset, part_number, expected
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    mocker.patch("faculty.datasets.transfer.MAX_CHUNK_SIZE", 5000)
+    mocker.patch("faculty.datasets.transfer.GCS_CHUNK_MULTIPLE", 50)
+    mocker.patch("faculty.datasets.transfer.S3_MAX_CHUNKS", 10)
+
+    limits = transfer._part_size_limits(
+        provider, known_file_size, offset, part_number
+    )
+
+    assert limits == expected
+
+
+def test_s3_upload_chunk_policy(mocker, mock_client_upload_s3, requests_mock):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    mock_client_upload_s3.presign_upload_part.return_value = TEST_URL
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    policy = _ScriptedChunkSize([300, 50, 600, 2000])
+
+    transfer.upload(
+        mock_client_upload_s3,
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_CONTENT,
+        chunk_policy=policy,
+    )
+
+    bodies = [bytes(r.body) for r in requests_mock.request_history]
+    assert bodies == [
+        TEST_CONTENT[:300],
+        TEST_CONTENT[300:400],
+        TEST_CONTENT[400:1000],
+        TEST_CONTENT[1000:],
+    ]
+    assert policy.recorded == [300, 100, 600, 1000]
+    mock_client_upload_s3.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [CompletedUploadPart(i, TEST_ETAG) for i in range(1, 5)],
+    )
+
+
+def test_gcs_upload_chunk_policy(
+    mocker, mock_client_upload_gcs, requests_mock
+):
+    mocker.patch("faculty.datasets.transfer.GCS_CHUNK_MULTIPLE", 100)
+    requests_mock.put(TEST_URL, status_code=200)
+    policy = _ScriptedChunkSize([250, 1000, 1000])
+
+    transfer.upload(
+        mock_client_upload_gcs,
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_CONTENT,
+        chunk_policy=policy,
+    )
+
+    ranges = [
+        r.headers["Content-Range"] for r in requests_mock.request_history
+    ]
+    assert ranges == [
+        "bytes 0-199/*",
+        "bytes 200-1199/*",
+        "bytes 1200-1999/2000",
+    ]
+    assert policy.recorded == [200, 1000, 800]
+
+
+def test_s3_upload_file_resume_chunk_policy(
+    mocker, requests_mock, journal_directory, upload_source
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_CHUNK_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.presign_upload.return_value = mocker.Mock(
+        provider=CloudStorageProvider.S3,
+        upload_id=TEST_S3_UPLOAD_ID,
+        url=None,
+    )
+    object_client.presign_upload_parts.side_effect = (
+        _presign_parts_individually(object_client)
+    )
+    object_client.presign_upload_part.side_effect = (
+        lambda project_id, path, upload_id, part_number: (
+            TEST_URL if part_number == 1 else OTHER_URL
+        )
+    )
+    requests_mock.put(TEST_URL, headers={"ETag": TEST_ETAG})
+    requests_mock.put(OTHER_URL, status_code=500)
+
+    with pytest.raises(transfer.requests.HTTPError):
+        transfer.upload_file(
+            object_client,
+            PROJECT_ID,
+            TEST_PATH,
+            str(upload_source),
+            resume=True,
+            chunk_policy=FixedChunkSize(700),
+        )
+
+    requests_mock.put(OTHER_URL, headers={"ETag": OTHER_ETAG})
+    transfer.upload_file(
+        object_client,
+        PROJECT_ID,
+        TEST_PATH,
+        str(upload_source),
+        resume=True,
+        chunk_policy=FixedChunkSize(1300),
+    )
+
+    assert len(requests_mock.request_history) == 3
+    last_request = requests_mock.request_history[-1]
+    assert last_request.url == OTHER_URL
+    assert bytes(last_request.body) == TEST_CONTENT[700:]
+    object_client.complete_multipart_upload.assert_called_once_with(
+        PROJECT_ID,
+        TEST_PATH,
+        TEST_S3_UPLOAD_ID,
+        [TEST_COMPLETED_PART, OTHER_COMPLETED_PART],
+    )
+    assert journal_directory.listdir() == []
+
+
+def test_download_file_parallel_chunk_policy(mocker, requests_mock, tmpdir):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 100)
+    mocker.patch("faculty.datasets.transfer.MIN_RANGE_SIZE", 100)
+    object_client = mocker.Mock()
+    object_client.get.return_value.size = len(TEST_CONTENT)
+    object_client.get.return_value.etag = TEST_ETAG
+    object_client.presign_download.return_value = TEST_URL
+    requests_mock.get(TEST_URL, content=range_response(TEST_CONTENT))
+    destination = tmpdir.join("destination.txt")
+    policy = _ScriptedChunkSize([200, 10, 800, 5000])
+
+    transfer.download_file(
+        object_client,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        max_workers=2,
+        chunk_policy=policy,
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    assert sorted(
+        r.headers["Range"] for r in requests_mock.request_history
+    ) == sorted(
+        ["bytes=0-199", "bytes=200-299", "bytes=300-1099", "bytes=1100-1999"]
+    )
+    assert policy.limits[-1] == (100, 900)
+    assert sorted(policy.recorded) == [100, 200, 800, 900]
+
+
+def test_download_file_resume_parallel_chunk_policy(
+    mocker,
+    mock_client_resumable_download,
+    requests_mock,
+    journal_directory,
+    tmpdir,
+):
+    mocker.patch("faculty.datasets.transfer.DEFAULT_RANGE_SIZE", 500)
+    mocker.patch("faculty.datasets.transfer.MIN_RANGE_SIZE", 100)
+    destination = tmpdir.join("destination.txt")
+    destination.write(TEST_CONTENT[:700] + b"x" * 1300, mode="wb")
+    journal = DownloadJournal.for_file(PROJECT_ID, TEST_PATH, destination)
+    journal.start(TEST_ETAG, len(TEST_CONTENT), 0)
+    journal.record_range(0, 299)
+    journal.record_range(300, 699)
+
+    transfer.download_file(
+        mock_client_resumable_download,
+        PROJECT_ID,
+        TEST_PATH,
+        destination,
+        max_workers=2,
+        resume=True,
+        chunk_policy=FixedChunkSize(1000),
+    )
+
+    assert destination.read(mode="rb") == TEST_CONTENT
+    requested = sorted(
+        request.headers["Range"] for request in requests_mock.request_history
+    )
+    assert requested == ["bytes=1700-1999", "bytes=700-1699"]
+    assert journal_directory.listdir() == []
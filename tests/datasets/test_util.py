@@ -0,0 +1,97 @@
+# Copyright 2018-2021 Faculty Science Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import pytest
+
+from faculty.datasets.util import (
+    Rechunker,
+    bounded_map,
+    cache_directory,
+    makedirs,
+    replace,
+)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_bounded_map_preserves_order(max_workers):
+    results = bounded_map(lambda x: x * 2, range(10), max_workers)
+    assert list(results) == [x * 2 for x in range(10)]
+
+
+def test_bounded_map_limits_items_in_memory():
+    drawn = []
+
+    def items():
+        for i in range(20):
+            drawn.append(i)
+            yield i
+
+    for consumed, result in enumerate(bounded_map(str, items(), 3)):
+        assert result == str(consumed)
+        assert len(drawn) - consumed <= 3
+
+
+def test_bounded_map_propagates_errors():
+    def function(item):
+        if item == 2:
+            raise ValueError("failed")
+        return item
+
+    with pytest.raises(ValueError, match="failed"):
+        list(bounded_map(function, range(10), 3))
+
+
+def test_cache_directory(monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", "/xdg/cache")
+    assert cache_directory("sync") == os.path.join(
+        "/xdg/cache", "faculty", "sync"
+    )
+
+
+def test_makedirs(tmpdir):
+    path = str(tmpdir.join("a", "b"))
+    makedirs(path)
+    makedirs(path)
+    assert os.path.isdir(path)
+
+
+def test_makedirs_file_in_the_way(tmpdir):
+    tmpdir.join("a").write("")
+    with pytest.raises(OSError):
+        makedirs(str(tmpdir.join("a")))
+
+
+def test_replace(tmpdir):
+    tmpdir.join("source").write("new")
+    tmpdir.join("destination").write("old")
+    replace(str(tmpdir.join("source")), str(tmpdir.join("destination")))
+    assert tmpdir.join("destination").read() == "new"
+    assert not tmpdir.join("source").exists()
+
+
+def test_rechunker():
+    rechunker = Rechunker(4)
+    chunks = []
+    for original_chunk in [b"012", b"3456789", b"ab"]:
+        chunks.extend(rechunker.feed(original_chunk))
+    chunks.extend(rechunker.finish())
+    assert [bytes(chunk) for chunk in chunks] == [b"0123", b"4567", b"89ab"]
+
+
+def test_rechunker_empty():
+    rechunker = Rechunker(4)
+    assert list(rechunker.finish()) == [b""]